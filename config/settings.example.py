@@ -28,10 +28,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'listings.middleware.ServerTimingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'listings.middleware.ProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -58,8 +60,28 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Сколько секунд ждать блокировку на запись (брони создаются по очереди)
+        'OPTIONS': {
+            'timeout': 20,
+        },
+        # Тестовая БД в файле: в общей памяти SQLite параллельные транзакции получают
+        # "database table is locked" вместо ожидания блокировки
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+    }
+}
+
+# Кэш ответов API объектов (listings.cache). Для нескольких процессов (gunicorn, uwsgi)
+# нужен общий бэкенд с атомарным incr, например redis:
+# 'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+# 'LOCATION': 'redis://127.0.0.1:6379',
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'housing',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
     }
 }
+LISTINGS_CACHE_TIMEOUT = 300
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -101,3 +123,39 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Настройки приложения listings (закомментированы значения по умолчанию)
+# Кэш ответов API (listings.cache): алиас в CACHES, выключатель и счетчики попаданий
+# в самом кэше (лишний incr на каждый запрос, нужны только бенчмарку)
+# LISTINGS_CACHE_ALIAS = 'default'
+# LISTINGS_CACHE_ENABLED = True
+# LISTINGS_CACHE_STATS = False
+# Горизонт битовых карт календаря, дней от текущей даты (730 дней ~ 92 байта на объект)
+# LISTINGS_CALENDAR_HORIZON_DAYS = 730
+# Бэкенд полнотекстового поиска объектов (по умолчанию FTS5 на SQLite, icontains на других БД)
+# LISTINGS_SEARCH_BACKEND = 'listings.search.IContainsBackend'
+# sync_ical: сколько календарей загружается одновременно и таймаут одного запроса (с)
+# LISTINGS_ICAL_WORKERS = 8
+# LISTINGS_ICAL_TIMEOUT = 15
+# Замеры запросов (listings.middleware): заголовок Server-Timing (по умолчанию при DEBUG),
+# доля запросов, замеры которых пишутся в лог listings.timing, и сколько самых медленных
+# SQL запросов включать в запись лога
+# LISTINGS_SERVER_TIMING = True
+# LISTINGS_TIMING_SAMPLE_RATE = 0.01
+# LISTINGS_TIMING_SLOWEST = 3
+# Метрики Prometheus на /admin/metrics/ (listings.metrics): сбор выключен по умолчанию
+# (замеры SQL добавляют ~0.2 мс на запрос); при нескольких процессах (gunicorn/uwsgi) -
+# общий каталог для их файлов (очищать при перезапуске) и токен сборщика
+# (Authorization: Bearer <токен>), сотрудникам хватает сессии
+# LISTINGS_METRICS_ENABLED = False
+# LISTINGS_METRICS_DIR = '/run/listings-metrics'
+# LISTINGS_METRICS_TOKEN = 'секрет'
+# Профилирование отдельных запросов (listings.middleware.ProfilerMiddleware): каталог
+# профилей (без него выключено), сколько файлов хранить, срок токена X-Profile (с)
+# и интервал снимков стека режима sampling (с)
+# LISTINGS_PROFILE_DIR = BASE_DIR / 'profiles'
+# LISTINGS_PROFILE_KEEP = 50
+# LISTINGS_PROFILE_TOKEN_AGE = 3600
+# LISTINGS_PROFILE_INTERVAL = 0.001
+# Цены ночей (ListingNightlyRate, команда rebuild_nightly_rates): горизонт, дней от текущей даты
+# (365 дней ~ 365 строк на объект)
+# LISTINGS_NIGHTLY_RATES_HORIZON_DAYS = 365
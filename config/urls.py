@@ -19,8 +19,10 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from listings.views import metrics
 
 urlpatterns = [
+    path('admin/metrics/', metrics, name='metrics'),
     path('admin/', admin.site.urls),
     path('', include('housing.urls')),
     path('listings/', include('listings.urls')),
@@ -1,6 +1,14 @@
 # listings/admin.py
 from django.contrib import admin
-from .models import Listing
+from .models import ICalSync, Listing, ListingPhoto
+
+
+class ListingPhotoInline(admin.TabularInline):
+    model = ListingPhoto
+    extra = 0
+    fields = ('image', 'position', 'width', 'height', 'content_hash')
+    readonly_fields = ('width', 'height', 'content_hash')
+
 
 @admin.register(Listing)
 class ListingAdmin(admin.ModelAdmin):
@@ -11,6 +19,7 @@ class ListingAdmin(admin.ModelAdmin):
     search_fields = ('title', 'description', 'address', 'city')
     list_per_page = 50
     readonly_fields = ('list_date', 'updated_at', 'verification_date')
+    inlines = [ListingPhotoInline]
     
     fieldsets = (
         ('Основная информация', {
@@ -39,3 +48,12 @@ class ListingAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         qs = super().get_queryset(request)
         return qs
+
+
+@admin.register(ICalSync)
+class ICalSyncAdmin(admin.ModelAdmin):
+    list_display = ('id', 'listing', 'url', 'is_active', 'sync_frequency', 'last_sync', 'next_sync')
+    list_filter = ('is_active',)
+    search_fields = ('url', 'listing__title')
+    raw_id_fields = ('listing',)
+    readonly_fields = ('last_sync', 'next_sync', 'etag', 'last_modified', 'content_hash', 'last_error')
@@ -4,12 +4,18 @@ URL маршруты для API
 """
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .api_views import ListingViewSet
+from .api_views import BookingViewSet, ListingViewSet
 
 router = DefaultRouter()
 router.register(r'listings', ListingViewSet, basename='listing')
+router.register(r'bookings', BookingViewSet, basename='booking')
 
 urlpatterns = [
+    path(
+        'listings/<int:pk>/calendar.ics',
+        ListingViewSet.as_view({'get': 'calendar_feed'}),
+        name='listing-calendar-feed',
+    ),
     path('', include(router.urls)),
 ]
 
@@ -1,25 +1,40 @@
 # listings/api_views.py
-# Временная упрощенная версия - только ListingViewSet
-from rest_framework import viewsets, status, filters
+from rest_framework import mixins, viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.db.models import Q
-from datetime import date
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from datetime import date, timedelta
 
-from .models import Listing
+from .cache import cached_response, response_cache
+from .filters import ListingOrderingFilter, ListingSearchFilter
+from .models import Booking, Listing
+from .pagination import KeysetPagination
 from .serializers import (
-    ListingSerializer, ListingListSerializer, SearchSerializer
+    ListingSerializer, ListingListSerializer, SearchSerializer, QuoteSerializer,
+    BookingSerializer, BookingCreateSerializer, Row
 )
-from .services import AvailabilityService
+from .services import (
+    AvailabilityService, BookingConflict, BookingService, CalendarIndexService, GeoService, IdempotencyKeyReused,
+    NightlyRateService, PricingService,
+)
+
+# Самый длинный период календаря (/calendar/) и период по умолчанию, дней
+CALENDAR_MAX_DAYS = 186
+CALENDAR_DEFAULT_DAYS = 90
 
 
 class ListingViewSet(viewsets.ModelViewSet):
     queryset = Listing.objects.filter(is_published=True)
     permission_classes = [AllowAny]
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = KeysetPagination
+    filter_backends = [ListingSearchFilter, ListingOrderingFilter]
     search_fields = ['title', 'description', 'address', 'city']
-    ordering_fields = ['list_date', 'base_price', 'is_verified']
+    ordering_fields = ['list_date', 'base_price', 'is_verified', 'rating_avg', 'rating_count', 'distance']
     ordering = ['-is_verified', '-list_date']
 
     def get_serializer_class(self):
@@ -35,53 +50,70 @@ class ListingViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         queryset = super().get_queryset()
         
-        city = self.request.query_params.get('city', None)
-        if city:
-            queryset = queryset.filter(city__icontains=city)
-        
-        property_type = self.request.query_params.get('property_type', None)
-        if property_type:
-            queryset = queryset.filter(property_type=property_type)
-        
-        max_price = self.request.query_params.get('max_price', None)
-        if max_price:
-            queryset = queryset.filter(base_price__lte=max_price)
-        
-        min_bedrooms = self.request.query_params.get('min_bedrooms', None)
-        if min_bedrooms:
-            queryset = queryset.filter(bedrooms__gte=min_bedrooms)
-        
-        min_guests = self.request.query_params.get('min_guests', None)
-        if min_guests:
-            queryset = queryset.filter(max_guests__gte=min_guests)
+        params = self.request.query_params
+        queryset = AvailabilityService.apply_filters(
+            queryset,
+            city=params.get('city'),
+            max_price=params.get('max_price'),
+            property_type=params.get('property_type'),
+            min_bedrooms=params.get('min_bedrooms'),
+            min_guests=params.get('min_guests'),
+        )
         
-        check_in = self.request.query_params.get('check_in', None)
-        check_out = self.request.query_params.get('check_out', None)
-        if check_in and check_out:
+        check_in = params.get('check_in')
+        check_out = params.get('check_out')
+        # Для карточки и action availability даты - параметры ответа, а не фильтр:
+        # занятый объект должен отдавать available=false, а не 404
+        if check_in and check_out and self.action == 'list':
             try:
                 check_in_date = date.fromisoformat(check_in)
                 check_out_date = date.fromisoformat(check_out)
-                
-                from decimal import Decimal
-                listings_list = AvailabilityService.get_available_listings(
-                    check_in_date, check_out_date,
-                    city=city,
-                    max_price=Decimal(max_price) if max_price else None,
-                    property_type=property_type,
-                    min_bedrooms=int(min_bedrooms) if min_bedrooms else None,
-                    min_guests=int(min_guests) if min_guests else None
-                )
-                listing_ids = [l.id for l in listings_list]
-                queryset = Listing.objects.filter(id__in=listing_ids, is_published=True)
             except ValueError:
-                pass
-        
+                raise ValidationError({'error': 'Неверный формат даты. Используйте YYYY-MM-DD'})
+            if check_out_date <= check_in_date:
+                raise ValidationError({'error': 'Дата выезда должна быть позже даты заезда'})
+            queryset = AvailabilityService.filter_available(queryset, check_in_date, check_out_date)
+
+        return self.apply_geo_filters(queryset, params)
+
+    def apply_geo_filters(self, queryset, params):
+        """?bbox=min_lng,min_lat,max_lng,max_lat и ?lat=&lng=[&radius_km=]"""
+        try:
+            if params.get('bbox'):
+                queryset = GeoService.filter_bbox(queryset, *GeoService.parse_bbox(params['bbox']))
+            if params.get('lat') and params.get('lng'):
+                lat, lng = GeoService.parse_point(params['lat'], params['lng'])
+                radius_km = params.get('radius_km')
+                if radius_km:
+                    queryset = GeoService.filter_radius(queryset, lat, lng, GeoService.parse_radius(radius_km))
+                else:
+                    queryset = GeoService.annotate_distance(queryset, lat, lng)
+        except ValueError as e:
+            raise ValidationError({'error': f'Неверные гео-параметры: {e}'})
         return queryset
 
+    @cached_response()
+    def list(self, request, *args, **kwargs):
+        # Строки .values() и быстрая сериализация вместо экземпляров Listing
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = ListingListSerializer.fast_values(queryset, extra=KeysetPagination.fields)
+        page = self.paginate_queryset(rows)
+        data = ListingListSerializer.fast_serialize(
+            page if page is not None else rows, context=self.get_serializer_context(),
+        )
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    @cached_response()
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
     @action(detail=True, methods=['get'])
+    @cached_response(uses_calendar=True)
     def availability(self, request, pk=None):
         listing = self.get_object()
         check_in = request.query_params.get('check_in')
@@ -98,7 +130,7 @@ class ListingViewSet(viewsets.ModelViewSet):
             check_out_date = date.fromisoformat(check_out)
             
             is_available = AvailabilityService.is_available(listing, check_in_date, check_out_date)
-            total_price = listing.calculate_total_price(check_in_date, check_out_date) if is_available else None
+            total_price = PricingService.calculate_total_price(listing, check_in_date, check_out_date) if is_available else None
             
             return Response({
                 'available': is_available,
@@ -111,7 +143,70 @@ class ListingViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+    @action(detail=True, methods=['get'])
+    def calendar(self, request, pk=None):
+        """
+        Цены и свободные ночи по дням для виджета бронирования
+        (/api/listings/{id}/calendar/?from=YYYY-MM-DD&to=YYYY-MM-DD, обе даты включительно).
+        Месяцы считаются одним запросом броней и одним запросом календаря и кэшируются по отдельности.
+        """
+        try:
+            start = date.fromisoformat(request.query_params['from']) if 'from' in request.query_params else date.today()
+            end = (
+                date.fromisoformat(request.query_params['to']) if 'to' in request.query_params
+                else start + timedelta(days=CALENDAR_DEFAULT_DAYS - 1)
+            )
+        except ValueError:
+            return Response(
+                {'error': 'Неверный формат даты. Используйте YYYY-MM-DD'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if end < start or (end - start).days >= CALENDAR_MAX_DAYS:
+            return Response(
+                {'error': f'Период должен быть от 1 до {CALENDAR_MAX_DAYS} дней'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        listing = self.get_object()
+        months, hit = response_cache.calendar_months(
+            listing.pk, AvailabilityService.month_starts(start, end),
+            lambda months: AvailabilityService.month_calendar(listing, months),
+        )
+        first, last = start.isoformat(), end.isoformat()
+        days = [day for month in sorted(months) for day in months[month] if first <= day['date'] <= last]
+        response = Response({
+            'from': first,
+            'to': last,
+            'min_nights': listing.min_nights,
+            'max_nights': listing.max_nights,
+            'days': days,
+        })
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return response
+
+    def calendar_feed(self, request, pk=None):
+        """
+        iCal календарь занятых ночей объекта для Airbnb/Booking и менеджеров каналов
+        (/api/listings/{id}/calendar.ics). Каналы опрашивают его часто, поэтому тело
+        кэшируется до изменения броней или дат объекта, а повторный запрос с
+        If-None-Match/If-Modified-Since получает 304 без обращения к БД.
+        """
+        host = request.get_host()
+
+        def build():
+            return CalendarIndexService.ical_feed(self.get_object(), host.split(':')[0])
+
+        (body, etag, last_modified), hit = response_cache.calendar_feed(pk, host, build)
+        response = HttpResponse(body, content_type='text/calendar; charset=utf-8')
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        # Кэши каналов обязаны перепроверять календарь при каждом опросе
+        response['Cache-Control'] = 'no-cache'
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return get_conditional_response(request, etag=etag, last_modified=last_modified, response=response)
+
     @action(detail=False, methods=['post'])
+    @cached_response(uses_calendar=True)
     def search(self, request):
         serializer = SearchSerializer(data=request.data)
         if not serializer.is_valid():
@@ -128,6 +223,103 @@ class ListingViewSet(viewsets.ModelViewSet):
             min_guests=data.get('min_guests')
         )
         
-        serializer_response = ListingListSerializer(listings, many=True, context={'request': request})
-        return Response(serializer_response.data)
+        listings = [Row(row) for row in ListingListSerializer.fast_values(
+            listings, extra=('weekend_price', 'weekly_discount', 'monthly_discount'),
+        )]
+        # Цены ночей из ListingNightlyRate; объекты без посчитанных ночей (за горизонтом или
+        # до rebuild_nightly_rates) - PricingService, с теми же особыми ценами дат
+        quotes = NightlyRateService.quote_totals([row['id'] for row in listings], data['check_in'], data['check_out'])
+        missing = [row for row in listings if row['id'] not in quotes]
+        if missing:
+            quotes.update(PricingService.quote_many(missing, data['check_in'], data['check_out']))
+        results = ListingListSerializer.fast_serialize(listings, context={'request': request})
+        for item in results:
+            item['total_price'] = float(quotes[item['id']])
+        return Response(results)
+
+
+    @action(detail=False, methods=['post'])
+    def quote(self, request):
+        """Стоимость и доступность набора объектов на одни даты (по ids или по фильтрам поиска)."""
+        serializer = QuoteSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        data = serializer.validated_data
+        check_in, check_out = data['check_in'], data['check_out']
+
+        queryset = Listing.objects.filter(is_published=True)
+        if data.get('ids'):
+            queryset = queryset.filter(id__in=data['ids'])
+        else:
+            queryset = AvailabilityService.apply_filters(
+                queryset,
+                city=data.get('city'),
+                max_price=data.get('max_price'),
+                property_type=data.get('property_type'),
+                min_bedrooms=data.get('min_bedrooms'),
+                min_guests=data.get('min_guests'),
+            )
+        queryset = PricingService.annotate_quotes(queryset, check_in, check_out)
+        queryset = AvailabilityService.annotate_availability(queryset, check_in, check_out)
+        queryset = queryset.order_by('-is_verified', '-list_date').values(
+            'id', 'is_verified', 'list_date', 'quote_total', 'quote_available',
+        )
 
+        nights = (check_out - check_in).days
+        page = self.paginate_queryset(queryset)
+        results = [
+            {
+                'id': row['id'],
+                'available': row['quote_available'],
+                'total_price': float(row['quote_total']) if row['quote_available'] else None,
+                'nights': nights,
+            }
+            for row in (page if page is not None else queryset)
+        ]
+        if page is not None:
+            return self.get_paginated_response(results)
+        return Response(results)
+
+
+class BookingViewSet(mixins.CreateModelMixin, mixins.ListModelMixin,
+                     mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    serializer_class = BookingSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return Booking.objects.filter(guest=self.request.user).select_related('listing', 'guest')
+
+    def create(self, request, *args, **kwargs):
+        serializer = BookingCreateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if idempotency_key and len(idempotency_key) > 64:
+            return Response({'error': 'Idempotency-Key длиннее 64 символов'}, status=status.HTTP_400_BAD_REQUEST)
+
+        data = serializer.validated_data
+        try:
+            booking, created = BookingService.create_booking(
+                listing_id=data['listing_id'],
+                guest=request.user,
+                check_in=data['check_in'],
+                check_out=data['check_out'],
+                guests_count=data['guests_count'],
+                special_requests=data['special_requests'],
+                idempotency_key=idempotency_key,
+            )
+        except Listing.DoesNotExist:
+            return Response({'error': 'Объект не найден'}, status=status.HTTP_404_NOT_FOUND)
+        except BookingConflict as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        except IdempotencyKeyReused as e:
+            return Response({'error': str(e)}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(
+            BookingSerializer(booking, context={'request': request}).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
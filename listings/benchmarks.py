@@ -0,0 +1,1682 @@
+# listings/benchmarks.py
+"""
+Сценарии замеров производительности для команды `python manage.py benchmark`.
+
+Каждый сценарий регистрируется декоратором @scenario и получает команду
+(для вывода), размер набора данных и количество повторов.
+"""
+import math
+import os
+import random
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from .models import Availability, Booking, Listing, ListingNightlyRate
+from .services import (
+    AvailabilityService, BookingConflict, BookingService, CalendarIndexService, GeoService, NightlyRateService,
+    PricingService,
+)
+
+SCENARIOS = {}
+# Хост запросов тестового клиента и фабрики запросов: стандартный 'testserver' не входит
+# в ALLOWED_HOSTS, и такие запросы завершаются DisallowedHost
+HTTP_HOST = 'localhost'
+
+
+def scenario(name, default_size):
+    """Регистрирует сценарий замера под указанным именем."""
+    def decorator(func):
+        func.default_size = default_size
+        SCENARIOS[name] = func
+        return func
+    return decorator
+
+
+def best_of(func, repeat):
+    """Лучшее время выполнения func из repeat запусков (в секундах) и ее результат."""
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def report(command, label, seconds, operations=None):
+    """Печатает строку результата замера."""
+    line = f'  {label:<40} {seconds * 1000:>10.2f} мс'
+    if operations:
+        line += f'  ({operations / seconds:,.0f} оп/с)'
+    command.stdout.write(line)
+
+
+class _Rollback(Exception):
+    pass
+
+
+@contextmanager
+def rolled_back():
+    """Выполняет блок в транзакции, которая откатывается в конце: тестовые данные не остаются в БД."""
+    try:
+        with transaction.atomic():
+            yield
+            raise _Rollback
+    except _Rollback:
+        pass
+
+
+@contextmanager
+def measured(command, label):
+    """Замеряет время, количество SQL запросов и пик памяти блока."""
+    tracemalloc.start()
+    started = time.perf_counter()
+    with CaptureQueriesContext(connection) as queries:
+        yield
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    command.stdout.write(
+        f'  {label:<40} {elapsed * 1000:>10.2f} мс  запросов: {len(queries)}  пик памяти: {peak / 1024:,.0f} КБ'
+    )
+
+
+@contextmanager
+def counted_queries():
+    """Считает SQL запросы блока: список, длина которого - число запросов.
+
+    В отличие от CaptureQueriesContext учитывает все запросы тестового клиента
+    (сигнал request_started очищает журнал запросов соединения).
+    """
+    executed = []
+
+    def wrapper(execute, sql, params, many, context):
+        executed.append(sql)
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(wrapper):
+        yield executed
+
+
+CITIES = ['Алматы', 'Астана', 'Шымкент', 'Караганда', 'Актау']
+CITY_CENTERS = {
+    'Алматы': (43.2380, 76.9450),
+    'Астана': (51.1280, 71.4300),
+    'Шымкент': (42.3170, 69.5900),
+    'Караганда': (49.8060, 73.0850),
+    'Актау': (43.6500, 51.1600),
+}
+
+
+def seed_listings(count, seed=0):
+    """Создает count опубликованных объектов через bulk_create."""
+    rng = random.Random(seed)
+    owner, _ = User.objects.get_or_create(username='benchmark_owner')
+    listings = [
+        Listing(
+            owner=owner,
+            title=f'Объект {i}',
+            description='',
+            address=f'ул. Тестовая, {i}',
+            city=rng.choice(CITIES),
+            bedrooms=rng.randint(1, 5),
+            sqft=rng.randint(20, 200),
+            max_guests=rng.randint(1, 10),
+            base_price=Decimal(rng.randint(5000, 50000)),
+            weekend_price=Decimal(rng.randint(5000, 60000)),
+            weekly_discount=rng.choice([0, 5, 10]),
+            monthly_discount=rng.choice([0, 15, 25]),
+            min_nights=rng.choice([1, 1, 2, 3]),
+            max_nights=rng.choice([30, 90, 365]),
+            house_rules='',
+            moderation_notes='',
+            is_verified=rng.random() < 0.3,
+            is_published=True,
+        )
+        for i in range(count)
+    ]
+    # Координаты разбрасываются в радиусе ~15 км от центра города
+    for listing in listings:
+        lat, lng = CITY_CENTERS[listing.city]
+        listing.latitude = Decimal(f'{lat + rng.uniform(-0.135, 0.135):.6f}')
+        listing.longitude = Decimal(f'{lng + rng.uniform(-0.18, 0.18):.6f}')
+    return Listing.objects.bulk_create(listings, batch_size=1000)
+
+
+def seed_bookings(listings, count, seed=0):
+    """Создает count бронирований и закрытых дат, равномерно распределенных по объектам."""
+    rng = random.Random(seed)
+    guest, _ = User.objects.get_or_create(username='benchmark_guest')
+    today = date.today()
+    bookings = []
+    blocked = set()
+    for _ in range(count):
+        listing = rng.choice(listings)
+        check_in = today + timedelta(days=rng.randint(-180, 540))
+        nights = rng.randint(1, 14)
+        bookings.append(Booking(
+            listing=listing,
+            guest=guest,
+            check_in=check_in,
+            check_out=check_in + timedelta(days=nights),
+            guests_count=1,
+            total_price=listing.base_price * nights,
+            status=rng.choice(['pending', 'confirmed', 'confirmed', 'cancelled', 'completed']),
+        ))
+        if rng.random() < 0.2:
+            blocked.add((listing.pk, today + timedelta(days=rng.randint(0, 365))))
+    Booking.objects.bulk_create(bookings, batch_size=2000)
+    Availability.objects.bulk_create(
+        [Availability(listing_id=pk, date=day, is_available=False) for pk, day in blocked], batch_size=2000,
+    )
+    return len(bookings), len(blocked)
+
+
+def legacy_total_price(listing, check_in, check_out):
+    """Прежний расчет стоимости: перебор ночей по одной."""
+    total = Decimal('0.00')
+    current_date = check_in
+    nights = 0
+    while current_date < check_out:
+        total += listing.get_price_for_date(current_date)
+        current_date += timedelta(days=1)
+        nights += 1
+    if nights >= 30 and listing.monthly_discount:
+        total -= total * Decimal(str(listing.monthly_discount)) / 100
+    elif nights >= 7 and listing.weekly_discount:
+        total -= total * Decimal(str(listing.weekly_discount)) / 100
+    return total
+
+
+@scenario('pricing', default_size=200)
+def bench_pricing(command, size, repeat):
+    """Цикл по ночам против закрытой формулы PricingService."""
+    listings = [
+        Listing(
+            id=i + 1,
+            base_price=Decimal(f'{10000 + i * 37}.{i % 100:02d}'),
+            weekend_price=Decimal(f'{12500 + i * 41}.50') if i % 3 else None,
+            weekly_discount=i % 15,
+            monthly_discount=i % 30,
+        )
+        for i in range(size)
+    ]
+    check_in = date.today() + timedelta(days=3)
+    stays = [1, 7, 30, 365]
+    # Объекты не сохранены и особых цен дат не имеют: сравнивается только формула
+    overrides = {}
+
+    for nights in stays:
+        check_out = check_in + timedelta(days=nights)
+        for listing in listings:
+            # Итог PricingService округлен до копеек
+            expected = legacy_total_price(listing, check_in, check_out).quantize(Decimal('0.01'), ROUND_HALF_UP)
+            actual = PricingService.calculate_total_price(listing, check_in, check_out, overrides)
+            if expected != actual:
+                raise AssertionError(f'Расхождение для {listing.id}, {nights} ночей: {expected} != {actual}')
+
+        legacy, _ = best_of(lambda: [legacy_total_price(l, check_in, check_out) for l in listings], repeat)
+        single, _ = best_of(
+            lambda: [PricingService.calculate_total_price(l, check_in, check_out, overrides) for l in listings], repeat
+        )
+        batch, _ = best_of(lambda: PricingService.quote_many(listings, check_in, check_out), repeat)
+
+        command.stdout.write(f'\n{nights} ночей × {size} объектов:')
+        report(command, 'цикл по ночам', legacy, size)
+        report(command, 'PricingService.calculate_total_price', single, size)
+        report(command, 'PricingService.quote_many', batch, size)
+        command.stdout.write(f'  ускорение: ×{legacy / batch:.1f}')
+
+
+@scenario('search', default_size=20000)
+def bench_search(command, size, repeat):
+    """Поиск по датам: список + повторный запрос id__in против одного ленивого queryset."""
+    check_in = date.today() + timedelta(days=10)
+    check_out = check_in + timedelta(days=4)
+
+    with rolled_back():
+        seed_listings(size)
+        base = Listing.objects.filter(is_published=True)
+
+        for _ in range(repeat):
+            command.stdout.write('')
+            with measured(command, 'список + id__in (прежний вариант)'):
+                listing_ids = [l.id for l in list(AvailabilityService.get_available_listings(check_in, check_out))]
+                legacy = Listing.objects.filter(id__in=listing_ids, is_published=True)
+                legacy.count()
+                list(legacy.order_by('-is_verified', '-list_date')[:20])
+
+            with measured(command, 'ленивый queryset'):
+                lazy = AvailabilityService.filter_available(base, check_in, check_out)
+                lazy.count()
+                list(lazy.order_by('-is_verified', '-list_date')[:20])
+
+
+@scenario('availability', default_size=100000)
+def bench_availability(command, size, repeat):
+    """Поиск свободных объектов через NOT EXISTS по бронированиям и календарю."""
+    check_in = date.today() + timedelta(days=30)
+    check_out = check_in + timedelta(days=5)
+
+    with rolled_back():
+        listings = seed_listings(max(size // 20, 100))
+        bookings, blocked = seed_bookings(listings, size)
+        command.stdout.write(f'Объектов: {len(listings)}, бронирований: {bookings}, закрытых дат: {blocked}')
+
+        queryset = AvailabilityService.filter_available(
+            Listing.objects.filter(is_published=True), check_in, check_out,
+        ).order_by('-is_verified', '-list_date')
+
+        command.stdout.write('\nПлан запроса:')
+        for line in queryset.explain().splitlines():
+            command.stdout.write(f'  {line}')
+        command.stdout.write('')
+
+        for _ in range(repeat):
+            with measured(command, 'count + первая страница'):
+                total = queryset.count()
+                list(queryset[:20])
+        command.stdout.write(f'  свободно: {total} из {len(listings)}')
+
+        sample = listings[:200]
+        elapsed, _ = best_of(
+            lambda: [AvailabilityService.is_available(l, check_in, check_out) for l in sample], repeat,
+        )
+        report(command, 'is_available (на объект)', elapsed / len(sample))
+
+
+@scenario('bitmap', default_size=100000)
+def bench_bitmap(command, size, repeat):
+    """Битовые карты календаря против EXISTS по броням и закрытым датам."""
+    with rolled_back():
+        listings = seed_listings(max(size // 20, 100))
+        seed_bookings(listings, size)
+        ids = [listing.pk for listing in listings]
+
+        elapsed, _ = best_of(lambda: [CalendarIndexService.refresh(ids[i:i + 500]) for i in range(0, len(ids), 500)], 1)
+        report(command, f'построение {len(ids)} карт', elapsed, len(ids))
+
+        base = Listing.objects.filter(pk__in=ids, min_nights__lte=1)
+        for offset, nights in [(1, 3), (30, 5), (200, 14)]:
+            check_in = date.today() + timedelta(days=offset)
+            check_out = check_in + timedelta(days=nights)
+            candidates = list(base.filter(max_nights__gte=nights).values_list('pk', flat=True))
+
+            def with_sql():
+                return set(AvailabilityService.filter_available(
+                    Listing.objects.filter(pk__in=candidates), check_in, check_out,
+                ).values_list('pk', flat=True))
+
+            def with_bitmaps():
+                free = set()
+                for i in range(0, len(candidates), 500):
+                    free |= CalendarIndexService.split_free(candidates[i:i + 500], check_in, check_out)[0]
+                return free
+
+            sql, sql_ids = best_of(with_sql, repeat)
+            bitmap, bitmap_ids = best_of(with_bitmaps, repeat)
+            if sql_ids != bitmap_ids:
+                raise AssertionError(f'Расхождение результатов: {len(sql_ids ^ bitmap_ids)} объектов')
+
+            command.stdout.write(f'\n{check_in} - {check_out} (кандидатов: {len(candidates)}, свободно: {len(sql_ids)}):')
+            report(command, 'пачка: NOT EXISTS', sql)
+            report(command, 'пачка: битовые карты', bitmap)
+
+            sample = listings[:200]
+            single_sql, _ = best_of(lambda: [
+                not AvailabilityService.overlapping_bookings(check_in, check_out).filter(listing=l).exists()
+                and not AvailabilityService.blocked_dates(check_in, check_out).filter(listing=l).exists()
+                for l in sample
+            ], repeat)
+            single_bitmap, _ = best_of(
+                lambda: [CalendarIndexService.is_free(l.pk, check_in, check_out) for l in sample], repeat,
+            )
+            report(command, 'один объект: два EXISTS', single_sql / len(sample))
+            report(command, 'один объект: битовая карта', single_bitmap / len(sample))
+
+
+@scenario('booking', default_size=300)
+def bench_booking(command, size, repeat):
+    """Пропускная способность создания броней из параллельных потоков (гонки проверяют тесты)."""
+    guest = User.objects.create(username=f'benchmark_guest_{uuid.uuid4().hex[:8]}')
+    listing = seed_listings(1)[0]
+    Listing.objects.filter(pk=listing.pk).update(booking_type='instant', min_nights=1, max_nights=365, max_guests=10)
+    workers = 32
+
+    def attempt(check_in):
+        try:
+            BookingService.create_booking(listing.pk, guest, check_in, check_in + timedelta(days=1), 1)
+            return 'created'
+        except BookingConflict:
+            return 'conflict'
+        except OperationalError:
+            return 'locked'
+        finally:
+            connection.close()
+
+    try:
+        start = date.today() + timedelta(days=100)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = Counter(pool.map(lambda i: attempt(start + timedelta(days=i * 2)), range(size)))
+        elapsed = time.perf_counter() - started
+        command.stdout.write(f'\n{size} броней на разные даты ({workers} потоков): {dict(results)}')
+        report(command, 'создание броней', elapsed, results['created'])
+    finally:
+        Listing.objects.filter(pk=listing.pk).delete()
+        guest.delete()
+
+
+@scenario('geo', default_size=100000)
+def bench_geo(command, size, repeat):
+    """Поиск по карте: bbox по индексу (latitude, longitude) против полного прохода в Python."""
+    with rolled_back():
+        listings = seed_listings(size)
+        base = Listing.objects.filter(pk__gte=listings[0].pk, pk__lte=listings[-1].pk)
+        lat, lng = CITY_CENTERS['Алматы']
+        viewport = (lng - 0.03, lat - 0.02, lng + 0.03, lat + 0.02)
+
+        if connection.vendor == 'sqlite':
+            sql, params = GeoService.filter_bbox(Listing.objects.all(), *viewport).query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                command.stdout.write('План bbox: ' + '; '.join(row[-1] for row in cursor.fetchall()))
+
+        def python_scan(radius_km):
+            rows = base.values_list('pk', 'latitude', 'longitude')
+            return {
+                pk for pk, la, ln in rows
+                if _haversine(lat, lng, float(la), float(ln)) <= radius_km
+            }
+
+        for radius_km in (1, 3, 10):
+            def with_index():
+                return list(GeoService.filter_radius(base, lat, lng, radius_km).order_by('distance').values_list('pk', 'distance'))
+
+            indexed, rows = best_of(with_index, repeat)
+            scan, expected = best_of(lambda: python_scan(radius_km), 1)
+            found = {pk for pk, _ in rows}
+            if found != expected:
+                raise AssertionError(f'Расхождение результатов: {len(found ^ expected)} объектов')
+            if any(a[1] > b[1] for a, b in zip(rows, rows[1:])):
+                raise AssertionError('Результаты не отсортированы по расстоянию')
+
+            command.stdout.write(f'\nРадиус {radius_km} км (найдено: {len(found)}):')
+            report(command, 'bbox + гаверсинус в БД', indexed)
+            report(command, 'полный проход в Python', scan)
+
+        command.stdout.write('\nОкно карты ~5x4 км:')
+        with measured(command, 'bbox, первые 100 объектов'):
+            page = list(GeoService.filter_bbox(base, *viewport)[:100])
+        command.stdout.write(f'  объектов на странице: {len(page)}')
+
+
+def _haversine(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * GeoService.EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+WORDS = [
+    'уютная', 'квартира', 'студия', 'вид', 'горы', 'парк', 'метро', 'балкон', 'ремонт', 'тихий',
+    'двор', 'парковка', 'wifi', 'кондиционер', 'семейный', 'отдых', 'рядом', 'кафе', 'бассейн', 'терраса',
+]
+
+
+@scenario('fulltext', default_size=50000)
+def bench_fulltext(command, size, repeat):
+    """Поиск по тексту: индекс FTS5 против LIKE '%term%' по четырем полям."""
+    from .search import IContainsBackend, get_backend
+
+    backend = get_backend()
+    if type(backend) is IContainsBackend:
+        command.stdout.write('Полнотекстовый индекс недоступен для этой БД')
+        return
+
+    rng = random.Random(1)
+    with rolled_back():
+        listings = seed_listings(size)
+        for listing in listings:
+            listing.title = ' '.join(rng.sample(WORDS, 3))
+            listing.description = ' '.join(rng.choice(WORDS) for _ in range(8))
+        elapsed, _ = best_of(lambda: Listing.objects.bulk_update(listings, ['title', 'description'], batch_size=1000), 1)
+        report(command, f'bulk_update + индексация {size} объектов', elapsed, size)
+        elapsed, _ = best_of(lambda: backend.index([listing.pk for listing in listings]), 1)
+        report(command, f'только индексация {size} объектов', elapsed, size)
+
+        base = Listing.objects.filter(pk__gte=listings[0].pk, pk__lte=listings[-1].pk)
+        like = IContainsBackend()
+        for query in ['бассейн', 'вид горы', 'терраса кондиционер парк', 'бассейн терраса балкон тихий']:
+            def with_like():
+                return set(like.search(base, query).values_list('pk', flat=True))
+
+            def with_index():
+                return set(backend.search(base, query).values_list('pk', flat=True))
+
+            like_time, like_ids = best_of(with_like, repeat)
+            index_time, index_ids = best_of(with_index, repeat)
+            if like_ids != index_ids:
+                raise AssertionError(f'Расхождение результатов: {len(like_ids ^ index_ids)} объектов')
+
+            ranked_time, _ = best_of(
+                lambda: list(backend.search(base, query).order_by('search_rank').values_list('pk', flat=True)[:20]),
+                repeat,
+            )
+            command.stdout.write(f'\n"{query}" (найдено: {len(index_ids)}):')
+            report(command, 'LIKE по полям', like_time)
+            report(command, 'FTS5', index_time)
+            report(command, 'FTS5, топ-20 по релевантности', ranked_time)
+
+
+@scenario('pagination', default_size=110000)
+def bench_pagination(command, size, repeat):
+    """Номер страницы (COUNT + OFFSET) против keyset-курсора на первой и глубокой странице."""
+    from rest_framework.pagination import PageNumberPagination
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+    from .pagination import KeysetPagination, RowCompare
+
+    factory = APIRequestFactory(HTTP_HOST=HTTP_HOST)
+    page_size = KeysetPagination.page_size
+    deep_page = min(5000, size // page_size)
+
+    with rolled_back():
+        seed_listings(size)
+        queryset = Listing.objects.filter(is_published=True).order_by('-is_verified', '-list_date')
+
+        def by_number(page):
+            paginator = PageNumberPagination()
+            rows = paginator.paginate_queryset(queryset, Request(factory.get('/', {'page': page})))
+            return paginator, rows
+
+        def by_cursor(cursor):
+            paginator = KeysetPagination()
+            rows = paginator.paginate_queryset(queryset, Request(factory.get('/', {'cursor': cursor} if cursor else {})))
+            return paginator, rows
+
+        # Курсор, указывающий на последнюю строку перед глубокой страницей
+        anchor = queryset.order_by('-is_verified', '-list_date', '-id')[(deep_page - 1) * page_size - 1]
+        paginator = KeysetPagination()
+        paginator.request = Request(factory.get('/'))
+        deep_cursor = paginator.encode_cursor(paginator.position(anchor), reverse=False).split('cursor=')[1]
+
+        for label, page, cursor in [('страница 1', 1, None), (f'страница {deep_page}', deep_page, deep_cursor)]:
+            number_time, (_, number_rows) = best_of(lambda: by_number(page), repeat)
+            cursor_time, (_, cursor_rows) = best_of(lambda: by_cursor(cursor), repeat)
+            if [row.pk for row in number_rows] != [row.pk for row in cursor_rows]:
+                raise AssertionError(f'{label}: страницы не совпадают')
+            command.stdout.write(f'\n{label}:')
+            report(command, 'PageNumberPagination (COUNT + OFFSET)', number_time)
+            report(command, 'KeysetPagination', cursor_time)
+
+        # Проход вперед и назад по курсорам возвращает те же страницы
+        paginator, first = by_cursor(None)
+        next_cursor = paginator.get_next_link().split('cursor=')[1]
+        paginator, second = by_cursor(next_cursor)
+        previous_cursor = paginator.get_previous_link().split('cursor=')[1]
+        _, back = by_cursor(previous_cursor)
+        if [row.pk for row in back] != [row.pk for row in first]:
+            raise AssertionError('Переход назад вернул другую страницу')
+        command.stdout.write('\n  переходы вперед/назад по курсорам: ok')
+
+        if connection.vendor == 'sqlite':
+            sql, params = queryset.filter(
+                RowCompare(KeysetPagination().fields, '<', paginator.position(anchor)),
+            ).order_by(*KeysetPagination.ordering)[:page_size].query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                command.stdout.write('  план: ' + '; '.join(row[-1] for row in cursor.fetchall()))
+
+
+@scenario('cache', default_size=5000)
+def bench_cache(command, size, repeat):
+    """Кэш ответов API: холодный и теплый запрос, сброс версий при изменениях."""
+    from django.core.cache import caches
+    from django.test.utils import override_settings
+    from rest_framework.test import APIClient
+    from .cache import response_cache
+
+    backends = {
+        'locmem': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark'},
+        'file': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                 'LOCATION': f'/tmp/listings-benchmark-cache-{uuid.uuid4().hex}'},
+    }
+    check_in = date.today() + timedelta(days=30)
+    search_body = {'check_in': str(check_in), 'check_out': str(check_in + timedelta(days=5)), 'city': 'Алматы'}
+
+    # Инвалидация срабатывает после коммита, поэтому данные создаются вне rolled_back()
+    listings = seed_listings(size)
+    base = Listing.objects.filter(pk__gte=listings[0].pk, pk__lte=listings[-1].pk)
+    target = listings[-1]
+    try:
+        for name, backend in backends.items():
+            with override_settings(CACHES={'default': backend}, LISTINGS_CACHE_STATS=True):
+                caches['default'].clear()
+                response_cache.reset_stats()
+                client = APIClient(HTTP_HOST=HTTP_HOST)
+                requests = [
+                    ('список', lambda: client.get('/api/listings/', {'city': 'Алматы'})),
+                    ('список с датами', lambda: client.get('/api/listings/', {
+                        'check_in': search_body['check_in'], 'check_out': search_body['check_out']})),
+                    ('объект', lambda: client.get(f'/api/listings/{target.pk}/')),
+                    ('доступность', lambda: client.get(f'/api/listings/{target.pk}/availability/', {
+                        'check_in': search_body['check_in'], 'check_out': search_body['check_out']})),
+                    ('search', lambda: client.post('/api/listings/search/', search_body, format='json')),
+                ]
+                command.stdout.write(f'\nБэкенд {name}:')
+                for label, request in requests:
+                    cold, response = best_of(request, 1)
+                    if response['X-Cache'] != 'MISS':
+                        raise AssertionError(f'{label}: первый запрос не должен попадать в кэш')
+                    warm, response = best_of(request, repeat)
+                    if response['X-Cache'] != 'HIT':
+                        raise AssertionError(f'{label}: повторный запрос не попал в кэш')
+                    report(command, f'{label}: без кэша', cold)
+                    report(command, f'{label}: из кэша', warm)
+
+                # Сохранение объекта сбрасывает его карточку и списки, но не другие объекты
+                other = client.get(f'/api/listings/{listings[0].pk}/')
+                target.title = f'Обновлено {uuid.uuid4().hex[:6]}'
+                target.save()
+                response = client.get(f'/api/listings/{target.pk}/')
+                if response['X-Cache'] != 'MISS' or response.data['title'] != target.title:
+                    raise AssertionError('Карточка не обновилась после save()')
+                if client.get(f'/api/listings/{listings[0].pk}/')['X-Cache'] != other['X-Cache'].replace('MISS', 'HIT'):
+                    raise AssertionError('save() одного объекта сбросил карточку другого')
+
+                # Массовый update() (как fix_listings --publish-all) сбрасывает списки
+                client.get('/api/listings/', {'city': 'Алматы'})
+                base.filter(pk=target.pk).update(base_price=Decimal('12345.00'))
+                if client.get('/api/listings/', {'city': 'Алматы'})['X-Cache'] != 'MISS':
+                    raise AssertionError('Список не сбросился после update()')
+
+                # Новая бронь сбрасывает ответы, зависящие от календаря
+                availability = requests[3][1]
+                availability()
+                guest, _ = User.objects.get_or_create(username='benchmark_guest')
+                booking = Booking.objects.create(
+                    listing=target, guest=guest, check_in=check_in, check_out=check_in + timedelta(days=5),
+                    guests_count=1, total_price=Decimal('1.00'), status='confirmed',
+                )
+                response = availability()
+                booking.delete()
+                if response['X-Cache'] != 'MISS' or response.data['available']:
+                    raise AssertionError('Доступность не обновилась после брони')
+
+                stats = response_cache.stats()
+                command.stdout.write(
+                    f'  попаданий: {stats["hit"]}, промахов: {stats["miss"]} ({stats["hit_ratio"]:.0%}), инвалидация: ok'
+                )
+                caches['default'].clear()
+    finally:
+        base.delete()
+
+
+@scenario('ratings', default_size=50000)
+def bench_ratings(command, size, repeat):
+    """Рейтинги: агрегат на каждую строку списка против полей на объекте."""
+    from django.db.models import Avg, Count, OuterRef, Subquery
+    from .models import Review
+    from .serializers import ListingListSerializer
+    from .services import RatingService
+
+    rng = random.Random(2)
+    with rolled_back():
+        listings = seed_listings(max(size // 10, 100))
+        seed_bookings(listings, size)
+        base = Listing.objects.filter(pk__gte=listings[0].pk, pk__lte=listings[-1].pk, is_published=True)
+        bookings = list(
+            Booking.objects.filter(listing_id__gte=listings[0].pk, listing_id__lte=listings[-1].pk)
+            .values_list('pk', 'listing_id', 'guest_id')
+        )
+
+        def make_review(booking_id, listing_id, guest_id):
+            subrating = lambda: rng.choice([None, 2, 3, 4, 5, 5])
+            return Review(
+                booking_id=booking_id, listing_id=listing_id, reviewer_id=guest_id,
+                rating=rng.choice([1, 2, 3, 4, 4, 5, 5, 5]),
+                cleanliness_rating=subrating(), communication_rating=subrating(),
+                location_rating=subrating(), value_rating=subrating(),
+            )
+
+        # Поштучное сохранение: агрегаты обновляются в транзакции отзыва
+        single = [make_review(*row) for row in bookings[:500]]
+        elapsed, _ = best_of(lambda: [review.save() for review in single], 1)
+        report(command, f'Review.save() x{len(single)}', elapsed, len(single))
+        for review in single[:100]:
+            review.delete()
+
+        # Остальные отзывы загружаются пачкой в обход save(), затем пересчет командой
+        Review.objects.bulk_create([make_review(*row) for row in bookings[500:]], batch_size=2000)
+        ids = [listing.pk for listing in listings]
+        elapsed, _ = best_of(lambda: [RatingService.recompute(ids[i:i + 500]) for i in range(0, len(ids), 500)], 1)
+        report(command, f'recompute_ratings: {len(ids)} объектов', elapsed, len(ids))
+
+        # Поштучные изменения поверх пересчета должны совпадать с подсчетом с нуля
+        for row in bookings[:100]:
+            make_review(*row).save()
+        expected = RatingService.aggregate(ids)
+        stored = {
+            row['pk']: row
+            for row in Listing.objects.filter(pk__in=ids).values('pk', *RatingService.AGGREGATE_FIELDS)
+        }
+        mismatched = [pk for pk, values in expected.items() if any(stored[pk][f] != v for f, v in values.items())]
+        if mismatched:
+            raise AssertionError(f'Агрегаты расходятся с пересчетом: {len(mismatched)} объектов')
+        command.stdout.write(f'  агрегаты совпадают с подсчетом с нуля ({Review.objects.filter(listing_id__in=ids).count()} отзывов)')
+
+        def naive_page():
+            page = list(base.order_by('-is_verified', '-list_date')[:20])
+            for listing in page:
+                stats = listing.reviews.aggregate(avg=Avg('rating'), count=Count('id'))
+                listing.naive = (stats['avg'], stats['count'])
+            return page
+
+        def denormalized_page():
+            return ListingListSerializer(base.order_by('-is_verified', '-list_date')[:20], many=True).data
+
+        command.stdout.write('\nСтраница списка (20 объектов):')
+        with measured(command, 'агрегат на каждую строку'):
+            naive_page()
+        with measured(command, 'поля rating_* на объекте'):
+            denormalized_page()
+
+        command.stdout.write('\nТоп-20 по рейтингу:')
+        reviews_avg = Review.objects.filter(listing=OuterRef('pk')).order_by().values('listing').annotate(avg=Avg('rating')).values('avg')
+        subquery_time, by_subquery = best_of(
+            lambda: list(base.annotate(avg=Subquery(reviews_avg)).order_by('-avg', '-pk').values_list('pk', flat=True)[:20]),
+            repeat,
+        )
+        field_time, by_field = best_of(
+            lambda: list(base.order_by('-rating_avg', '-rating_count').values_list('pk', flat=True)[:20]),
+            repeat,
+        )
+        report(command, 'сортировка по подзапросу AVG', subquery_time)
+        report(command, 'сортировка по rating_avg (индекс)', field_time)
+
+        if connection.vendor == 'sqlite':
+            sql, params = Listing.objects.filter(is_published=True).order_by('-rating_avg', '-rating_count')[:20].query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                command.stdout.write('  план: ' + '; '.join(row[-1] for row in cursor.fetchall()))
+
+
+@scenario('serialize', default_size=5000)
+def bench_serialize(command, size, repeat):
+    """Сериализация списка: экземпляры + DRF to_representation против строк .values()."""
+    from rest_framework.renderers import JSONRenderer
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+    from .serializers import ListingListSerializer
+
+    rng = random.Random(3)
+    request = Request(APIRequestFactory(HTTP_HOST=HTTP_HOST).get('/api/listings/'))
+    context = {'request': request}
+    renderer = JSONRenderer()
+
+    with rolled_back():
+        listings = seed_listings(size)
+        for listing in listings:
+            if rng.random() < 0.7:
+                listing.photo_main = f'photos/2024/05/{rng.randint(1, 28):02d}/фото {listing.pk}.jpg'
+            listing.rating_avg = Decimal(rng.randint(100, 500)) / 100 if rng.random() < 0.6 else None
+            listing.beds = rng.choice([1, 2, 3])
+            listing.bathrooms = rng.choice([Decimal('1.0'), Decimal('1.5'), Decimal('2.0')])
+        Listing.objects.bulk_update(listings, ['photo_main', 'rating_avg', 'beds', 'bathrooms'], batch_size=500)
+        base = Listing.objects.filter(pk__gte=listings[0].pk, pk__lte=listings[-1].pk).order_by('-is_verified', '-list_date', '-id')
+        lat, lng = CITY_CENTERS['Алматы']
+
+        def standard(queryset):
+            return ListingListSerializer(list(queryset.all()), many=True, context=context).data
+
+        def fast(queryset):
+            return ListingListSerializer.fast_serialize(ListingListSerializer.fast_values(queryset), context=context)
+
+        # Побайтовое совпадение JSON на всем наборе, в том числе с аннотацией distance
+        for label, queryset in [('все объекты', base), ('с distance', GeoService.annotate_distance(base, lat, lng))]:
+            if renderer.render(standard(queryset)) != renderer.render(fast(queryset)):
+                raise AssertionError(f'JSON расходится: {label}')
+        command.stdout.write(f'  JSON совпадает для {size} объектов (с distance и без)')
+
+        for page_size in (20, 100):
+            page = base[:page_size]
+            standard_time, _ = best_of(lambda: standard(page), repeat)
+            fast_time, _ = best_of(lambda: fast(page), repeat)
+            command.stdout.write(f'\nСтраница {page_size} объектов:')
+            report(command, 'ListingListSerializer', standard_time)
+            report(command, 'fast_values + fast_serialize', fast_time)
+
+        command.stdout.write(f'\nВесь набор ({size}):')
+        standard_time, _ = best_of(lambda: standard(base), 1)
+        fast_time, _ = best_of(lambda: fast(base), 1)
+        report(command, 'ListingListSerializer', standard_time, size)
+        report(command, 'fast_values + fast_serialize', fast_time, size)
+
+
+
+@scenario('export', default_size=50000)
+def bench_export(command, size, repeat):
+    """export_listing --all: скорость и пик памяти на 1/10 каталога и на всем каталоге."""
+    import gzip
+    import io
+    import os
+    import tempfile
+    from django.core.management import call_command
+
+    def export(label, output, expected):
+        def run():
+            call_command('export_listing', all=True, include_owner=True, output=output, stdout=io.StringIO())
+
+        elapsed, _ = best_of(run, 1)
+        # Пик памяти - отдельным запуском: tracemalloc в разы замедляет выгрузку
+        tracemalloc.start()
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        opener = gzip.open if output.endswith('.gz') else open
+        with opener(output, 'rt', encoding='utf-8') as f:
+            lines = sum(1 for _ in f)
+        if lines != expected:
+            raise AssertionError(f'{label}: строк {lines}, ожидалось {expected}')
+        command.stdout.write(
+            f'  {label:<24} {elapsed:>6.2f} с  {expected / elapsed:>8,.0f} строк/с  '
+            f'пик памяти: {peak / 1024:>7,.0f} КБ  файл: {os.path.getsize(output) / 2**20:>6.1f} МБ'
+        )
+
+    with rolled_back(), tempfile.TemporaryDirectory() as directory:
+        # Каталог растет в 10 раз между замерами; пик памяти должен остаться прежним
+        for label, count in [('1/10 каталога', size // 10), ('весь каталог', size - size // 10)]:
+            listings = seed_listings(count, seed=count)
+            owners = User.objects.bulk_create([
+                User(username=f'benchmark_owner_{uuid.uuid4().hex}') for _ in range(max(count // 20, 1))
+            ])
+            for i, listing in enumerate(listings):
+                listing.owner = owners[i % len(owners)]
+            Listing.objects.bulk_update(listings, ['owner'], batch_size=1000)
+
+            expected = Listing.objects.count() + User.objects.filter(listings__isnull=False).distinct().count()
+            export(label, os.path.join(directory, 'export.ndjson'), expected)
+        export('весь каталог, gzip', os.path.join(directory, 'export.ndjson.gz'), expected)
+
+
+@scenario('import', default_size=100000)
+def bench_import(command, size, repeat):
+    """import_listing из NDJSON: создание, обновление и пропуск существующих порциями.
+
+    Импорт коммитится по-настоящему: в замер входят обработчики после коммита (поисковый
+    индекс, цены ночей, кэш), которые в rolled_back() не выполнились бы.
+    """
+    import io
+    import json
+    import os
+    import tempfile
+    from django.core.management import call_command
+    from django.utils import timezone
+
+    since = timezone.now()
+    seeded = seed_listings(size)
+    first, last = seeded[0].pk, seeded[-1].pk
+    base = Listing.objects.filter(pk__gte=first, pk__lte=last)
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            exported = os.path.join(directory, 'all.ndjson')
+            call_command('export_listing', all=True, include_owner=True, since=since.isoformat(), output=exported,
+                         stdout=io.StringIO())
+            # Только тестовые объекты: параллельно измененные настоящие в файл не попадают
+            output = os.path.join(directory, 'export.ndjson')
+            sample = []
+            with open(exported, encoding='utf-8') as source, open(output, 'w', encoding='utf-8') as target:
+                for line in source:
+                    record = json.loads(line)
+                    if record['model'] == 'listings.listing':
+                        if not first <= record['pk'] <= last:
+                            continue
+                        if len(sample) < 1000:
+                            sample.append(record)
+                    target.write(line)
+            base.delete()
+
+            # Поштучный путь прежней команды (get объекта, get владельца, create) на части файла
+            started = time.perf_counter()
+            for record in sample:
+                fields = dict(record['fields'])
+                Listing.objects.filter(pk=record['pk']).first()
+                fields['owner'] = User.objects.filter(pk=fields['owner']).first()
+                fields.pop('photo_main', None)
+                Listing.objects.create(id=record['pk'], **fields)
+            legacy = time.perf_counter() - started
+            report(command, 'поштучно (get + create)', legacy, len(sample))
+            base.delete()
+
+            for label, options in [
+                ('bulk_create, новые', {}),
+                ('--update-existing', {'update_existing': True}),
+                ('--skip-existing', {'skip_existing': True}),
+            ]:
+                started = time.perf_counter()
+                call_command('import_listing', output, stdout=io.StringIO(), **options)
+                report(command, label, time.perf_counter() - started, size)
+
+            if base.count() != size:
+                raise AssertionError(f'Импортировано {base.count()} объявлений из {size}')
+    finally:
+        base.delete()
+
+
+@scenario('images', default_size=120)
+def bench_images(command, size, repeat):
+    """create_listings_from_images: прежняя схема (copy2 + photo_main.save) против пула с дедупликацией."""
+    import io
+    import os
+    import shutil
+    import tempfile
+    from django.core.files import File
+    from django.core.management import call_command
+    from django.test import override_settings
+    from PIL import Image
+
+    rng = random.Random(5)
+    folders = max(size // 10, 1)
+
+    def tree_size(path):
+        return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, 'img')
+        originals = []
+        for i in range(size):
+            folder = os.path.join(source, f'{i % folders + 1} house')
+            os.makedirs(folder, exist_ok=True)
+            path = os.path.join(folder, f'photo_{i:04d}.jpg')
+            # Каждое пятое фото - копия уже существующего (одно фото в нескольких объявлениях)
+            if originals and i % 5 == 4:
+                shutil.copyfile(rng.choice(originals), path)
+            else:
+                Image.effect_noise((1280, 960), 40 + i % 50).convert('RGB').save(path, quality=85)
+                originals.append(path)
+        command.stdout.write(f'  Фото: {size} в {folders} папках, {tree_size(source) / 2**20:.1f} МБ')
+
+        for workers in sorted({1, os.cpu_count() or 1}):
+            label = f'пул, процессов: {workers}'
+            media = tempfile.mkdtemp(dir=directory)
+            with rolled_back(), override_settings(MEDIA_ROOT=media):
+                started = time.perf_counter()
+                call_command('create_listings_from_images', path=source, username='benchmark_images',
+                             workers=workers, stdout=io.StringIO())
+                elapsed = time.perf_counter() - started
+            report(command, label, elapsed, size)
+            command.stdout.write(f'    записано: {tree_size(media) / 2**20:.1f} МБ')
+
+        # Прежняя схема для всех фото: копия в MEDIA_ROOT и повторная запись через photo_main.save
+        media = tempfile.mkdtemp(dir=directory)
+        with rolled_back(), override_settings(MEDIA_ROOT=media):
+            listing = seed_listings(1)[0]
+            started = time.perf_counter()
+            for root, _, names in os.walk(source):
+                for name in sorted(names):
+                    target = os.path.join(media, 'photos', name)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    shutil.copy2(os.path.join(root, name), target)
+                    with open(target, 'rb') as f:
+                        listing.photo_main.save(name, File(f), save=True)
+            elapsed = time.perf_counter() - started
+        report(command, 'copy2 + photo_main.save', elapsed, size)
+        command.stdout.write(f'    записано: {tree_size(media) / 2**20:.1f} МБ')
+
+
+@scenario('variants', default_size=40)
+def bench_variants(command, size, repeat):
+    """build_photo_variants: время обработки и вес страницы из 20 карточек (оригиналы против 640w WebP)."""
+    import io
+    import os
+    import tempfile
+    from django.core.management import call_command
+    from django.test import override_settings
+    from PIL import Image
+    from .images import render_variants
+    from .services import PhotoVariantService
+
+    page = 20
+    with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+        os.makedirs(os.path.join(media, 'photos'))
+        names = []
+        for i in range(size):
+            name = f'photos/bench_{i:04d}.jpg'
+            # Плавные пятна с зерном: сжимаются примерно как фотография, а не как чистый шум
+            channels = [Image.effect_noise((400, 267), 60 + i % 40 + c * 5).resize((3000, 2000), Image.BICUBIC)
+                        for c in range(3)]
+            photo = Image.merge('RGB', channels)
+            photo = Image.blend(photo, Image.effect_noise((3000, 2000), 20).convert('RGB'), 0.15)
+            photo.save(os.path.join(media, name), quality=90)
+            names.append(name)
+        original_page = sum(os.path.getsize(os.path.join(media, name)) for name in names[:page])
+        command.stdout.write(f'  Фото: {size} шт. 3000x2000, {original_page / page / 1024:,.0f} КБ в среднем')
+
+        # Прежде: один процесс, производные строятся подряд
+        with rolled_back():
+            listings = seed_listings(size)
+            for listing, name in zip(listings, names):
+                Listing.objects.filter(pk=listing.pk).update(photo_main=name)
+            started = time.perf_counter()
+            for listing_id, photo in PhotoVariantService.pending(Listing.objects.filter(pk__in=[listing.pk for listing in listings])):
+                render_variants(PhotoVariantService.read(photo))
+            elapsed = time.perf_counter() - started
+        report(command, 'подряд в одном процессе (без записи)', elapsed, size)
+
+        for workers in sorted({1, os.cpu_count() or 1}):
+            with rolled_back():
+                listings = seed_listings(size)
+                for listing, name in zip(listings, names):
+                    Listing.objects.filter(pk=listing.pk).update(photo_main=name)
+                started = time.perf_counter()
+                call_command('build_photo_variants', workers=workers,
+                             listing_ids=[listing.pk for listing in listings], stdout=io.StringIO())
+                elapsed = time.perf_counter() - started
+                variants = list(
+                    Listing.objects.filter(pk__in=[listing.pk for listing in listings[:page]])
+                    .values_list('photo_variants', flat=True)
+                )
+            report(command, f'build_photo_variants, процессов: {workers}', elapsed, size)
+
+        assert len(variants) == page and all(v.get('source') for v in variants), 'производные построены не для всех объектов'
+        storage = PhotoVariantService.storage()
+        for fmt, width in (('webp', '640'), ('webp', '320'), ('jpeg', '640')):
+            weight = sum(storage.size(v[fmt][width]) for v in variants)
+            command.stdout.write(
+                f'  страница из {page} карточек, {fmt} {width}w: {weight / 1024:,.0f} КБ '
+                f'(оригиналы: {original_page / 1024:,.0f} КБ, в {original_page / weight:.1f} раза меньше)'
+            )
+
+
+@contextmanager
+def ical_server(feeds, latency=0.0):
+    """Локальный HTTP сервер с календарями feeds[путь] = байты; ETag и 304, как у реальных календарей.
+
+    Возвращает (базовый адрес, счетчик ответов по статусам).
+    """
+    import hashlib
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    statuses = Counter()
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive
+        disable_nagle_algorithm = True  # заголовки и тело уходят отдельными пакетами
+
+        def do_GET(self):
+            time.sleep(latency)
+            body = feeds.get(self.path)
+            if body is None:
+                status, body, headers = 404, b'', {}
+            else:
+                etag = '"%s"' % hashlib.md5(body).hexdigest()
+                headers = {'ETag': etag, 'Content-Type': 'text/calendar; charset=utf-8'}
+                status = 304 if self.headers.get('If-None-Match') == etag else 200
+                if status == 304:
+                    body = b''
+            with lock:
+                statuses[status] += 1
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{server.server_address[1]}', statuses
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def ical_feed(rng, uid_prefix, start, bookings):
+    """Календарь из bookings бронирований по 1-7 ночей, начиная с start."""
+    lines = ['BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//benchmark//RU']
+    day = start
+    for i in range(bookings):
+        day += timedelta(days=rng.randint(0, 10))
+        end = day + timedelta(days=rng.randint(1, 7))
+        lines += [
+            'BEGIN:VEVENT', f'UID:{uid_prefix}-{i}@benchmark', f'DTSTART;VALUE=DATE:{day:%Y%m%d}',
+            f'DTEND;VALUE=DATE:{end:%Y%m%d}', 'SUMMARY:Reserved', 'END:VEVENT',
+        ]
+        day = end
+    lines.append('END:VCALENDAR')
+    return ('\r\n'.join(lines) + '\r\n').encode()
+
+
+@scenario('ical', default_size=200)
+def bench_ical(command, size, repeat):
+    """sync_ical: последовательная загрузка против пула потоков, повторная синхронизация через 304."""
+    from .models import ICalSync
+    from .services import ICalSyncService
+
+    rng = random.Random(9)
+    latency = 0.05
+    start = date.today()
+    feeds = {f'/feed/{i}.ics': ical_feed(rng, i, start, 30) for i in range(size)}
+    command.stdout.write(f'  Календарей: {size}, задержка сервера {latency * 1000:.0f} мс, '
+                         f'{sum(map(len, feeds.values())) / 1024:,.0f} КБ')
+
+    def ical_nights(listing_id, ical_sync_id):
+        return Availability.objects.filter(listing_id=listing_id, source='ical',
+                                           external_id__startswith=f'{ical_sync_id}:').count()
+
+    with ical_server(feeds, latency) as (base_url, statuses):
+        for workers in sorted({1, 16}):
+            with rolled_back():
+                listings = seed_listings(size)
+                syncs = ICalSync.objects.bulk_create([
+                    ICalSync(listing=listing, url=f'{base_url}/feed/{i}.ics', sync_frequency=60)
+                    for i, listing in enumerate(listings)
+                ])
+                statuses.clear()
+                started = time.perf_counter()
+                results = ICalSyncService.sync_all_active(workers=workers)
+                elapsed = time.perf_counter() - started
+                assert all(result['success'] for result in results), [r for r in results if not r['success']][:3]
+                report(command, f'первая синхронизация, потоков: {workers}', elapsed, size)
+
+                if workers == 1:
+                    continue
+                # Повтор: срок не подошел - ничего не загружается
+                assert not ICalSyncService.sync_all_active(workers=workers)
+                # Срок подошел, календари не изменились - только 304
+                ICalSync.objects.update(next_sync=None)
+                statuses.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    results = ICalSyncService.sync_all_active(workers=workers)
+                    elapsed = time.perf_counter() - started
+                assert statuses[304] == size and all('304' in result['message'] for result in results)
+                report(command, f'без изменений (304), потоков: {workers}', elapsed, size)
+                command.stdout.write(f'    SQL запросов: {len(queries)}')
+
+                # Каждый десятый календарь изменился: пишутся только отличия
+                changed = list(range(0, size, 10))
+                for i in changed:
+                    feeds[f'/feed/{i}.ics'] = ical_feed(rng, i, start, 30)
+                ICalSync.objects.update(next_sync=None)
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    results = ICalSyncService.sync_all_active(workers=workers)
+                    elapsed = time.perf_counter() - started
+                report(command, f'изменилось {len(changed)}, потоков: {workers}', elapsed, size)
+                command.stdout.write(f'    SQL запросов: {len(queries)}')
+
+                # Строки календаря совпадают с ночами событий
+                by_listing = {sync.pk: sync.listing_id for sync in syncs}
+                for i in changed[:5]:
+                    nights = set()
+                    for line in feeds[f'/feed/{i}.ics'].decode().split('\r\n'):
+                        if line.startswith('DTSTART'):
+                            day = datetime.strptime(line[-8:], '%Y%m%d').date()
+                        elif line.startswith('DTEND'):
+                            end = datetime.strptime(line[-8:], '%Y%m%d').date()
+                            nights.update(day + timedelta(days=n) for n in range((end - day).days))
+                    horizon = start + timedelta(days=CalendarIndexService.horizon_days())
+                    nights = {night for night in nights if night < horizon}
+                    assert ical_nights(by_listing[syncs[i].pk], syncs[i].pk) == len(nights)
+
+
+ICAL_FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'ical')
+
+
+@scenario('ical_parse', default_size=100000)
+def bench_ical_parse(command, size, repeat):
+    """Разбор iCal: набор образцов (fixtures/ical) и скорость/память потокового разбора большого календаря."""
+    import json
+    import tempfile
+    from zoneinfo import ZoneInfo
+    from .ical import ICalError, iter_lines, parse_events
+    from .services import ICalSyncService
+
+    # Образцы: периоды должны совпасть с expected.json при чтении любыми порциями
+    with open(os.path.join(ICAL_FIXTURES, 'expected.json'), encoding='utf-8') as f:
+        expected = json.load(f)
+    window = [date.fromisoformat(value) for value in expected['window']]
+    tz = ZoneInfo(expected['tz'])
+    for name, ranges in expected['feeds'].items():
+        for chunk_size in (7, 64 * 1024):
+            with open(os.path.join(ICAL_FIXTURES, name), 'rb') as f:
+                chunks = iter(lambda: f.read(chunk_size), b'')
+                try:
+                    got = sorted([event.uid, str(event.start), str(event.end)]
+                                 for event in parse_events(iter_lines(chunks), *window, tz))
+                except ICalError:
+                    got = None
+            assert got == (sorted(ranges) if ranges is not None else None), f'{name}: {got}'
+    command.stdout.write(f'  Образцы: {len(expected["feeds"])} файлов совпадают с expected.json')
+
+    # Большой календарь: 15 лет истории, каждое сотое событие - повторяющееся без конца
+    rng = random.Random(18)
+    today = date.today()
+    start, end = ICalSyncService.window()
+    with tempfile.NamedTemporaryFile(suffix='.ics') as feed:
+        feed.write(b'BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//benchmark//RU\r\n')
+        day = today - timedelta(days=15 * 365)
+        for i in range(size):
+            day += timedelta(days=rng.randint(0, 1) if i % 3 else 0)
+            nights = rng.randint(1, 7)
+            lines = [
+                'BEGIN:VEVENT', f'UID:{i}-{rng.getrandbits(64):016x}@benchmark.example.com',
+                f'DTSTART;VALUE=DATE:{day:%Y%m%d}', f'DTEND;VALUE=DATE:{day + timedelta(days=nights):%Y%m%d}',
+                'SUMMARY:Reserved',
+                'DESCRIPTION:Reservation URL: https://example.com/hosting/reservations/details/'
+                f'{rng.getrandbits(40):010x}\\nPhone Number (Last 4 Digits): {rng.randint(1000, 9999)}',
+            ]
+            if i % 100 == 0:
+                lines.append(f'RRULE:FREQ=WEEKLY;INTERVAL={rng.randint(1, 4)}')
+            lines.append('END:VEVENT')
+            # Длинные строки переносятся по 75 символов, как у реальных календарей
+            for line in lines:
+                while len(line) > 75:
+                    feed.write(line[:75].encode() + b'\r\n')
+                    line = ' ' + line[75:]
+                feed.write(line.encode() + b'\r\n')
+        feed.write(b'END:VCALENDAR\r\n')
+        feed.flush()
+        megabytes = os.path.getsize(feed.name) / 2**20
+        command.stdout.write(f'  Календарь: {size} событий, {megabytes:.1f} МБ, окно {start} - {end}')
+
+        def streaming():
+            with open(feed.name, 'rb') as f:
+                chunks = iter(lambda: f.read(64 * 1024), b'')
+                return ICalSyncService.blocked_days(1, parse_events(iter_lines(chunks), start, end, tz))
+
+        def in_memory():
+            # Прежняя схема: весь ответ в памяти, затем список событий
+            with open(feed.name, 'rb') as f:
+                text = f.read().decode('utf-8')
+            events = list(parse_events(text.splitlines(), start, end, tz))
+            return ICalSyncService.blocked_days(1, events)
+
+        results = {}
+        for label, func in (('целиком в памяти', in_memory), ('потоково', streaming)):
+            elapsed, results[label] = best_of(func, repeat)
+            tracemalloc.start()
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            report(command, label, elapsed, size)
+            command.stdout.write(f'    {megabytes / elapsed:.1f} МБ/с, пик памяти: {peak / 2**20:.2f} МБ')
+        assert results['целиком в памяти'] == results['потоково']
+        days, periods = results['потоково']
+        command.stdout.write(f'  Занятых периодов в окне: {periods}, ночей: {len(days)}')
+
+
+@scenario('ical_feed', default_size=200)
+def bench_ical_feed(command, size, repeat):
+    """Выгрузка календаря объекта (calendar.ics): сборка на каждый опрос, кэш и 304, сброс при изменениях."""
+    from django.core.cache import caches
+    from django.test.utils import override_settings
+    from rest_framework.test import APIClient
+    from .ical import iter_lines, parse_events
+
+    # На объект две записи (календарь и его ETag/Last-Modified): locmem по умолчанию хранит только 300
+    backend = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark-ical-feed',
+               'OPTIONS': {'MAX_ENTRIES': 10 * size + 100}}
+    client = APIClient(HTTP_HOST=HTTP_HOST)
+
+    # Инвалидация срабатывает после коммита, поэтому данные создаются вне rolled_back()
+    listings = seed_listings(size, seed=19)
+    base = Listing.objects.filter(pk__gte=listings[0].pk, pk__lte=listings[-1].pk)
+    seed_bookings(listings, size * 20, seed=19)
+    target = listings[0]
+    url = f'/api/listings/{target.pk}/calendar.ics'
+    try:
+        with override_settings(CACHES={'default': backend}):
+            caches['default'].clear()
+
+            def feed_ranges(body):
+                start, end = date.today(), date.today() + timedelta(days=CalendarIndexService.horizon_days())
+                return [(event.start, event.end) for event in parse_events(iter_lines([body]), start, end)]
+
+            response = client.get(url)
+            assert response.status_code == 200 and response['X-Cache'] == 'MISS', response.status_code
+            assert feed_ranges(response.content) == CalendarIndexService.closed_ranges(target.pk)
+            original, etag, last_modified = response.content, response['ETag'], response['Last-Modified']
+            command.stdout.write(
+                f'  {url}: {len(response.content)} байт, периодов: {len(feed_ranges(response.content))}'
+            )
+
+            def poll_all():
+                return [client.get(f'/api/listings/{l.pk}/calendar.ics') for l in listings]
+
+            # Без кэша календарь собирается заново на каждый опрос канала
+            with override_settings(LISTINGS_CACHE_ENABLED=False):
+                naive, _ = best_of(poll_all, repeat)
+            poll_all()
+            with counted_queries() as queries:
+                cached, _ = best_of(poll_all, repeat)
+                conditional, responses = best_of(
+                    lambda: [client.get(url, HTTP_IF_NONE_MATCH=etag) for _ in listings], repeat,
+                )
+                assert client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code == 304
+            assert all(r.status_code == 304 and not r.content for r in responses)
+            assert len(queries) == 0, f'запросов к БД при попадании в кэш: {len(queries)}'
+
+            report(command, 'сборка на каждый опрос', naive, size)
+            report(command, '200 из кэша', cached, size)
+            report(command, '304 по If-None-Match', conditional, size)
+
+            # Новая бронь и закрытая дата сбрасывают выгрузку объекта, но не соседнего
+            guest, _ = User.objects.get_or_create(username='benchmark_guest')
+            day = date.today() + timedelta(days=700)
+            booking = Booking.objects.create(
+                listing=target, guest=guest, check_in=day, check_out=day + timedelta(days=3),
+                guests_count=1, total_price=Decimal('1.00'), status='confirmed',
+            )
+            response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+            assert response.status_code == 200 and response['X-Cache'] == 'MISS'
+            assert (day, day + timedelta(days=3)) in feed_ranges(response.content)
+            assert response['ETag'] != etag
+            neighbour = client.get(f'/api/listings/{listings[1].pk}/calendar.ics')
+            assert neighbour['X-Cache'] == 'HIT'
+
+            etag = response['ETag']
+            blocked = Availability.objects.create(listing=target, date=day + timedelta(days=5), is_available=False)
+            response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+            assert response.status_code == 200 and response['ETag'] != etag
+            assert (day + timedelta(days=5), day + timedelta(days=6)) in feed_ranges(response.content)
+
+            booking.delete()
+            blocked.delete()
+            response = client.get(url)
+            assert response['X-Cache'] == 'MISS' and response.content == original
+            command.stdout.write('  инвалидация: ok')
+            caches['default'].clear()
+    finally:
+        base.delete()
+
+
+@scenario('timing', default_size=200)
+def bench_timing(command, size, repeat):
+    """Накладные расходы ServerTimingMiddleware: выключен, метрики, заголовок, запись в лог каждого запроса."""
+    import logging
+    from django.test.utils import override_settings
+    from rest_framework.test import APIClient
+
+    client = APIClient(HTTP_HOST=HTTP_HOST)
+    with rolled_back():
+        listings = seed_listings(20, seed=21)
+        seed_bookings(listings, 100, seed=21)
+        urls = ['/api/listings/', f'/api/listings/{listings[0].pk}/', f'/listings/{listings[0].pk}']
+        modes = {
+            'выключено': {
+                'LISTINGS_SERVER_TIMING': False, 'LISTINGS_TIMING_SAMPLE_RATE': 0.0, 'LISTINGS_METRICS_ENABLED': False,
+            },
+            'метрики': {
+                'LISTINGS_SERVER_TIMING': False, 'LISTINGS_TIMING_SAMPLE_RATE': 0.0, 'LISTINGS_METRICS_ENABLED': True,
+            },
+            'Server-Timing': {
+                'LISTINGS_SERVER_TIMING': True, 'LISTINGS_TIMING_SAMPLE_RATE': 0.0, 'LISTINGS_METRICS_ENABLED': False,
+            },
+            'Server-Timing + лог': {
+                'LISTINGS_SERVER_TIMING': True, 'LISTINGS_TIMING_SAMPLE_RATE': 1.0, 'LISTINGS_METRICS_ENABLED': False,
+            },
+        }
+        timing_logger = logging.getLogger('listings.timing')
+        handler = logging.NullHandler()
+        timing_logger.addHandler(handler)
+        propagate, level = timing_logger.propagate, timing_logger.level
+        timing_logger.propagate = False
+        timing_logger.setLevel(logging.INFO)
+        try:
+            for url in urls:
+                command.stdout.write(f'\n{url}:')
+                with override_settings(LISTINGS_CACHE_ENABLED=False):
+                    # Прогрев: шаблоны, планы запросов, ленивые импорты
+                    [client.get(url) for _ in range(size)]
+                baseline = None
+                for label, options in modes.items():
+                    with override_settings(LISTINGS_CACHE_ENABLED=False, **options):
+                        response = client.get(url)
+                        assert response.status_code == 200, response.status_code
+                        assert ('Server-Timing' in response) == options['LISTINGS_SERVER_TIMING']
+                        elapsed, _ = best_of(lambda: [client.get(url) for _ in range(size)], repeat)
+                    report(command, label, elapsed, size)
+                    if baseline is None:
+                        baseline = elapsed
+                    else:
+                        command.stdout.write(f'    на запрос: {(elapsed - baseline) / size * 1e6:+.0f} мкс')
+                command.stdout.write(f'    {response["Server-Timing"]}')
+        finally:
+            timing_logger.removeHandler(handler)
+            timing_logger.propagate, timing_logger.level = propagate, level
+
+
+def _metrics_worker(directory, count):
+    from . import metrics
+    for index in range(count):
+        metrics.HTTP_LATENCY.observe(index % 100 / 1000, route='bench', status=200)
+        metrics.HTTP_REQUESTS.inc(route='bench', method='GET', status=200)
+
+
+def _parse_exposition(text):
+    """{(имя, метки): значение} из текстового формата Prometheus."""
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        series, value = line.rsplit(' ', 1)
+        name, _, labels = series.partition('{')
+        samples[name, labels.rstrip('}')] = float(value)
+    return samples
+
+
+@scenario('metrics', default_size=20000)
+def bench_metrics(command, size, repeat):
+    """Реестр метрик: стоимость наблюдения, потоки, несколько процессов в общем каталоге, /admin/metrics/."""
+    import multiprocessing
+    import tempfile
+    from django.test import Client
+    from django.test.utils import override_settings
+    from . import metrics
+
+    with tempfile.TemporaryDirectory() as directory, override_settings(LISTINGS_METRICS_DIR=directory):
+        elapsed, _ = best_of(lambda: _metrics_worker(directory, size), repeat)
+        report(command, 'наблюдение (гистограмма + счетчик), файл', elapsed, size)
+
+        threads = 8
+        before = _parse_exposition(metrics.registry.render())
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(lambda _: _metrics_worker(directory, size // threads), range(threads)))
+        after = _parse_exposition(metrics.registry.render())
+        key = ('listings_http_requests_total', 'route="bench",method="GET",status="200"')
+        assert after[key] - before[key] == size // threads * threads, (before[key], after[key])
+        command.stdout.write(f'  {threads} потоков: {size // threads * threads} наблюдений, потерь нет')
+
+        processes = 4
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=_metrics_worker, args=(directory, size)) for _ in range(processes)]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+            assert worker.exitcode == 0, worker.exitcode
+        report(command, f'{processes} процесса по {size}', time.perf_counter() - started, processes * size)
+        assert len(os.listdir(directory)) == processes + 1
+        elapsed, text = best_of(metrics.registry.render, repeat)
+        report(command, f'render() по {processes + 1} файлам', elapsed)
+        samples = _parse_exposition(text)
+        assert samples[key] - after[key] == processes * size, samples[key]
+
+        # Корзины накопительные, +Inf совпадает с _count
+        labels = 'route="bench",status="200"'
+        count = samples['listings_http_request_duration_seconds_count', labels]
+        bounds = [*map(str, metrics.LATENCY_BUCKETS), '+Inf']
+        cumulative = [samples['listings_http_request_duration_seconds_bucket', f'{labels},le="{b}"'] for b in bounds]
+        assert cumulative == sorted(cumulative) and cumulative[-1] == count, cumulative
+        command.stdout.write('  сумма по процессам и формат гистограмм: ok')
+
+    with rolled_back():
+        staff = User.objects.create_user(f'metrics-{uuid.uuid4().hex[:8]}', is_staff=True)
+        client = Client(HTTP_HOST=HTTP_HOST)
+        with override_settings(LISTINGS_METRICS_TOKEN='bench-token', LISTINGS_METRICS_ENABLED=True):
+            assert client.get('/admin/metrics/').status_code == 302
+            denied = client.get('/admin/metrics/', HTTP_AUTHORIZATION='Bearer wrong')
+            assert denied.status_code == 403
+            response = client.get('/admin/metrics/', HTTP_AUTHORIZATION='Bearer bench-token')
+            assert response.status_code == 200 and response['Content-Type'].startswith('text/plain')
+            client.force_login(staff)
+            client.get('/api/listings/')
+            text = client.get('/admin/metrics/').content.decode()
+        assert 'listings_http_requests_total{route="listing-list",method="GET",status="200"}' in text
+        assert 'listings_http_request_queries_bucket{route="listing-list",le="+Inf"}' in text
+        command.stdout.write('  /admin/metrics/: вход по сессии сотрудника и по токену: ok')
+
+
+@scenario('profile', default_size=2000)
+def bench_profile(command, size, repeat):
+    """ProfilerMiddleware: доступ, файлы .prof/.collapsed, ротация и стоимость профилирования запроса."""
+    import pstats
+    import tempfile
+    from django.test.utils import override_settings
+    from rest_framework.test import APIClient
+    from .profiling import make_token
+
+    client = APIClient(HTTP_HOST=HTTP_HOST)
+    check_in = date.today() + timedelta(days=30)
+    search_body = {'check_in': str(check_in), 'check_out': str(check_in + timedelta(days=5)), 'city': 'Алматы'}
+    with rolled_back(), tempfile.TemporaryDirectory() as directory:
+        seed_listings(size, seed=23)
+        staff = User.objects.create_user(f'profile-{uuid.uuid4().hex[:8]}', is_staff=True)
+        guest = User.objects.create_user(f'profile-{uuid.uuid4().hex[:8]}')
+        token = make_token()
+
+        def search(**headers):
+            return client.post('/api/listings/search/', search_body, format='json', **headers)
+
+        with override_settings(LISTINGS_PROFILE_DIR=directory, LISTINGS_PROFILE_KEEP=5, LISTINGS_CACHE_ENABLED=False):
+            search()
+            elapsed, _ = best_of(search, repeat)
+            report(command, 'search без профилирования', elapsed)
+            elapsed, response = best_of(lambda: search(HTTP_X_PROFILE=token), repeat)
+            report(command, 'search, cprofile', elapsed)
+            assert response['X-Profile'].endswith('.prof'), response.get('X-Profile')
+            stats = pstats.Stats(os.path.join(directory, response['X-Profile']))
+            command.stdout.write(f'    вызовов функций: {stats.total_calls:,}')
+            elapsed, response = best_of(lambda: search(HTTP_X_PROFILE=token, HTTP_X_PROFILE_MODE='sampling'), repeat)
+            report(command, 'search, sampling', elapsed)
+            with open(os.path.join(directory, response['X-Profile']), encoding='utf-8') as f:
+                stacks = [line.rsplit(' ', 1) for line in f]
+            command.stdout.write(f'    снимков стека: {sum(int(count) for _, count in stacks)}')
+
+            assert 'X-Profile' not in search(HTTP_X_PROFILE=token + 'x')
+            client.force_login(guest)
+            assert 'X-Profile' not in client.get('/api/listings/', {'_profile': 1})
+            client.force_login(staff)
+            response = client.get('/api/listings/', {'_profile': 1})
+            assert response.status_code == 200 and response['X-Profile'].endswith('.prof')
+            client.logout()
+            command.stdout.write('  доступ: подписанный токен и ?_profile для сотрудников: ok')
+
+            for _ in range(8):
+                search(HTTP_X_PROFILE=token)
+            assert len(os.listdir(directory)) == 5, os.listdir(directory)
+            command.stdout.write('  ротация: ok')
+
+
+@scenario('month_calendar', default_size=50)
+def bench_month_calendar(command, size, repeat):
+    """Календарь цен на 3 месяца (/calendar/) против запроса availability на каждый день виджета."""
+    from django.core.cache import caches
+    from django.test.utils import override_settings
+    from rest_framework.test import APIClient
+
+    backend = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark-month-calendar',
+               'OPTIONS': {'MAX_ENTRIES': 10 * size + 100}}
+    client = APIClient(HTTP_HOST=HTTP_HOST)
+    start = date.today()
+    end = start + timedelta(days=89)
+
+    # Инвалидация срабатывает после коммита, поэтому данные создаются вне rolled_back()
+    listings = seed_listings(size, seed=24)
+    base = Listing.objects.filter(pk__gte=listings[0].pk, pk__lte=listings[-1].pk)
+    seed_bookings(listings, size * 20, seed=24)
+    # Объект с min_nights > 1: заезд возможен не в каждую свободную ночь
+    target = next(listing for listing in listings if listing.min_nights > 1)
+    override_day = start + timedelta(days=10)
+    Availability.objects.create(listing=target, date=override_day, price_override=Decimal('777.00'))
+    url = f'/api/listings/{target.pk}/calendar/'
+    params = {'from': str(start), 'to': str(end)}
+    try:
+        with override_settings(CACHES={'default': backend}):
+            caches['default'].clear()
+
+            # Так виджет собирал календарь раньше: запрос availability на каждый день
+            def per_day():
+                return [
+                    client.get(f'/api/listings/{target.pk}/availability/', {
+                        'check_in': str(start + timedelta(days=i)), 'check_out': str(start + timedelta(days=i + 1)),
+                    })
+                    for i in range(90)
+                ]
+
+            with override_settings(LISTINGS_CACHE_ENABLED=False):
+                naive, _ = best_of(per_day, 1)
+                with counted_queries() as queries:
+                    response = client.get(url, params)
+                cold, _ = best_of(lambda: client.get(url, params), repeat)
+            days = response.data['days']
+            assert len(days) == 90 and days[0]['date'] == str(start) and days[-1]['date'] == str(end)
+            assert len(queries) == 3, f'запросов: {len(queries)}'
+            report(command, '90 запросов availability', naive, 90)
+            report(command, 'calendar без кэша (3 SQL)', cold)
+
+            # Совпадение с AvailabilityService и ценами объекта
+            def free(check_in, nights):
+                check_out = check_in + timedelta(days=nights)
+                return not (
+                    AvailabilityService.overlapping_bookings(check_in, check_out).filter(listing=target).exists()
+                    or AvailabilityService.blocked_dates(check_in, check_out).filter(listing=target).exists()
+                )
+
+            min_nights = target.min_nights
+            for day in days:
+                night = date.fromisoformat(day['date'])
+                assert day['available'] == free(night, 1), day
+                assert day['check_in'] == free(night, min_nights), day
+                expected = Decimal('777.00') if night == override_day else target.get_price_for_date(night)
+                assert day['price'] == float(expected), day
+            command.stdout.write(
+                f'  свободно ночей: {sum(day["available"] for day in days)} из 90, min_nights={min_nights}: ok'
+            )
+
+            client.get(url, params)
+            with counted_queries() as queries:
+                warm, response = best_of(lambda: client.get(url, params), repeat)
+            assert response['X-Cache'] == 'HIT' and len(queries) == repeat, len(queries)
+            report(command, 'calendar из кэша (1 SQL)', warm)
+            # Сдвинутый диапазон берет уже посчитанные месяцы
+            shifted = client.get(url, {'from': str(start + timedelta(days=7)), 'to': str(end - timedelta(days=7))})
+            assert shifted['X-Cache'] == 'HIT' and shifted.data['days'] == days[7:-7]
+
+            guest, _ = User.objects.get_or_create(username='benchmark_guest')
+            booking = Booking.objects.create(
+                listing=target, guest=guest, check_in=start + timedelta(days=40), check_out=start + timedelta(days=43),
+                guests_count=1, total_price=Decimal('1.00'), status='confirmed',
+            )
+            response = client.get(url, params)
+            assert response['X-Cache'] == 'MISS' and not any(d['available'] for d in response.data['days'][40:43])
+            booking.delete()
+            assert client.get(url, params).data['days'] == days
+            assert client.get(url, {'from': str(end), 'to': str(start)}).status_code == 400
+            assert client.get(url, {'from': 'завтра'}).status_code == 400
+            command.stdout.write('  инвалидация и проверка параметров: ok')
+            caches['default'].clear()
+    finally:
+        base.delete()
+
+
+@scenario('nightly_rates', default_size=2000)
+def bench_nightly_rates(command, size, repeat):
+    """Цены ночей (ListingNightlyRate): пересчет, стоимость периода одним GROUP BY против расчета по объектам."""
+    from django.core.management import call_command
+
+    rng = random.Random(25)
+    today = date.today()
+    # Инкрементальный пересчет срабатывает после коммита, поэтому данные создаются вне rolled_back()
+    listings = seed_listings(size, seed=25)
+    base = Listing.objects.filter(pk__gte=listings[0].pk, pk__lte=listings[-1].pk)
+    ids = [listing.pk for listing in listings]
+    try:
+        seed_bookings(listings, size * 10, seed=25)
+        Availability.objects.bulk_create([
+            Availability(listing_id=rng.choice(ids), date=today + timedelta(days=rng.randint(0, 365)),
+                         price_override=Decimal(rng.randint(3000, 90000)))
+            for _ in range(size * 5)
+        ], ignore_conflicts=True)
+
+        elapsed, rows = best_of(lambda: NightlyRateService.refresh(ids), 1)
+        report(command, f'пересчет {size} объектов ({rows:,} ночей)', elapsed, rows)
+
+        check_in = today + timedelta(days=30)
+        check_out = check_in + timedelta(days=7)
+
+        # Честный расчет по объектам: брони, закрытые даты и особые цены каждого объекта
+        def per_listing():
+            totals = {}
+            for listing in listings:
+                if AvailabilityService.overlapping_bookings(check_in, check_out).filter(listing=listing).exists():
+                    continue
+                if AvailabilityService.blocked_dates(check_in, check_out).filter(listing=listing).exists():
+                    continue
+                overrides = dict(Availability.objects.filter(
+                    listing=listing, date__gte=check_in, date__lt=check_out, price_override__isnull=False,
+                ).values_list('date', 'price_override'))
+                total = Decimal('0.00')
+                for offset in range((check_out - check_in).days):
+                    night = check_in + timedelta(days=offset)
+                    total += overrides.get(night) or listing.get_price_for_date(night)
+                discount = PricingService.get_discount(listing, (check_out - check_in).days)
+                if discount:
+                    total -= total * Decimal(str(discount)) / 100
+                totals[listing.pk] = total
+            return totals
+
+        naive, expected = best_of(per_listing, 1)
+        with counted_queries() as queries:
+            grouped, totals = best_of(lambda: NightlyRateService.quote_totals(ids, check_in, check_out), repeat)
+        assert len(queries) == repeat, len(queries)
+        assert totals == expected, set(totals.items()) ^ set(expected.items())
+        report(command, 'по объектам в Python', naive, size)
+        report(command, 'GROUP BY по ценам ночей (1 SQL)', grouped, size)
+        command.stdout.write(f'  свободных объектов: {len(totals)} из {size}, суммы совпадают: ok')
+
+        # Инкрементальный пересчет: бронь, особая цена, изменение цены объекта
+        target = next(listing for listing in listings if listing.pk in totals)
+        guest, _ = User.objects.get_or_create(username='benchmark_guest')
+        Booking.objects.create(
+            listing=target, guest=guest, check_in=check_in, check_out=check_in + timedelta(days=2),
+            guests_count=1, total_price=Decimal('1.00'), status='confirmed',
+        )
+        assert target.pk not in NightlyRateService.quote_totals([target.pk], check_in, check_out)
+        Booking.objects.filter(listing=target, check_in=check_in).delete()
+        Availability.objects.update_or_create(
+            listing=target, date=check_in, defaults={'price_override': Decimal('1.00'), 'is_available': True},
+        )
+        night = ListingNightlyRate.objects.get(listing=target, date=check_in)
+        assert night.price == Decimal('1.00') and not night.is_blocked
+        Availability.objects.filter(listing=target, date__gte=check_in, date__lt=check_out).delete()
+        Listing.objects.filter(pk=target.pk).update(base_price=Decimal('100.00'), weekend_price=None)
+        target.refresh_from_db()
+        assert NightlyRateService.quote_totals([target.pk], check_in, check_out)[target.pk] == \
+            PricingService.calculate_total_price(target, check_in, check_out)
+        command.stdout.write('  пересчет после брони, особой цены и изменения цены объекта: ok')
+
+        # Прерванный пересчет: повторный запуск досчитывает только недостающие объекты
+        half = ids[size // 2:]
+        ListingNightlyRate.objects.filter(listing_id__in=half, date__gte=today + timedelta(days=200)).delete()
+        assert {pk for pk, _ in NightlyRateService.pending(base)} == set(half)
+        started = time.perf_counter()
+        call_command('rebuild_nightly_rates', chunk_size=500, stdout=open(os.devnull, 'w'))
+        report(command, f'rebuild_nightly_rates: {len(half)} недосчитанных', time.perf_counter() - started)
+        assert not NightlyRateService.pending(base).exists()
+        assert ListingNightlyRate.objects.filter(listing__in=base).count() == size * NightlyRateService.horizon_days()
+        command.stdout.write('  продолжение прерванного пересчета: ok')
+    finally:
+        base.delete()
@@ -0,0 +1,198 @@
+# listings/cache.py
+"""
+Кэш ответов API объектов с версионными ключами
+
+Ключ ответа включает номера версий данных, от которых он зависит. Изменение объекта
+увеличивает версию этого объекта и версию каталога; новые брони и закрытые даты -
+версию календаря. Старые записи не удаляются, а просто перестают читаться и истекают
+по таймауту.
+
+Версии увеличиваются через cache.incr(), который атомарен в locmem (один процесс),
+memcached и redis. В файловом и БД-кэше incr() - это чтение и запись, и два
+одновременных изменения могут увеличить версию один раз; тогда ответ, собранный между
+ними, может оставаться устаревшим до LISTINGS_CACHE_TIMEOUT.
+"""
+import hashlib
+import json
+import time
+from datetime import date
+from functools import wraps
+from typing import Iterable
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+from . import metrics
+
+# Сколько объектов менять поштучно; при массовом изменении сбрасываются версии всех объектов
+BULK_BUMP_THRESHOLD = 100
+
+
+class ResponseCache:
+    prefix = 'listings'
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'LISTINGS_CACHE_ALIAS', 'default')]
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'LISTINGS_CACHE_TIMEOUT', 300)
+
+    def _version_key(self, name):
+        return f'{self.prefix}:v:{name}'
+
+    def versions(self, *names):
+        """Текущие версии (отсутствующая версия считается нулевой)."""
+        keys = [self._version_key(name) for name in names]
+        values = self.cache.get_many(keys)
+        return [values.get(key, 0) for key in keys]
+
+    def bump(self, *names):
+        for name in names:
+            self._incr(self._version_key(name))
+
+    def _incr(self, key):
+        # add + incr вместо get/set: в бэкендах с атомарным incr (см. описание модуля)
+        # параллельные увеличения не теряются
+        self.cache.add(key, 0, timeout=None)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            # Запись успела истечь или быть вытесненной между add и incr
+            self.cache.set(key, 1, timeout=None)
+
+    def listings_changed(self, listing_ids: Iterable[int]):
+        listing_ids = list(listing_ids)
+        if len(listing_ids) > BULK_BUMP_THRESHOLD:
+            self.bump('catalog', 'listings')
+        else:
+            self.bump('catalog', *[f'listing:{pk}' for pk in listing_ids])
+
+    def calendar_changed(self, listing_ids: Iterable[int]):
+        listing_ids = list(listing_ids)
+        if len(listing_ids) > BULK_BUMP_THRESHOLD:
+            self.bump('calendar', 'listings')
+        else:
+            self.bump('calendar', *[f'listing:{pk}' for pk in listing_ids])
+
+    def key_for(self, view_name, request, listing_id=None, uses_calendar=False):
+        """Ключ ответа: версии данных + нормализованные параметры запроса."""
+        names = ['catalog']
+        if listing_id is not None:
+            names = ['listings', f'listing:{listing_id}']
+        if uses_calendar:
+            names.append('calendar')
+        versions = '.'.join(str(version) for version in self.versions(*names))
+
+        params = sorted((key, values) for key, values in request.query_params.lists())
+        body = request.data if request.method == 'POST' else None
+        # Хост и сегодняшняя дата: ссылки пагинации абсолютные, проверки дат зависят от дня
+        payload = json.dumps([request.get_host(), str(date.today()), params, body], sort_keys=True, default=str)
+        digest = hashlib.md5(payload.encode()).hexdigest()
+        return f'{self.prefix}:resp:{view_name}:{listing_id or "-"}:{versions}:{digest}'
+
+    def calendar_feed(self, listing_id, host, build):
+        """((тело, ETag, Last-Modified), попадание) выгрузки iCal объекта.
+
+        Тело кэшируется под версией объекта (ее увеличивают и брони, и закрытые даты) и
+        текущей датой; build() вызывается только при промахе. Last-Modified сохраняется,
+        пока пересобранное тело не отличается от прежнего.
+        """
+        host_digest = hashlib.md5(host.encode()).hexdigest()[:8]
+        enabled = getattr(settings, 'LISTINGS_CACHE_ENABLED', True)
+        key = None
+        if enabled:
+            versions = '.'.join(str(version) for version in self.versions('listings', f'listing:{listing_id}'))
+            key = f'{self.prefix}:ics:{listing_id}:{versions}:{date.today()}:{host_digest}'
+            feed = self.cache.get(key)
+            self.record(hit=feed is not None, view='listing-calendar-feed')
+            if feed is not None:
+                return feed, True
+
+        body = build()
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        meta_key = f'{self.prefix}:ics-meta:{listing_id}:{host_digest}'
+        previous = self.cache.get(meta_key) if enabled else None
+        last_modified = previous[1] if previous and previous[0] == etag else int(time.time())
+        feed = (body, etag, last_modified)
+        if enabled:
+            self.cache.set(key, feed, self.timeout)
+            self.cache.set(meta_key, (etag, last_modified), None)
+        return feed, False
+
+    def calendar_months(self, listing_id, months, build):
+        """({месяц: дни}, попадание) календаря объекта по месяцам.
+
+        Каждый месяц кэшируется отдельно под версией объекта и текущей датой, поэтому
+        соседние диапазоны виджета используют одни записи; build(месяцы) вызывается
+        один раз для всех отсутствующих месяцев.
+        """
+        if not getattr(settings, 'LISTINGS_CACHE_ENABLED', True):
+            return build(months), False
+        versions = '.'.join(str(version) for version in self.versions('listings', f'listing:{listing_id}'))
+        keys = {month: f'{self.prefix}:month:{listing_id}:{versions}:{date.today()}:{month:%Y-%m}' for month in months}
+        found = self.cache.get_many(list(keys.values()))
+        calendar = {month: found[key] for month, key in keys.items() if key in found}
+        missing = [month for month in months if month not in calendar]
+        self.record(hit=not missing, view='listing-calendar')
+        if missing:
+            built = build(missing)
+            self.cache.set_many({keys[month]: days for month, days in built.items()}, self.timeout)
+            calendar.update(built)
+        return calendar, not missing
+
+    def record(self, hit: bool, view: str = 'other'):
+        result = 'hit' if hit else 'miss'
+        if metrics.enabled():
+            metrics.CACHE_REQUESTS.inc(view=view, result=result)
+        # Счетчики в кэше стоят двух обращений к нему на запрос, поэтому ведутся только для замеров
+        if getattr(settings, 'LISTINGS_CACHE_STATS', False):
+            self._incr(f'{self.prefix}:stats:{result}')
+
+    def stats(self):
+        """Попадания и промахи с последнего reset_stats() (только при LISTINGS_CACHE_STATS)."""
+        hits, misses = (
+            self.cache.get(f'{self.prefix}:stats:{name}', 0) for name in ('hit', 'miss')
+        )
+        total = hits + misses
+        return {'hit': hits, 'miss': misses, 'hit_ratio': hits / total if total else 0.0}
+
+    def reset_stats(self):
+        self.cache.delete_many([f'{self.prefix}:stats:hit', f'{self.prefix}:stats:miss'])
+
+
+response_cache = ResponseCache()
+
+
+def cached_response(uses_calendar=False, calendar_params=('check_in', 'check_out')):
+    """Кэширует успешные ответы метода ViewSet (заголовок X-Cache: HIT/MISS).
+
+    uses_calendar=True - ответ всегда зависит от броней; иначе зависимость включается,
+    если в запросе есть параметры calendar_params.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            if not getattr(settings, 'LISTINGS_CACHE_ENABLED', True):
+                return method(self, request, *args, **kwargs)
+
+            depends_on_calendar = uses_calendar or any(param in request.query_params for param in calendar_params)
+            view_name = f'{self.basename}-{method.__name__}'
+            key = response_cache.key_for(view_name, request, kwargs.get('pk'), depends_on_calendar)
+            cached = response_cache.cache.get(key)
+            if cached is not None:
+                response_cache.record(hit=True, view=view_name)
+                response = Response(cached)
+                response['X-Cache'] = 'HIT'
+                return response
+
+            response_cache.record(hit=False, view=view_name)
+            response = method(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                response_cache.cache.set(key, response.data, response_cache.timeout)
+            response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,41 @@
+# listings/filters.py
+from rest_framework import filters
+
+from .search import get_backend
+
+
+class ListingSearchFilter(filters.SearchFilter):
+    """?search= через полнотекстовый индекс (listings.search) вместо LIKE по полям.
+
+    Добавляет поле search_rank, по которому ListingOrderingFilter сортирует
+    результаты, если сортировка не задана явно.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        return get_backend().search(queryset, ' '.join(terms))
+
+
+class ListingOrderingFilter(filters.OrderingFilter):
+    """OrderingFilter, знающий о вычисляемых полях объектов.
+
+    Сортировка по distance доступна только когда в запросе переданы координаты
+    (lat/lng) и queryset содержит аннотацию distance; иначе параметр игнорируется.
+    """
+    annotated_fields = ('distance',)
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if request.query_params.get(self.ordering_param) or 'search_rank' not in queryset.query.annotations:
+            return ordering
+        return ['search_rank', *(ordering or [])]
+
+    def remove_invalid_fields(self, queryset, fields, view, request):
+        valid = super().remove_invalid_fields(queryset, fields, view, request)
+        annotations = queryset.query.annotations
+        return [
+            term for term in valid
+            if term.lstrip('-') not in self.annotated_fields or term.lstrip('-') in annotations
+        ]
@@ -0,0 +1,605 @@
+# listings/ical.py
+"""
+Загрузка и потоковый разбор внешних iCal календарей, выгрузка календаря объекта
+
+Модуль не использует модели Django: open_feed и parse_events выполняются в потоках
+пула ICalSyncService.sync_all_active. Соединения HTTP/HTTPS сохраняются в потоке и
+переиспользуются для следующих календарей того же сервера (keep-alive), поэтому
+число открытых соединений не больше числа потоков на сервер.
+
+Календарь не загружается в память целиком: тело ответа читается порциями, строки
+склеиваются (unfolding) на лету, а parse_events отдает занятые периоды по мере разбора,
+сразу обрезая их по окну [start, end) - горизонту календаря объекта. Прошлые события
+отбрасываются, повторяющиеся (RRULE) разворачиваются только внутри окна.
+"""
+import codecs
+import http.client
+import re
+import threading
+import zlib
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone, tzinfo
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Union
+from urllib.parse import urljoin, urlsplit
+
+MAX_FEED_BYTES = 50 * 1024 * 1024
+MAX_REDIRECTS = 5
+READ_CHUNK_SIZE = 64 * 1024
+USER_AGENT = 'housing-ical-sync/1.0'
+# Сколько периодов правила (дней, недель, месяцев, лет) просматривается при развороте RRULE
+MAX_RECURRENCE_PERIODS = 50000
+
+WEEKDAYS = {'MO': 0, 'TU': 1, 'WE': 2, 'TH': 3, 'FR': 4, 'SA': 5, 'SU': 6}
+# Верхняя оценка длины периода в днях: перемотка к окну не должна перескочить вхождения
+PERIOD_DAYS = {'DAILY': 1, 'WEEKLY': 7, 'MONTHLY': 31, 'YEARLY': 366}
+EVENT_PROPERTIES = frozenset(('UID', 'DTSTART', 'DTEND', 'DURATION', 'STATUS', 'RRULE', 'RECURRENCE-ID', 'EXDATE', 'RDATE'))
+PROPERTY_NAME_RE = re.compile(r'[^;:]*')
+DURATION_RE = re.compile(r'^([+-])?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$')
+
+Moment = Union[date, datetime]
+
+
+class ICalError(Exception):
+    """Календарь недоступен или не является iCal"""
+
+
+class FeedResponse(NamedTuple):
+    status: int  # 200 - календарь загружен, 304 - не изменился
+    chunks: Optional[Iterator[bytes]]  # тело ответа порциями (уже без gzip)
+    etag: str
+    last_modified: str
+
+
+class ICalEvent(NamedTuple):
+    """Занятый период: ночи с start по end (не включая), уже обрезанные по окну разбора"""
+    uid: str
+    start: date
+    end: date
+
+
+# --- HTTP ---
+
+_local = threading.local()
+
+
+def _connection(scheme: str, netloc: str, timeout: float) -> http.client.HTTPConnection:
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    key = (scheme, netloc)
+    conn = connections.get(key)
+    if conn is None:
+        conn_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        conn = connections[key] = conn_class(netloc, timeout=timeout)
+    return conn
+
+
+def _drop_connection(scheme: str, netloc: str) -> None:
+    conn = getattr(_local, 'connections', {}).pop((scheme, netloc), None)
+    if conn is not None:
+        conn.close()
+
+
+def close_connections() -> None:
+    """Закрывает соединения текущего потока."""
+    for conn in getattr(_local, 'connections', {}).values():
+        conn.close()
+    _local.connections = {}
+
+
+def _request(url: str, headers: dict, timeout: float) -> http.client.HTTPResponse:
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.netloc:
+        raise ICalError(f'Неподдерживаемый адрес: {url}')
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+    conn = _connection(parts.scheme, parts.netloc, timeout)
+    # Сервер мог закрыть простаивающее соединение: один повтор на новом
+    for attempt in range(2):
+        reused = conn.sock is not None
+        try:
+            conn.request('GET', path, headers=headers)
+            return conn.getresponse()
+        except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+            _drop_connection(parts.scheme, parts.netloc)
+            if not reused or attempt:
+                raise
+            conn = _connection(parts.scheme, parts.netloc, timeout)
+        except Exception:
+            _drop_connection(parts.scheme, parts.netloc)
+            raise
+
+
+def _read_chunks(response: http.client.HTTPResponse) -> Iterator[bytes]:
+    """Тело ответа порциями; gzip распаковывается на лету, размер ограничен MAX_FEED_BYTES."""
+    encoding = (response.getheader('Content-Encoding') or '').lower()
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if encoding in ('gzip', 'x-gzip') else None
+    size = 0
+    while True:
+        chunk = response.read(READ_CHUNK_SIZE)
+        if decompressor is not None:
+            try:
+                chunk = decompressor.decompress(chunk) if chunk else decompressor.flush()
+            except zlib.error as e:
+                raise ICalError(f'Поврежденный gzip: {e}')
+        if not chunk:
+            return
+        size += len(chunk)
+        if size > MAX_FEED_BYTES:
+            raise ICalError(f'Календарь больше {MAX_FEED_BYTES // 1024 // 1024} МБ')
+        yield chunk
+
+
+@contextmanager
+def open_feed(url: str, etag: str = '', last_modified: str = '', timeout: float = 15):
+    """Условный GET календаря: FeedResponse со статусом 304, если ETag или Last-Modified не изменились.
+
+    Тело (chunks) читается внутри блока with; недочитанный ответ закрывает соединение.
+    """
+    headers = {'User-Agent': USER_AGENT, 'Accept': 'text/calendar, */*', 'Accept-Encoding': 'gzip'}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+
+    for _ in range(MAX_REDIRECTS + 1):
+        scheme, netloc = urlsplit(url)[:2]
+        response = _request(url, headers, timeout)
+        try:
+            if response.status in (301, 302, 303, 307, 308) and response.getheader('Location'):
+                response.read()
+                url = urljoin(url, response.getheader('Location'))
+                continue
+            if response.status == 304:
+                response.read()
+                yield FeedResponse(304, None, etag, last_modified)
+                return
+            if response.status != 200:
+                response.read(READ_CHUNK_SIZE)
+                raise ICalError(f'HTTP {response.status} {response.reason}')
+            yield FeedResponse(
+                200, _read_chunks(response), response.getheader('ETag') or '', response.getheader('Last-Modified') or '',
+            )
+            return
+        finally:
+            if not response.isclosed() or response.will_close:
+                _drop_connection(scheme, netloc)
+    raise ICalError('Слишком много перенаправлений')
+
+
+# --- Разбор ---
+
+def _unfold(lines: Iterable[str]) -> Iterator[str]:
+    """Строки содержимого с учетом переноса (продолжение начинается с пробела или табуляции)."""
+    current = None
+    for line in lines:
+        if line.endswith('\r'):
+            line = line[:-1]
+        if line[:1] in (' ', '\t'):
+            if current is not None:
+                current += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = line or None
+    if current is not None:
+        yield current
+
+
+def iter_lines(chunks: Iterable[bytes]) -> Iterator[str]:
+    """Склеенные строки содержимого из потока байтов (UTF-8, CRLF или LF)."""
+    def raw_lines():
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        tail = ''
+        for chunk in chunks:
+            lines = (tail + decoder.decode(chunk)).split('\n')
+            tail = lines.pop()
+            yield from lines
+        tail += decoder.decode(b'', final=True)
+        if tail:
+            yield tail
+    return _unfold(raw_lines())
+
+
+def _property_name(line: str) -> str:
+    return PROPERTY_NAME_RE.match(line).group().upper()
+
+
+def _split_property(line: str):
+    """'DTSTART;TZID=Asia/Almaty:20240601T150000' -> ('DTSTART', {'TZID': ...}, '20240601T150000')."""
+    colon = line.find(':')
+    if colon < 0:
+        return line.upper(), {}, ''
+    head = line[:colon]
+    if '"' in head:
+        # Значение параметра в кавычках может содержать ':'
+        quoted = False
+        for i, char in enumerate(line):
+            if char == '"':
+                quoted = not quoted
+            elif char == ':' and not quoted:
+                colon = i
+                break
+        head = line[:colon]
+    name, *params = head.split(';')
+    parsed = {}
+    for param in params:
+        key, _, value = param.partition('=')
+        parsed[key.upper()] = value.strip('"')
+    return name.upper(), parsed, line[colon + 1:]
+
+
+def _parse_moment(value: str, params: Dict[str, str], tz: Optional[tzinfo]) -> Moment:
+    """Дата (VALUE=DATE) или наивное местное время; время в UTC (Z) переводится в tz."""
+    value = value.strip()
+    # Разбор срезами: strptime на каждую дату занимал треть времени разбора
+    if not value[:8].isdigit():
+        raise ValueError(f'Неверная дата: {value}')
+    if params.get('VALUE', '').upper() == 'DATE' or len(value) == 8:
+        return date(int(value[:4]), int(value[4:6]), int(value[6:8]))
+    if value[8:9] != 'T' or not value[9:15].isdigit():
+        raise ValueError(f'Неверное время: {value}')
+    moment = datetime(int(value[:4]), int(value[4:6]), int(value[6:8]),
+                      int(value[9:11]), int(value[11:13]), int(value[13:15]))
+    if value.endswith('Z') and tz is not None:
+        moment = moment.replace(tzinfo=dt_timezone.utc).astimezone(tz).replace(tzinfo=None)
+    return moment
+
+
+def _parse_duration(value: str) -> timedelta:
+    match = DURATION_RE.match(value.strip().upper())
+    if not match or not any(match.groups()[1:]):
+        raise ValueError(f'Неверная длительность: {value}')
+    sign, weeks, days, hours, minutes, seconds = match.groups()
+    duration = timedelta(weeks=int(weeks or 0), days=int(days or 0), hours=int(hours or 0),
+                         minutes=int(minutes or 0), seconds=int(seconds or 0))
+    return -duration if sign == '-' else duration
+
+
+def _day(moment: Moment) -> date:
+    return moment.date() if isinstance(moment, datetime) else moment
+
+
+def _nights(start: Moment, end: Moment):
+    """Ночи события [первая, после последней); событие короче суток занимает одну ночь."""
+    first, last = _day(start), _day(end)
+    return first, max(last, first + timedelta(days=1))
+
+
+class _Rule(NamedTuple):
+    freq: str
+    interval: int
+    count: Optional[int]
+    until: Optional[Moment]
+    by_day: List[tuple]  # (порядковый номер или 0, день недели)
+    by_month_day: List[int]
+    by_month: List[int]
+
+
+def _parse_rule(value: str, tz: Optional[tzinfo]) -> _Rule:
+    parts = {}
+    for part in value.split(';'):
+        key, _, item = part.partition('=')
+        parts[key.strip().upper()] = item.strip()
+    by_day = []
+    for item in filter(None, parts.get('BYDAY', '').upper().split(',')):
+        by_day.append((int(item[:-2] or 0), WEEKDAYS[item[-2:]]))
+    return _Rule(
+        freq=parts.get('FREQ', '').upper(),
+        interval=max(int(parts.get('INTERVAL') or 1), 1),
+        count=int(parts['COUNT']) if parts.get('COUNT') else None,
+        until=_parse_moment(parts['UNTIL'], {}, tz) if parts.get('UNTIL') else None,
+        by_day=by_day,
+        by_month_day=[int(item) for item in filter(None, parts.get('BYMONTHDAY', '').split(','))],
+        by_month=[int(item) for item in filter(None, parts.get('BYMONTH', '').split(','))],
+    )
+
+
+def _month_days(year: int, month: int, rule: _Rule, default_day: int) -> List[date]:
+    """Дни месяца по BYMONTHDAY/BYDAY (без них - день месяца DTSTART)."""
+    first = date(year, month, 1)
+    length = ((first.replace(day=28) + timedelta(days=4)).replace(day=1) - first).days
+    days = set()
+    if rule.by_month_day:
+        for day in rule.by_month_day:
+            day = day if day > 0 else length + day + 1
+            if 1 <= day <= length:
+                days.add(day)
+    if rule.by_day:
+        weekday_days = set()
+        for ordinal, weekday in rule.by_day:
+            matching = [day for day in range(1 + (weekday - first.weekday()) % 7, length + 1, 7)]
+            if ordinal == 0:
+                weekday_days.update(matching)
+            elif -len(matching) <= ordinal <= len(matching) and ordinal:
+                weekday_days.add(matching[ordinal - 1 if ordinal > 0 else ordinal])
+        days = days & weekday_days if rule.by_month_day else weekday_days
+    if not rule.by_month_day and not rule.by_day and default_day <= length:
+        days.add(default_day)
+    return [date(year, month, day) for day in sorted(days)]
+
+
+def _period_start(dtstart: date, rule: _Rule, k: int) -> date:
+    """Первый день k-го периода правила."""
+    step = k * rule.interval
+    if rule.freq == 'DAILY':
+        return dtstart + timedelta(days=step)
+    if rule.freq == 'WEEKLY':
+        return dtstart - timedelta(days=dtstart.weekday()) + timedelta(weeks=step)
+    if rule.freq == 'MONTHLY':
+        year, month = divmod(dtstart.month - 1 + step, 12)
+        return date(min(dtstart.year + year, date.max.year), month + 1, 1)
+    return date(min(dtstart.year + step, date.max.year), 1, 1)
+
+
+def _period_days(dtstart: date, rule: _Rule, k: int) -> List[date]:
+    """Кандидаты k-го периода правила (без учета DTSTART, COUNT и UNTIL)."""
+    step = k * rule.interval
+    if rule.freq == 'DAILY':
+        day = dtstart + timedelta(days=step)
+        if rule.by_month and day.month not in rule.by_month:
+            return []
+        if rule.by_month_day and day.day not in rule.by_month_day:
+            return []
+        if rule.by_day and day.weekday() not in {weekday for _, weekday in rule.by_day}:
+            return []
+        return [day]
+    if rule.freq == 'WEEKLY':
+        week = dtstart - timedelta(days=dtstart.weekday()) + timedelta(weeks=step)
+        weekdays = sorted({weekday for _, weekday in rule.by_day}) or [dtstart.weekday()]
+        days = [week + timedelta(days=weekday) for weekday in weekdays]
+        return [day for day in days if not rule.by_month or day.month in rule.by_month]
+    if rule.freq == 'MONTHLY':
+        year, month = divmod(dtstart.month - 1 + step, 12)
+        if rule.by_month and month + 1 not in rule.by_month:
+            return []
+        return _month_days(dtstart.year + year, month + 1, rule, dtstart.day)
+    if rule.freq == 'YEARLY':
+        year = dtstart.year + step
+        if year > date.max.year:
+            return []
+        if rule.by_day and not rule.by_month and not rule.by_month_day:
+            # BYDAY без BYMONTH - номер дня недели в году (20MO - 20-й понедельник)
+            first = date(year, 1, 1)
+            length = (date(year + 1, 1, 1) - first).days if year < date.max.year else 365
+            days = set()
+            for ordinal, weekday in rule.by_day:
+                matching = list(range((weekday - first.weekday()) % 7, length, 7))
+                if ordinal == 0:
+                    days.update(matching)
+                elif -len(matching) <= ordinal <= len(matching):
+                    days.add(matching[ordinal - 1 if ordinal > 0 else ordinal])
+            return [first + timedelta(days=day) for day in sorted(days)]
+        days = []
+        for month in sorted(rule.by_month) or [dtstart.month]:
+            days.extend(_month_days(year, month, rule, dtstart.day))
+        return days
+    return []
+
+
+def _at(day: date, dtstart: Moment) -> Moment:
+    return datetime.combine(day, dtstart.time()) if isinstance(dtstart, datetime) else day
+
+
+def _occurrences(dtstart: Moment, duration: timedelta, rule: _Rule, start: date, end: date) -> Iterator[Moment]:
+    """Начала вхождений правила, занимающих хотя бы одну ночь окна [start, end)."""
+    if rule.freq not in PERIOD_DAYS:
+        # HOURLY и чаще для календаря занятости не разворачиваются: только первое вхождение
+        yield dtstart
+        return
+
+    until = rule.until
+    if until is not None and isinstance(dtstart, datetime) and not isinstance(until, datetime):
+        until = datetime.combine(until, time.max)
+    elif until is not None and not isinstance(dtstart, datetime) and isinstance(until, datetime):
+        until = until.date()
+
+    first_day = _day(dtstart)
+    k = 0
+    if rule.count is None:
+        # Без COUNT номер вхождения не важен: перематываем годы истории сразу к окну
+        lead = (start - first_day).days - duration.days - 1
+        k = max(lead // (PERIOD_DAYS[rule.freq] * rule.interval) - 1, 0)
+
+    produced = 0
+    for k in range(k, k + MAX_RECURRENCE_PERIODS):
+        if _period_start(first_day, rule, k) >= end:
+            return
+        for day in _period_days(first_day, rule, k):
+            if day < first_day:
+                continue
+            moment = _at(day, dtstart)
+            if until is not None and moment > until:
+                return
+            if day >= end:
+                return
+            produced += 1
+            if rule.count is not None and produced > rule.count:
+                return
+            if _nights(moment, moment + duration)[1] > start:
+                yield moment
+
+
+class _Master(NamedTuple):
+    uid: str
+    dtstart: Moment
+    duration: timedelta
+    rule: Optional[_Rule]
+    exdates: Set[date]
+    rdates: List[Moment]
+
+
+def _clip(uid: str, moment: Moment, duration: timedelta, start: date, end: date) -> Optional[ICalEvent]:
+    first, last = _nights(moment, moment + duration)
+    first, last = max(first, start), min(last, end)
+    return ICalEvent(uid, first, last) if first < last else None
+
+
+def parse_events(lines: Iterable[str], start: date, end: date, tz: Optional[tzinfo] = None) -> Iterator[ICalEvent]:
+    """Занятые периоды VEVENT календаря внутри окна [start, end), по мере чтения строк.
+
+    lines - склеенные строки (iter_lines). Обычные события отдаются сразу; повторяющиеся
+    (RRULE/RDATE) запоминаются как правила и разворачиваются в конце, когда известны
+    все измененные (RECURRENCE-ID) и отмененные вхождения. Отмененные события
+    (STATUS:CANCELLED) и события с ошибками в датах пропускаются.
+    """
+    lines = iter(lines)
+    for line in lines:
+        line = line.strip().lstrip('\ufeff')
+        if line:
+            if line.upper() != 'BEGIN:VCALENDAR':
+                raise ICalError('Ответ не является iCal календарем')
+            break
+    else:
+        raise ICalError('Пустой календарь')
+
+    masters: List[_Master] = []
+    overridden: Dict[str, Set[date]] = {}
+    event = None
+    depth = 0  # вложенные компоненты VEVENT (VALARM) пропускаются
+    for line in lines:
+        name = _property_name(line)
+        if name in ('BEGIN', 'END'):
+            value = line[len(name) + 1:]
+        elif event is None or depth or name not in EVENT_PROPERTIES:
+            # Описания, участники и прочие свойства не разбираются
+            continue
+        else:
+            _, params, value = _split_property(line)
+
+        if name == 'BEGIN':
+            if event is not None:
+                depth += 1
+            elif value.strip().upper() == 'VEVENT':
+                event = {'EXDATE': [], 'RDATE': []}
+            continue
+        if event is None:
+            continue
+        if name == 'END':
+            if depth:
+                depth -= 1
+                continue
+            if value.strip().upper() == 'VEVENT':
+                parsed = _finish_event(event, tz)
+                event = None
+                if parsed is None:
+                    continue
+                uid, dtstart, duration, cancelled, recurrence_id, rule, exdates, rdates = parsed
+                if recurrence_id is not None:
+                    overridden.setdefault(uid, set()).add(recurrence_id)
+                if cancelled:
+                    continue
+                if rule is not None or rdates:
+                    masters.append(_Master(uid, dtstart, duration, rule, exdates, rdates))
+                    continue
+                clipped = _clip(uid, dtstart, duration, start, end)
+                if clipped:
+                    yield clipped
+            continue
+        if name in ('EXDATE', 'RDATE'):
+            event[name].append((params, value))
+        else:
+            event[name] = (params, value)
+
+    for master in masters:
+        skip = master.exdates | overridden.get(master.uid, set())
+        moments = set(master.rdates)
+        if master.rule is not None:
+            moments.update(_occurrences(master.dtstart, master.duration, master.rule, start, end))
+        else:
+            moments.add(master.dtstart)
+        for moment in sorted(moments, key=_day):
+            if _day(moment) in skip:
+                continue
+            clipped = _clip(master.uid, moment, master.duration, start, end)
+            if clipped:
+                yield clipped
+
+
+def _finish_event(event: dict, tz: Optional[tzinfo]):
+    """Значения свойств события; None - событие без DTSTART или с ошибками в датах."""
+    if 'DTSTART' not in event:
+        return None
+    try:
+        dtstart = _parse_moment(event['DTSTART'][1], event['DTSTART'][0], tz)
+        if 'DTEND' in event:
+            dtend = _parse_moment(event['DTEND'][1], event['DTEND'][0], tz)
+            if isinstance(dtend, datetime) != isinstance(dtstart, datetime):
+                dtend = _day(dtend) if not isinstance(dtstart, datetime) else datetime.combine(dtend, time())
+            duration = dtend - dtstart
+        elif 'DURATION' in event:
+            duration = _parse_duration(event['DURATION'][1])
+        else:
+            duration = timedelta(days=1) if not isinstance(dtstart, datetime) else timedelta(0)
+        duration = max(duration, timedelta(0))
+
+        recurrence_id = None
+        if 'RECURRENCE-ID' in event:
+            recurrence_id = _day(_parse_moment(event['RECURRENCE-ID'][1], event['RECURRENCE-ID'][0], tz))
+        rule = _parse_rule(event['RRULE'][1], tz) if 'RRULE' in event and recurrence_id is None else None
+        exdates = {
+            _day(_parse_moment(item, params, tz))
+            for params, value in event['EXDATE'] for item in value.split(',') if item.strip()
+        }
+        rdates = [
+            _parse_moment(item, params, tz)
+            for params, value in event['RDATE'] for item in value.split(',')
+            if item.strip() and params.get('VALUE', '').upper() != 'PERIOD'
+        ]
+    except (ValueError, KeyError, OverflowError):
+        return None
+    uid = event.get('UID', ({}, ''))[1].strip()
+    cancelled = event.get('STATUS', ({}, ''))[1].strip().upper() == 'CANCELLED'
+    return uid, dtstart, duration, cancelled, recurrence_id, rule, exdates, rdates
+
+
+# --- Выгрузка ---
+
+def _escape_text(value: str) -> str:
+    return (value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def _fold(line: str) -> str:
+    """Перенос строки длиннее 75 байт (RFC 5545, 3.1), не разрывая символы UTF-8."""
+    if len(line.encode()) <= 75:
+        return line
+    parts, current, size = [], '', 0
+    for char in line:
+        length = len(char.encode())
+        if size + length > 75:
+            parts.append(current)
+            current, size = ' ', 1
+        current += char
+        size += length
+    parts.append(current)
+    return '\r\n'.join(parts)
+
+
+def render_calendar(name: str, uid_prefix: str, ranges: Iterable, stamp: datetime,
+                    summary: str = 'Недоступно', uid_domain: str = 'housing') -> bytes:
+    """iCal календарь занятых периодов [начало, конец) - события на весь день.
+
+    UID события строится из дат периода, DTSTAMP - stamp: одинаковые периоды дают
+    одинаковый календарь байт в байт (на этом держится ETag выгрузки).
+    """
+    stamp = stamp.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    lines = [
+        'BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//housing//listings calendar//RU', 'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH', f'X-WR-CALNAME:{_escape_text(name)}',
+    ]
+    summary = _escape_text(summary)
+    for start, end in ranges:
+        lines += [
+            'BEGIN:VEVENT',
+            f'UID:{uid_prefix}-{start:%Y%m%d}-{end:%Y%m%d}@{uid_domain}',
+            f'DTSTAMP:{stamp}',
+            f'DTSTART;VALUE=DATE:{start:%Y%m%d}',
+            f'DTEND;VALUE=DATE:{end:%Y%m%d}',
+            f'SUMMARY:{summary}',
+            'TRANSP:OPAQUE',
+            'END:VEVENT',
+        ]
+    lines.append('END:VCALENDAR')
+    return ('\r\n'.join(_fold(line) for line in lines) + '\r\n').encode()
@@ -0,0 +1,154 @@
+# listings/images.py
+"""
+Загрузка фотографий объектов
+
+inspect_image выполняется в процессах пула (ProcessPoolExecutor) и не использует
+настройки и модели Django: только чтение файла, SHA-256 содержимого и проверка изображения Pillow.
+Файлы в хранилище называются по хэшу (photos/ab/abcdef...jpg), поэтому одинаковое
+фото записывается один раз, сколько бы объектов его ни использовали.
+
+Производные главного фото (уменьшенные копии в WebP и JPEG для srcset) строятся
+render_variants - тоже без Django, чтобы работать в пуле процессов, - и сохраняются
+save_variants рядом с исходным именем: variants/<имя>_<ширина>.<формат>.
+"""
+import hashlib
+import io
+import os
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+from django.core.files import File
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Ширины производных (px); больше ширины оригинала не увеличиваются
+VARIANT_WIDTHS = (320, 640, 1280)
+# Формат производной: (формат Pillow, расширение, параметры сохранения)
+VARIANT_FORMATS = {
+    'webp': ('WEBP', '.webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', '.jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+class ImageInfo(NamedTuple):
+    path: str
+    content_hash: str
+    size: int
+    width: Optional[int]
+    height: Optional[int]
+    extension: str
+
+    @property
+    def storage_name(self) -> str:
+        """Имя файла в хранилище: одинаковое содержимое - одинаковое имя."""
+        return f'photos/{self.content_hash[:2]}/{self.content_hash}{self.extension}'
+
+
+def file_hash(file) -> str:
+    """SHA-256 содержимого файла Django (загруженного или из хранилища)."""
+    digest = hashlib.sha256()
+    for chunk in file.chunks(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def inspect_image(path: str) -> ImageInfo:
+    """Хэш, размер и разрешение файла; ValueError, если это не изображение."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+            size += len(chunk)
+        f.seek(0)
+        try:
+            with Image.open(f) as image:
+                width, height = image.size
+                image.verify()
+        except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+            raise ValueError(f'{path}: файл не является изображением ({e})')
+
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.jpeg':
+        extension = '.jpg'
+    return ImageInfo(path, digest.hexdigest(), size, width, height, extension)
+
+
+def store_image(info: ImageInfo, storage) -> Tuple[str, bool]:
+    """Записывает файл в хранилище, если его там еще нет: (имя в хранилище, записан ли файл).
+
+    Хранилище может записать файл под другим именем (недопустимые символы, имя заняли
+    между exists и save), поэтому ссылаться нужно на возвращенное имя.
+    """
+    name = info.storage_name
+    if storage.exists(name):
+        return name, False
+    with open(info.path, 'rb') as f:
+        return storage.save(name, File(f, name=name)), True
+
+
+def variant_widths(width: int):
+    """Ширины производных для оригинала шириной width."""
+    widths = [w for w in VARIANT_WIDTHS if w < width]
+    if width <= VARIANT_WIDTHS[-1]:
+        widths.append(width)
+    return widths
+
+
+def variant_name(source_name: str, fmt: str, width: int) -> str:
+    stem = os.path.splitext(source_name)[0]
+    return f'variants/{stem}_{width}{VARIANT_FORMATS[fmt][1]}'
+
+
+def render_variants(data: bytes) -> Dict[str, Dict[int, bytes]]:
+    """Производные изображения: {формат: {ширина: байты файла}}."""
+    with Image.open(io.BytesIO(data)) as image:
+        widths = variant_widths(image.width)
+        # JPEG декодируется сразу в уменьшенном масштабе (1/2, 1/4, 1/8), если это не меньше нужного
+        target = widths[-1]
+        image.draft('RGB', (target, max(1, image.height * target // image.width)))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if image.mode in ('LA', 'PA') or 'transparency' in image.info else 'RGB')
+
+        rendered = {fmt: {} for fmt in VARIANT_FORMATS}
+        for width in sorted(widths, reverse=True):
+            height = max(1, round(image.height * width / image.width))
+            resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+            for fmt, (pil_format, _, params) in VARIANT_FORMATS.items():
+                target_image = resized.convert('RGB') if pil_format == 'JPEG' and resized.mode != 'RGB' else resized
+                buffer = io.BytesIO()
+                target_image.save(buffer, pil_format, **params)
+                rendered[fmt][width] = buffer.getvalue()
+            # Следующая (меньшая) ширина уменьшается из текущей: дешевле, чем из оригинала
+            image = resized
+    return rendered
+
+
+def save_variants(source_name: str, rendered: Dict[str, Dict[int, bytes]], storage) -> dict:
+    """Записывает производные в хранилище; возвращает значение для Listing.photo_variants."""
+    variants = {'source': source_name}
+    for fmt, by_width in rendered.items():
+        variants[fmt] = {}
+        for width, content in sorted(by_width.items()):
+            name = variant_name(source_name, fmt, width)
+            if not storage.exists(name):
+                name = storage.save(name, ContentFile(content))
+            variants[fmt][str(width)] = name
+    return variants
+
+
+def srcset(variants: Optional[dict], source: Optional[str], url: Callable[[str], str]) -> dict:
+    """{формат: 'url 320w, url 640w, ...'} по Listing.photo_variants.
+
+    {} - производных нет или они построены для другого фото (главное фото заменили,
+    новые производные еще не готовы).
+    """
+    if not variants or not source or variants.get('source') != source:
+        return {}
+    return {
+        fmt: ', '.join(f'{url(name)} {width}w' for width, name in sorted(variants[fmt].items(), key=lambda item: int(item[0])))
+        for fmt in VARIANT_FORMATS if variants.get(fmt)
+    }
@@ -0,0 +1,44 @@
+# listings/management/commands/benchmark.py
+"""
+Management команда для замеров производительности
+
+Использование:
+    python manage.py benchmark pricing
+    python manage.py benchmark pricing --size 1000 --repeat 5
+"""
+from django.core.management.base import BaseCommand
+from listings.benchmarks import SCENARIOS
+
+
+class Command(BaseCommand):
+    help = 'Запускает сценарий замера производительности'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'scenario',
+            choices=sorted(SCENARIOS),
+            help='Название сценария',
+        )
+        parser.add_argument(
+            '--size',
+            type=int,
+            help='Размер набора данных (по умолчанию свой для каждого сценария)',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=3,
+            help='Сколько раз повторять каждый замер (берется лучший результат)',
+        )
+
+    def handle(self, *args, **options):
+        func = SCENARIOS[options['scenario']]
+        size = options['size'] or func.default_size
+
+        self.stdout.write('='*60)
+        self.stdout.write(self.style.SUCCESS(f'Сценарий: {options["scenario"]} (размер: {size})'))
+        self.stdout.write('='*60)
+
+        func(self, size, options['repeat'])
+
+        self.stdout.write('\n' + '='*60)
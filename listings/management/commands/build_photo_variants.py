@@ -0,0 +1,102 @@
+# listings/management/commands/build_photo_variants.py
+"""
+Management команда для построения производных главного фото (WebP и JPEG 320/640/1280 px)
+
+Использование:
+    python manage.py build_photo_variants
+    python manage.py build_photo_variants --workers 4
+    python manage.py build_photo_variants --listing-id 42 --force
+
+Обрабатываются объекты, у которых производных нет или они построены для другого фото.
+Файлы читает основной процесс, уменьшение и кодирование выполняются в пуле процессов;
+в работе одновременно не больше 2 * --workers изображений, поэтому память не растет
+с размером каталога. Новые и замененные фото обрабатываются сами после сохранения
+объекта, команда нужна для уже загруженных фото и после смены набора размеров (--force).
+"""
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+from listings.images import render_variants
+from listings.models import Listing
+from listings.services import PhotoVariantService
+
+
+class Command(BaseCommand):
+    help = 'Строит уменьшенные копии главного фото объектов (WebP/JPEG) для srcset'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Сколько процессов обрабатывают изображения (по умолчанию: число CPU)',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Перестроить производные и для объектов, у которых они уже есть',
+        )
+        parser.add_argument(
+            '--listing-id',
+            type=int,
+            action='append',
+            dest='listing_ids',
+            help='Только объект с этим ID (можно указать несколько раз)',
+        )
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        queryset = Listing.objects.all()
+        if options['listing_ids']:
+            queryset = queryset.filter(pk__in=options['listing_ids'])
+
+        stats = {'updated': 0, 'changed': 0, 'failed': 0, 'bytes': 0}
+        started = time.perf_counter()
+
+        def collect(future, listing_id, photo):
+            try:
+                rendered = future.result()
+            except Exception as e:
+                stats['failed'] += 1
+                self.stdout.write(self.style.WARNING(f'[!] Объект {listing_id}: не удалось обработать {photo} ({e})'))
+                return
+            stats['bytes'] += sum(len(content) for by_width in rendered.values() for content in by_width.values())
+            if PhotoVariantService.save(listing_id, photo, rendered):
+                stats['updated'] += 1
+            else:
+                # Главное фото заменили во время обработки; новое обработает сигнал сохранения
+                stats['changed'] += 1
+            done = stats['updated'] + stats['changed'] + stats['failed']
+            if done % 100 == 0:
+                self.stdout.write(f'  {done}')
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            in_flight = {}
+            for listing_id, photo in PhotoVariantService.pending(queryset, force=options['force']):
+                if len(in_flight) >= 2 * workers:
+                    finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        collect(future, *in_flight.pop(future))
+                try:
+                    data = PhotoVariantService.read(photo)
+                except OSError as e:
+                    stats['failed'] += 1
+                    self.stdout.write(self.style.WARNING(f'[!] Объект {listing_id}: файл {photo} недоступен ({e})'))
+                    continue
+                in_flight[pool.submit(render_variants, data)] = (listing_id, photo)
+            for future in wait(in_flight).done:
+                collect(future, *in_flight.pop(future))
+
+        elapsed = time.perf_counter() - started
+        processed = stats['updated'] + stats['changed']
+        rate = f' ({processed / elapsed:,.1f} фото/с)' if elapsed and processed else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'\n[OK] Обновлено объектов: {stats["updated"]} за {elapsed:.1f} с{rate}, '
+            f'записано {stats["bytes"] / 1024 / 1024:.1f} МБ (процессов: {workers})'
+        ))
+        if stats['changed']:
+            self.stdout.write(f'Фото сменилось во время обработки: {stats["changed"]}')
+        if stats['failed']:
+            self.stdout.write(self.style.WARNING(f'[WARNING] Не удалось обработать: {stats["failed"]}'))
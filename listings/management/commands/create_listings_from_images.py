@@ -5,21 +5,26 @@ Management команда для создания объявлений из па
 Использование:
     python manage.py create_listings_from_images
     python manage.py create_listings_from_images --path img
+    python manage.py create_listings_from_images --workers 4
+
+Все фото папки становятся фото объекта (ListingPhoto), первое по имени - главным.
+Изображения хэшируются и проверяются в пуле процессов; одинаковые файлы хранятся
+один раз (имя файла - хэш содержимого) и записываются напрямую через хранилище.
 """
 import os
-import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 from django.core.management.base import BaseCommand
-from django.core.files import File
 from django.contrib.auth.models import User
-from django.conf import settings
-from listings.models import Listing
+from django.db import transaction
+from listings.images import IMAGE_EXTENSIONS, inspect_image, store_image
+from listings.models import Listing, ListingPhoto
 # Временно отключено
 # from listings.models import Listing, Amenity, ListingAmenity
 # Amenity = None
 # ListingAmenity = None
 from decimal import Decimal
-from django.utils import timezone
 
 
 class Command(BaseCommand):
@@ -38,6 +43,12 @@ class Command(BaseCommand):
             default='test_owner',
             help='Имя пользователя для владельца',
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Сколько процессов хэшируют и проверяют изображения (по умолчанию: число CPU)',
+        )
 
     def handle(self, *args, **options):
         images_path = Path(options['path'])
@@ -227,31 +238,60 @@ class Command(BaseCommand):
             self.stdout.write(self.style.WARNING(f'Не найдено папок с "house" в названии в {images_path}'))
             return
 
-        created_count = 0
+        # Папки, для которых объявление уже есть, не сканируются
+        pending = []
         skipped_count = 0
-
         for folder in folders:
             folder_name = folder.name
-            
-            # Проверяем, не существует ли уже объявление с таким названием
-            title = f'Дом "{folder_name.replace(" house", "")}"'
             if Listing.objects.filter(owner=user, title__icontains=folder_name.replace(" house", "")).exists():
                 self.stdout.write(self.style.WARNING(f'[!] Объявление для {folder_name} уже существует, пропускаем'))
                 skipped_count += 1
                 continue
 
-            # Находим первое изображение в папке
-            image_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.webp']
-            images = [f for f in folder.iterdir() 
-                     if f.is_file() and f.suffix.lower() in image_extensions]
-            
+            images = sorted(f for f in folder.iterdir() if f.is_file() and f.suffix.lower() in IMAGE_EXTENSIONS)
             if not images:
                 self.stdout.write(self.style.WARNING(f'[!] В папке {folder_name} нет изображений'))
                 continue
+            pending.append((folder, images))
+
+        started = time.perf_counter()
+
+        # Хэширование и проверка изображений - в пуле процессов
+        paths = [str(image) for _, images in pending for image in images]
+        infos = {}
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {pool.submit(inspect_image, path): path for path in paths}
+            for future in as_completed(futures):
+                try:
+                    infos[futures[future]] = future.result()
+                except ValueError as e:
+                    self.stdout.write(self.style.WARNING(f'[!] {e}'))
+        scanned = time.perf_counter()
+
+        # Каждый уникальный файл записывается в хранилище один раз, без промежуточной копии
+        storage = ListingPhoto._meta.get_field('image').storage
+        unique = {info.content_hash: info for info in infos.values()}
+        names, written = {}, []
+        for content_hash, info in unique.items():
+            names[content_hash], saved = store_image(info, storage)
+            if saved:
+                written.append(info)
+        stored = time.perf_counter()
+
+        created_count = 0
+        for folder, images in pending:
+            folder_name = folder.name
+            title = f'Дом "{folder_name.replace(" house", "")}"'
+            # Повторы внутри папки отбрасываются, порядок - по имени файла
+            photos = {}
+            for image in images:
+                info = infos.get(str(image))
+                if info is not None:
+                    photos.setdefault(info.content_hash, info)
+            photos = list(photos.values())
+            if not photos:
+                continue
 
-            # Берем первое изображение
-            source_image = images[0]
-            
             # Получаем конфигурацию или используем значения по умолчанию
             config = listings_config.get(folder_name, {
                 'property_type': 'house',
@@ -267,7 +307,7 @@ class Command(BaseCommand):
                 'longitude': Decimal('76.889709'),
             })
             
-            description = descriptions.get(folder_name, f'''Уютный дом для комфортного отдыха. 
+            description = descriptions.get(folder_name, '''Уютный дом для комфортного отдыха. 
 
 Идеально подходит для семейного отдыха или деловой поездки. 
 Все удобства для комфортного проживания.''')
@@ -302,25 +342,24 @@ class Command(BaseCommand):
                 'is_published': True,
                 'is_verified': True,
                 'moderation_status': 'approved',
+                'moderation_notes': '',
+                # Главное фото - первое фото папки, файл уже в хранилище
+                'photo_main': names[photos[0].content_hash],
             }
 
-            listing = Listing.objects.create(**listing_data)
-
-            # Копируем изображение
-            from django.utils import timezone
-            today = timezone.now()
-            media_root = Path(settings.MEDIA_ROOT)
-            target_path = media_root / 'photos' / str(today.year) / str(today.month).zfill(2) / str(today.day).zfill(2)
-            target_path.mkdir(parents=True, exist_ok=True)
-            
-            target_file = target_path / source_image.name
-            
-            # Копируем файл
-            shutil.copy2(source_image, target_file)
-            
-            # Присваиваем изображение объекту
-            with open(target_file, 'rb') as f:
-                listing.photo_main.save(source_image.name, File(f), save=True)
+            with transaction.atomic():
+                listing = Listing.objects.create(**listing_data)
+                ListingPhoto.objects.bulk_create([
+                    ListingPhoto(
+                        listing=listing,
+                        image=names[info.content_hash],
+                        content_hash=info.content_hash,
+                        width=info.width,
+                        height=info.height,
+                        position=position,
+                    )
+                    for position, info in enumerate(photos)
+                ])
 
             # Добавляем удобства (временно отключено)
             # amenity_names = ['Wi-Fi', 'Парковка', 'Кухня', 'Кондиционер']
@@ -332,13 +371,25 @@ class Command(BaseCommand):
             #         )
 
             self.stdout.write(self.style.SUCCESS(f'[+] Создано объявление: {title} (ID: {listing.id})'))
-            self.stdout.write(f'    Фото: {source_image.name}')
+            self.stdout.write(f'    Фото: {len(photos)}, главное: {Path(photos[0].path).name}')
             created_count += 1
+        finished = time.perf_counter()
 
+        total_bytes = sum(info.size for info in infos.values())
+        written_bytes = sum(info.size for info in written)
         self.stdout.write('\n' + '='*50)
         self.stdout.write(self.style.SUCCESS(f'Готово! Создано объявлений: {created_count}'))
         if skipped_count > 0:
             self.stdout.write(self.style.WARNING(f'Пропущено (уже существуют): {skipped_count}'))
+        self.stdout.write(
+            f'Фото: {len(infos)} ({total_bytes / 2**20:.1f} МБ), уникальных: {len(unique)}, '
+            f'записано файлов: {len(written)} ({written_bytes / 2**20:.1f} МБ), '
+            f'уже были в хранилище: {len(unique) - len(written)}'
+        )
+        self.stdout.write(
+            f'Время: хэширование {scanned - started:.2f} с (процессов: {options["workers"]}), '
+            f'запись {stored - scanned:.2f} с, БД {finished - stored:.2f} с, всего {finished - started:.2f} с'
+        )
         self.stdout.write('='*50)
 
     # Временно отключено
@@ -5,14 +5,120 @@ Management команда для создания тестовых данных
 Использование:
     python manage.py create_test_data
     python manage.py create_test_data --with-photo  # Создать с placeholder фото
+    python manage.py create_test_data --listings 1000000 --bookings 3000000 --reviews 1000000 --seed 1
+
+С --listings команда генерирует набор данных для замеров: объекты в пяти городах
+(половина - в Алматы) с ценами и координатами вокруг центра города, непересекающиеся
+брони за год до и после сегодняшнего дня, закрытые владельцем даты и отзывы на
+завершенные брони. Строки пишутся порциями по --batch-size (executemany, каждая порция -
+в своей транзакции), миллион объектов - за несколько минут на SQLite. Один и тот же
+--seed дает те же данные (даты отсчитываются от дня запуска); владельцы и гости -
+пользователи seed<S>_owner_<N> / seed<S>_guest_<N>.
 """
-from django.core.management.base import BaseCommand
+import random
+import time
+from datetime import date, datetime, timedelta
+from typing import NamedTuple, Optional
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth.models import User
-from listings.models import Listing
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from listings.benchmarks import CITY_CENTERS
+from listings.models import Availability, Booking, Listing, Review, listings_bulk_updated
+from listings.services import PricingService, RatingService
+from listings.signals import calendar_changed
 # Временно отключено
 # from listings.models import Listing, Amenity, ListingAmenity
 from decimal import Decimal
 
+# Город: (доля объектов, медианная цена за ночь, разброс координат в градусах)
+SCALE_CITIES = {
+    'Алматы': (0.50, 18000, 0.06),
+    'Астана': (0.22, 16000, 0.05),
+    'Шымкент': (0.11, 11000, 0.04),
+    'Караганда': (0.09, 10000, 0.04),
+    'Актау': (0.08, 14000, 0.03),
+}
+# Тип: (доля, название в заголовке, спальни, множитель цены)
+PROPERTY_TYPES = {
+    'apartment': (0.55, 'Квартира', (1, 2, 2, 3, 4), 1.0),
+    'studio': (0.15, 'Студия', (1,), 0.8),
+    'room': (0.12, 'Комната', (1,), 0.5),
+    'house': (0.13, 'Дом', (2, 3, 3, 4, 5), 1.6),
+    'villa': (0.05, 'Вилла', (3, 4, 5, 6), 3.0),
+}
+STREETS = ('Абая', 'Достык', 'Толе би', 'Сатпаева', 'Жибек Жолы', 'Аль-Фараби', 'Назарбаева', 'Гагарина',
+           'Тимирязева', 'Розыбакиева', 'Кабанбай батыра', 'Республики', 'Мангилик Ел', 'Кенесары')
+FEATURES = ('Быстрый Wi-Fi', 'Кондиционер', 'Оборудованная кухня', 'Стиральная машина', 'Бесплатная парковка',
+            'Вид на горы', 'Рядом метро', 'Балкон', 'Рабочее место', 'Детская кроватка')
+# Оценки отзывов: у реальных площадок большинство оценок - 4 и 5
+RATING_WEIGHTS = (3, 4, 10, 28, 55)
+# Брони и закрытые даты распределяются по [сегодня - 365, сегодня + 365)
+SCALE_WINDOW_DAYS = 365
+CITY_NAMES, CITY_WEIGHTS = list(SCALE_CITIES), [value[0] for value in SCALE_CITIES.values()]
+TYPE_NAMES, TYPE_WEIGHTS = list(PROPERTY_TYPES), [value[0] for value in PROPERTY_TYPES.values()]
+LIST_DATE_FIELD = Listing._meta.get_field('list_date')
+CENT = Decimal('0.01')
+
+
+class ScalePrices(NamedTuple):
+    """Поля цены объекта для PricingService без создания экземпляра Listing"""
+    base_price: Decimal
+    weekend_price: Optional[Decimal]
+    weekly_discount: int
+    monthly_discount: int
+
+
+class RowWriter:
+    """Накопитель строк модели с явными id, записываемых одним executemany на порцию.
+
+    bulk_create компилирует SQL и готовит каждое значение каждой строки; здесь INSERT
+    одной строки строится один раз, значения полей по умолчанию (и auto_now) готовятся
+    один раз, а переданные значения уже имеют вид для БД (числа, строки, Decimal, date).
+    """
+
+    def __init__(self, model):
+        fields = model._meta.concrete_fields
+        now = timezone.now()
+        qn = connection.ops.quote_name
+        self.positions = {field.attname: i for i, field in enumerate(fields)}
+        self.defaults = [
+            field.get_db_prep_save(
+                now if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+                else field.get_default(),
+                connection,
+            )
+            for field in fields
+        ]
+        self.sql = (
+            f'INSERT INTO {qn(model._meta.db_table)} ({", ".join(qn(field.column) for field in fields)}) '
+            f'VALUES ({", ".join(["%s"] * len(fields))})'
+        )
+        self.pk_position = self.positions[model._meta.pk.attname]
+        self.next_pk = (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+        self.rows = []
+        self.written = 0
+
+    def add(self, **values):
+        """Добавляет строку; возвращает ее id."""
+        row = self.defaults.copy()
+        for name, value in values.items():
+            row[self.positions[name]] = value
+        pk = row[self.pk_position] = self.next_pk
+        self.next_pk += 1
+        self.rows.append(row)
+        return pk
+
+    def flush(self):
+        if self.rows:
+            with connection.cursor() as cursor:
+                cursor.executemany(self.sql, self.rows)
+            self.written += len(self.rows)
+            self.rows = []
+
 
 class Command(BaseCommand):
     help = 'Создает тестовые данные: пользователя, удобства, объект жилья'
@@ -41,8 +147,41 @@ class Command(BaseCommand):
             default='testpass123',
             help='Пароль владельца',
         )
+        parser.add_argument(
+            '--listings',
+            type=int,
+            default=0,
+            help='Сгенерировать столько объектов для замеров (вместо одного демонстрационного)',
+        )
+        parser.add_argument(
+            '--bookings',
+            type=int,
+            default=0,
+            help='Сколько бронирований распределить по сгенерированным объектам',
+        )
+        parser.add_argument(
+            '--reviews',
+            type=int,
+            default=0,
+            help='Сколько отзывов оставить на завершенные бронирования',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Зерно генератора: одинаковое зерно дает одинаковые данные (по умолчанию: 0)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Сколько объектов записывать в одной транзакции (по умолчанию: 5000)',
+        )
 
     def handle(self, *args, **options):
+        if options['listings'] or options['bookings'] or options['reviews']:
+            return self.create_scale_data(options)
+
         username = options['username']
         email = options['email']
         password = options['password']
@@ -67,7 +206,7 @@ class Command(BaseCommand):
             self.stdout.write(self.style.WARNING(f'⚠ Пользователь {username} уже существует'))
 
         # 2. Создаем удобства (временно отключено)
-        created_amenities = []
+        # created_amenities = []
         # amenities_data = [...]
         # for amenity_data in amenities_data:
         #     amenity, created = Amenity.objects.get_or_create(...)
@@ -149,13 +288,216 @@ class Command(BaseCommand):
         self.stdout.write(f'\nОбъект ID: {listing.id}')
         self.stdout.write(f'Владелец: {user.username} ({user.email})')
         self.stdout.write(f'Пароль: {password}')
-        self.stdout.write(f'\nДля добавления фото:')
+        self.stdout.write('\nДля добавления фото:')
         self.stdout.write(f'1. Через админку: http://localhost:8000/admin/listings/listing/{listing.id}/change/')
         self.stdout.write(f'2. Через API: PUT /api/listings/{listing.id}/ (с токеном авторизации)')
-        self.stdout.write(f'\nДля входа в админку:')
-        self.stdout.write(f'URL: http://localhost:8000/admin/')
+        self.stdout.write('\nДля входа в админку:')
+        self.stdout.write('URL: http://localhost:8000/admin/')
         self.stdout.write(f'Логин: {username}')
         self.stdout.write(f'Пароль: {password}')
         self.stdout.write('\n')
 
+    def create_scale_data(self, options):
+        """Генерирует --listings объектов с бронями, закрытыми датами и отзывами порциями."""
+        total = options['listings']
+        if total <= 0:
+            raise CommandError('--bookings и --reviews распределяются по новым объектам: укажите --listings')
+        batch_size = max(1, options['batch_size'])
+        seed = options['seed']
+        rng = random.Random(seed)
+
+        # Хозяин в среднем сдает несколько объектов, гость бронирует несколько раз
+        owner_ids = self.scale_users(f'seed{seed}_owner', max(1, total // 20))
+        guest_ids = self.scale_users(f'seed{seed}_guest', max(10, options['bookings'] // 4))
+        self.stdout.write(f'Пользователи: владельцев {len(owner_ids)}, гостей {len(guest_ids)}')
+
+        writers = {model: RowWriter(model) for model in (Listing, Booking, Availability, Review)}
+        today = date.today()
+        stats = {'reviews_missing': 0}
+        started = time.perf_counter()
+        for start in range(0, total, batch_size):
+            end = min(start + batch_size, total)
+            # Доли броней и отзывов порции: в сумме ровно --bookings и --reviews
+            bookings = options['bookings'] * end // total - options['bookings'] * start // total
+            reviews = options['reviews'] * end // total - options['reviews'] * start // total
+            with transaction.atomic():
+                self.create_scale_batch(
+                    rng, writers, end - start, bookings, reviews + stats['reviews_missing'],
+                    owner_ids, guest_ids, today, stats,
+                )
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'  {end}/{total} ({end / elapsed:,.0f} объектов/с)')
+
+        # Как import_listing: строки записаны с явными ID, счетчики автоинкремента нужно сдвинуть
+        sequence_sql = connection.ops.sequence_reset_sql(no_style(), [User, *writers])
+        if sequence_sql:
+            with connection.cursor() as cursor:
+                for sql in sequence_sql:
+                    cursor.execute(sql)
+
+        elapsed = time.perf_counter() - started
+        counts = {model: writer.written for model, writer in writers.items()}
+        self.stdout.write(self.style.SUCCESS(
+            f'\n✓ Создано за {elapsed:.1f} с: объектов {counts[Listing]}, бронирований {counts[Booking]}, '
+            f'закрытых дат {counts[Availability]}, отзывов {counts[Review]}'
+        ))
+        # Пачки больше NIGHTLY_RATES_SYNC_LIMIT не пересчитываются сигналами
+        self.stdout.write('Цены ночей для поиска: python manage.py rebuild_nightly_rates')
+        if stats['reviews_missing']:
+            self.stdout.write(self.style.WARNING(
+                f'⚠ Завершенных бронирований не хватило на {stats["reviews_missing"]} отзывов: увеличьте --bookings'
+            ))
+
+    def scale_users(self, prefix, count):
+        """id пользователей prefix_0..prefix_<count-1>; недостающие создаются без пароля."""
+        usernames = [f'{prefix}_{i}' for i in range(count)]
+        existing = dict(User.objects.filter(username__startswith=f'{prefix}_').values_list('username', 'pk'))
+        writer = RowWriter(User)
+        password = make_password(None)
+        with transaction.atomic():
+            for username in usernames:
+                if username not in existing:
+                    existing[username] = writer.add(username=username, password=password)
+                    if len(writer.rows) >= 10000:
+                        writer.flush()
+            writer.flush()
+        return [existing[username] for username in usernames]
+
+    def create_scale_batch(self, rng, writers, count, booking_count, review_count, owner_ids, guest_ids, today, stats):
+        listing_ids, completed = [], []
+        prices = {}
+        midnight = timezone.make_aware(datetime.combine(today, datetime.min.time()))
+        for _ in range(count):
+            values = self.scale_listing(rng, owner_ids, midnight)
+            listing_id = writers[Listing].add(**values)
+            listing_ids.append(listing_id)
+            prices[listing_id] = ScalePrices(
+                values['base_price'], values['weekend_price'], values['weekly_discount'], values['monthly_discount'],
+            ), values['max_guests']
+
+        per_listing = [0] * count
+        for _ in range(booking_count):
+            per_listing[rng.randrange(count)] += 1
 
+        for listing_id, stays in zip(listing_ids, per_listing):
+            listing_prices, max_guests = prices[listing_id]
+            for check_in, check_out in self.scale_stays(rng, stays, today):
+                status = self.scale_status(rng, check_in, check_out, today)
+                guest_id = rng.choice(guest_ids)
+                # Особых цен дат у только что созданных объектов нет
+                total_price = PricingService.calculate_total_price(listing_prices, check_in, check_out, overrides={})
+                booking_id = writers[Booking].add(
+                    listing_id=listing_id,
+                    guest_id=guest_id,
+                    check_in=check_in,
+                    check_out=check_out,
+                    guests_count=rng.randint(1, max_guests),
+                    total_price=total_price.quantize(CENT),
+                    status=status,
+                    payment_status='paid' if status in ('completed', 'confirmed') else 'pending',
+                )
+                if status == 'completed':
+                    completed.append((booking_id, listing_id, guest_id))
+            # Треть владельцев закрывает несколько периодов вручную (ремонт, личное проживание)
+            if rng.random() < 0.3:
+                busy = set()
+                for _ in range(rng.randint(1, 3)):
+                    first = today + timedelta(days=rng.randrange(SCALE_WINDOW_DAYS))
+                    busy.update(first + timedelta(days=day) for day in range(rng.randint(1, 7)))
+                for day in sorted(busy):
+                    writers[Availability].add(listing_id=listing_id, date=day, is_available=False)
+
+        reviewed = rng.sample(completed, min(review_count, len(completed)))
+        for booking_id, listing_id, guest_id in reviewed:
+            writers[Review].add(booking_id=booking_id, listing_id=listing_id, reviewer_id=guest_id,
+                                **self.scale_review(rng))
+        stats['reviews_missing'] = review_count - len(reviewed)
+
+        for writer in writers.values():
+            writer.flush()
+        # Строки записаны в обход ORM: поисковый индекс, кэш ответов, агрегаты отзывов
+        # и битовые карты календаря обновляются так же, как после bulk_create и update()
+        listings_bulk_updated.send(sender=Listing, listing_ids=listing_ids, fields=set(), created=True)
+        if reviewed:
+            RatingService.recompute({listing_id for _, listing_id, _ in reviewed})
+        calendar_changed.send(sender=Booking, listing_ids=listing_ids)
+
+    @staticmethod
+    def scale_listing(rng, owner_ids, midnight):
+        """Значения полей объекта (как для RowWriter.add)."""
+        city = rng.choices(CITY_NAMES, weights=CITY_WEIGHTS)[0]
+        _, median_price, spread = SCALE_CITIES[city]
+        property_type = rng.choices(TYPE_NAMES, weights=TYPE_WEIGHTS)[0]
+        _, type_name, bedroom_choices, price_factor = PROPERTY_TYPES[property_type]
+        bedrooms = rng.choice(bedroom_choices)
+        lat, lng = CITY_CENTERS[city]
+        street = rng.choice(STREETS)
+        # Логнормальная цена: много объектов около медианы, длинный хвост дорогих
+        base_price = max(3000, round(median_price * price_factor * (0.8 + 0.25 * bedrooms) * rng.lognormvariate(0, 0.35), -2))
+        weekend_price = round(base_price * rng.uniform(1.1, 1.3), -2) if rng.random() < 0.6 else None
+        title = type_name if property_type == 'room' else f'{type_name} {bedrooms}-комн.'
+        return {
+            'owner_id': rng.choice(owner_ids),
+            'title': f'{title}, {city}, ул. {street}',
+            'description': '\n'.join(f'- {feature}' for feature in rng.sample(FEATURES, rng.randint(2, 6))),
+            'address': f'ул. {street}, {rng.randint(1, 300)}',
+            'city': city,
+            'latitude': Decimal(f'{lat + rng.gauss(0, spread):.6f}'),
+            'longitude': Decimal(f'{lng + rng.gauss(0, spread * 1.3):.6f}'),
+            'property_type': property_type,
+            'bedrooms': bedrooms,
+            'beds': bedrooms + rng.randint(0, 2),
+            'bathrooms': Decimal(rng.choice(('1.0', '1.0', '1.5', '2.0')) if bedrooms > 1 else '1.0'),
+            'sqft': max(12, int(bedrooms * rng.uniform(18, 35) + rng.uniform(10, 30))),
+            'max_guests': bedrooms * 2,
+            'base_price': Decimal(base_price),
+            'weekend_price': Decimal(weekend_price) if weekend_price else None,
+            'weekly_discount': rng.choice((0, 0, 5, 10, 15)),
+            'monthly_discount': rng.choice((0, 0, 15, 20, 30)),
+            'booking_type': rng.choice(('instant', 'request')),
+            'min_nights': rng.choice((1, 1, 1, 2, 3)),
+            'max_nights': rng.choice((30, 90, 365)),
+            'house_rules': '',
+            'is_published': rng.random() < 0.95,
+            'is_verified': rng.random() < 0.3,
+            'moderation_status': 'approved',
+            'moderation_notes': '',
+            'list_date': LIST_DATE_FIELD.get_db_prep_save(
+                midnight - timedelta(minutes=rng.randrange(3 * 365 * 24 * 60)), connection,
+            ),
+        }
+
+    @staticmethod
+    def scale_stays(rng, count, today):
+        """count непересекающихся проживаний [заезд, выезд) с равномерными промежутками."""
+        if not count:
+            return []
+        stays = []
+        # Средний промежуток такой, чтобы брони заняли окно в 2 * SCALE_WINDOW_DAYS дней
+        gap = max(0, 2 * SCALE_WINDOW_DAYS // count - 4)
+        day = today - timedelta(days=SCALE_WINDOW_DAYS)
+        for _ in range(count):
+            day += timedelta(days=rng.randint(0, 2 * gap))
+            nights = rng.choice((1, 2, 2, 3, 3, 4, 5, 7, 10, 14))
+            stays.append((day, day + timedelta(days=nights)))
+            day += timedelta(days=nights)
+        return stays
+
+    @staticmethod
+    def scale_status(rng, check_in, check_out, today):
+        roll = rng.random()
+        if check_out <= today:
+            return 'completed' if roll < 0.85 else 'cancelled'
+        if check_in <= today:
+            return 'confirmed'
+        return 'confirmed' if roll < 0.7 else 'pending' if roll < 0.9 else 'cancelled'
+
+    @staticmethod
+    def scale_review(rng):
+        rating = rng.choices((1, 2, 3, 4, 5), weights=RATING_WEIGHTS)[0]
+        # Оценки по категориям близки к общей; часть гостей их не ставит
+        subratings = {
+            f'{name}_rating': min(5, max(1, rating + rng.choice((-1, 0, 0, 0, 1)))) if rng.random() < 0.8 else None
+            for name in Review.SUBRATINGS
+        }
+        return {'rating': rating, 'comment': '', **subratings}
@@ -1,35 +1,139 @@
 # listings/management/commands/export_listing.py
+"""
+Management команда для экспорта объявлений
+
+Использование:
+    python manage.py export_listing 42
+    python manage.py export_listing --all --output listings.ndjson
+    python manage.py export_listing --all --include-owner --gzip --city Алматы --since 2024-01-01
+    python manage.py export_listing --all --gzip --resume
+
+С --all объявления выгружаются в NDJSON (формат jsonl Django: одна запись на строку)
+порциями по --chunk-size, поэтому память не зависит от размера каталога. Владелец
+записывается перед первым своим объявлением (без пароля и прав). После каждой порции
+сохраняется контрольная точка <файл>.checkpoint; --resume продолжает прерванную
+выгрузку с нее.
+"""
+import gc
+import gzip
+import io
 import json
-from django.core.management.base import BaseCommand
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
 from django.core import serializers
+from django.core.serializers.jsonl import Serializer as JSONLSerializer
+from django.db.models import Q
+from django.utils import timezone
 from listings.models import Listing
-from django.contrib.auth.models import User
+
+# Поля владельца в выгрузке: хеш пароля и права персонала не покидают эту БД
+OWNER_FIELDS = ('username', 'first_name', 'last_name', 'email', 'date_joined')
+
+
+def parse_since(value):
+    try:
+        since = datetime.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f'Неверная дата --since: {value}. Используйте YYYY-MM-DD')
+    return since if timezone.is_aware(since) else timezone.make_aware(since)
+
+
+class NDJSONSerializer(JSONLSerializer):
+    """Формат jsonl Django, но запись через json.dumps.
+
+    json.dump кодирует объект на чистом Python, json.dumps - C-кодировщиком,
+    что в несколько раз быстрее на объектах с десятками полей.
+    """
+
+    def end_object(self, obj):
+        self.stream.write(json.dumps(self.get_dump_object(obj), **self.json_kwargs))
+        self.stream.write('\n')
+        self._current = None
+
+
+@contextmanager
+def ndjson_segment(raw, use_gzip):
+    """Текстовый поток поверх открытого файла; с gzip каждый сегмент - отдельный член архива.
+
+    gzip и zcat читают многочленный архив как один файл, а законченный член не зависит
+    от следующих, поэтому обрыв выгрузки не портит уже записанные порции.
+    """
+    member = gzip.GzipFile(fileobj=raw, mode='wb') if use_gzip else None
+    text = io.TextIOWrapper(member or raw, encoding='utf-8', newline='\n')
+    try:
+        yield text
+    finally:
+        text.flush()
+        text.detach()
+        if member is not None:
+            member.close()
 
 
 class Command(BaseCommand):
-    help = 'Экспорт объявления в JSON для импорта на PythonAnywhere'
+    help = 'Экспорт объявления в JSON (или всех объявлений в NDJSON) для импорта на PythonAnywhere'
 
     def add_arguments(self, parser):
         parser.add_argument(
             'listing_id',
             type=int,
+            nargs='?',
             help='ID объявления для экспорта',
         )
         parser.add_argument(
             '--output',
             type=str,
-            default='listing_export.json',
-            help='Имя выходного файла (по умолчанию: listing_export.json)',
+            help='Имя выходного файла (по умолчанию: listing_export.json, с --all: listings_export.ndjson[.gz])',
         )
         parser.add_argument(
             '--include-owner',
             action='store_true',
-            help='Включить информацию о владельце в экспорт',
+            help='Включить информацию о владельце в экспорт (без пароля и прав)',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Выгрузить все объявления (с учетом фильтров) в NDJSON',
+        )
+        parser.add_argument(
+            '--city',
+            type=str,
+            help='Только объявления из города (с --all)',
+        )
+        parser.add_argument(
+            '--since',
+            type=str,
+            help='Только объявления, измененные с даты YYYY-MM-DD (с --all)',
+        )
+        parser.add_argument(
+            '--gzip',
+            action='store_true',
+            help='Сжимать вывод gzip (включается автоматически для файлов .gz)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Сколько объявлений читать и записывать за раз (по умолчанию: 2000)',
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Продолжить прерванную выгрузку с контрольной точки',
         )
 
     def handle(self, *args, **options):
+        if options['all']:
+            return self.export_all(options)
+        if options['listing_id'] is None:
+            raise CommandError('Укажите ID объявления или --all')
+
         listing_id = options['listing_id']
-        output_file = options['output']
+        output_file = options['output'] or 'listing_export.json'
         include_owner = options['include_owner']
 
         try:
@@ -45,15 +149,116 @@ class Command(BaseCommand):
         }
 
         if include_owner and listing.owner:
-            export_data['owner'] = json.loads(serializers.serialize('json', [listing.owner]))[0]
+            export_data['owner'] = json.loads(serializers.serialize('json', [listing.owner], fields=OWNER_FIELDS))[0]
 
         with open(output_file, 'w', encoding='utf-8') as f:
             json.dump(export_data, f, ensure_ascii=False, indent=2)
 
         self.stdout.write(self.style.SUCCESS(f'\n[OK] Объявление экспортировано в {output_file}'))
-        self.stdout.write(f'\nДля импорта на PythonAnywhere:')
+        self.stdout.write('\nДля импорта на PythonAnywhere:')
         self.stdout.write(f'1. Загрузите файл {output_file} на сервер')
         self.stdout.write(f'2. Выполните: python manage.py import_listing {output_file}')
-        self.stdout.write(f'\nИли используйте команду:')
+        self.stdout.write('\nИли используйте команду:')
         self.stdout.write(f'python manage.py import_listing {output_file}')
 
+    def export_all(self, options):
+        use_gzip = options['gzip'] or bool(options['output'] and options['output'].endswith('.gz'))
+        output_file = options['output'] or ('listings_export.ndjson.gz' if use_gzip else 'listings_export.ndjson')
+        checkpoint_file = f'{output_file}.checkpoint'
+        chunk_size = options['chunk_size']
+        include_owner = options['include_owner']
+
+        queryset = Listing.objects.all()
+        if options['city']:
+            queryset = queryset.filter(city__icontains=options['city'])
+        since = parse_since(options['since']) if options['since'] else None
+        if since:
+            queryset = queryset.filter(Q(updated_at__gte=since) | Q(updated_at__isnull=True, list_date__gte=since))
+
+        # Контрольная точка действительна только для той же выгрузки
+        params = {
+            'city': options['city'],
+            'since': since.isoformat() if since else None,
+            'include_owner': include_owner,
+            'gzip': use_gzip,
+        }
+        last_pk, offset, exported = 0, 0, 0
+        if options['resume']:
+            if not os.path.exists(checkpoint_file) or not os.path.exists(output_file):
+                raise CommandError(f'Контрольная точка {checkpoint_file} не найдена, запустите выгрузку без --resume')
+            with open(checkpoint_file, encoding='utf-8') as f:
+                checkpoint = json.load(f)
+            if checkpoint['params'] != params:
+                raise CommandError('Параметры выгрузки отличаются от сохраненных в контрольной точке')
+            last_pk, offset, exported = checkpoint['last_pk'], checkpoint['offset'], checkpoint['exported']
+            self.stdout.write(f'Продолжение с ID > {last_pk} (уже выгружено: {exported})')
+
+        # Владельцы, уже записанные до контрольной точки, повторно не выгружаются
+        exported_owners = set()
+        if include_owner and last_pk:
+            exported_owners.update(
+                queryset.filter(pk__lte=last_pk, owner__isnull=False).values_list('owner_id', flat=True).distinct()
+            )
+
+        queryset = queryset.filter(pk__gt=last_pk).order_by('pk')
+        if include_owner:
+            queryset = queryset.select_related('owner')
+        total = exported + queryset.count()
+        self.stdout.write(f'Объявлений к выгрузке: {total}')
+
+        serializer = NDJSONSerializer()
+        started = time.perf_counter()
+        owners_count = 0
+        # Уже существующие объекты исключаются из сборки мусора: gc.collect() после
+        # каждой порции обходит только объекты этой порции
+        gc.freeze()
+        try:
+            with open(output_file, 'r+b' if offset else 'wb') as raw:
+                # Хвост после контрольной точки мог быть записан не полностью
+                raw.seek(offset)
+                raw.truncate()
+                rows = queryset.iterator(chunk_size=chunk_size)
+                while batch := list(islice(rows, chunk_size)):
+                    owners = []
+                    if include_owner:
+                        for listing in batch:
+                            if listing.owner_id and listing.owner_id not in exported_owners:
+                                exported_owners.add(listing.owner_id)
+                                owners.append(listing.owner)
+                    with ndjson_segment(raw, use_gzip) as stream:
+                        serializer.serialize(owners, stream=stream, fields=OWNER_FIELDS)
+                        serializer.serialize(batch, stream=stream)
+                    raw.flush()
+                    os.fsync(raw.fileno())
+
+                    exported += len(batch)
+                    owners_count += len(owners)
+                    self.save_checkpoint(checkpoint_file, {
+                        'last_pk': batch[-1].pk, 'offset': raw.tell(), 'exported': exported, 'params': params,
+                    })
+                    self.stdout.write(f'  {exported}/{total}')
+
+                    # photo_main (FieldFile) и объявление ссылаются друг на друга; без явной
+                    # сборки такие циклы доживают до редкой полной сборки и память растет
+                    del batch, owners
+                    gc.collect()
+        finally:
+            gc.unfreeze()
+
+        if os.path.exists(checkpoint_file):
+            os.remove(checkpoint_file)
+
+        elapsed = time.perf_counter() - started
+        rate = f' ({exported / elapsed:,.0f} объявлений/с)' if elapsed and exported else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'\n[OK] Выгружено объявлений: {exported}, владельцев: {owners_count} в {output_file} '
+            f'за {elapsed:.1f} с{rate}'
+        ))
+
+    @staticmethod
+    def save_checkpoint(path, data):
+        # Запись через временный файл: при обрыве остается предыдущая контрольная точка
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
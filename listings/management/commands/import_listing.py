@@ -1,16 +1,56 @@
 # listings/management/commands/import_listing.py
+"""
+Management команда для импорта объявлений
+
+Использование:
+    python manage.py import_listing listing_export.json
+    python manage.py import_listing listings_export.ndjson.gz --update-existing
+    python manage.py import_listing all_listings.json --skip-existing --batch-size 2000
+
+Файл export_listing <ID> импортируется как раньше, по одному объявлению. NDJSON
+(export_listing --all, можно .gz) и JSON-массив записей (dumpdata) читаются потоком
+и записываются порциями по --batch-size через bulk_create, каждая порция - в своей
+транзакции. Владельцы сопоставляются по username через один словарь пользователей,
+загруженный в начале; отсутствующие владельцы из файла создаются без пароля и прав
+персонала. Объявления, владельца которых нет среди записей файла, пропускаются
+(или используйте --owner-username).
+"""
+import gzip
 import json
 import os
-from django.core.management.base import BaseCommand
+import time
+from itertools import chain
+from django.core.management.base import BaseCommand, CommandError
 from django.core import serializers
+from django.core.management.color import no_style
 from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
 from listings.models import Listing
+from listings.services import RatingService
 from django.contrib.auth.models import User
 from decimal import Decimal
 
+# Поля, которые описывают данные этой БД (отзывы, файлы производных фото), а не файла:
+# при создании сбрасываются к значениям по умолчанию, при --update-existing не меняются
+LOCAL_FIELDS = {*RatingService.AGGREGATE_FIELDS, 'photo_variants'}
+# Поля, перезаписываемые при --update-existing
+UPDATE_FIELDS = [
+    field.name for field in Listing._meta.concrete_fields
+    if not field.primary_key and field.name not in LOCAL_FIELDS
+]
+
+
+def open_export(path):
+    """Текстовый поток файла экспорта; gzip определяется по сигнатуре."""
+    with open(path, 'rb') as f:
+        compressed = f.read(2) == b'\x1f\x8b'
+    if compressed:
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
 
 class Command(BaseCommand):
-    help = 'Импорт объявления из JSON файла (с PythonAnywhere или локально)'
+    help = 'Импорт объявления из JSON файла (или объявлений из NDJSON/JSON-массива) с PythonAnywhere или локально'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -33,6 +73,12 @@ class Command(BaseCommand):
             action='store_true',
             help='Обновить существующее объявление',
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько объявлений записывать за одну транзакцию (по умолчанию: 1000)',
+        )
 
     def handle(self, *args, **options):
         json_file = options['json_file']
@@ -44,9 +90,23 @@ class Command(BaseCommand):
             self.stdout.write(self.style.ERROR(f'Файл {json_file} не найден'))
             return
 
-        with open(json_file, 'r', encoding='utf-8') as f:
+        with open_export(json_file) as f:
+            # NDJSON (export_listing --all): первая строка - отдельная запись с полем model
+            first_line = f.readline()
+            try:
+                first_record = json.loads(first_line)
+            except ValueError:
+                first_record = None
+            if isinstance(first_record, dict) and 'model' in first_record:
+                records = chain([first_record], (json.loads(line) for line in f if line.strip()))
+                return self.import_records(records, options)
+            f.seek(0)
             export_data = json.load(f)
 
+        # JSON-массив записей (dumpdata)
+        if isinstance(export_data, list):
+            return self.import_records(iter(export_data), options)
+
         listing_data = export_data['listing']
         listing_id = listing_data['pk']
         listing_fields = listing_data['fields'].copy()
@@ -114,3 +174,141 @@ class Command(BaseCommand):
         else:
             self.stdout.write(self.style.WARNING('[WARNING] Объявление не опубликовано (is_published=False)'))
 
+    def import_records(self, records, options):
+        """Импорт потока записей auth.user / listings.listing порциями."""
+        batch_size = options['batch_size']
+        skip_existing = options['skip_existing']
+        update_existing = options['update_existing']
+
+        owner_override = None
+        if options.get('owner_username'):
+            owner_override = User.objects.filter(username=options['owner_username']).values_list('pk', flat=True).first()
+            if owner_override is None:
+                raise CommandError(f'Пользователь {options["owner_username"]} не найден')
+
+        # Один запрос на весь импорт: дальше владельцы сопоставляются по словарям
+        user_ids = dict(User.objects.values_list('username', 'pk'))
+        owner_map = {}  # pk владельца в файле -> pk в этой БД
+
+        stats = {'created': 0, 'updated': 0, 'skipped': 0, 'owners_created': 0, 'without_owner': 0, 'photos': 0}
+        local_defaults = {name: Listing._meta.get_field(name).get_default() for name in LOCAL_FIELDS}
+        started = time.perf_counter()
+
+        def flush_users(users):
+            new_users = []
+            for user in users:
+                file_pk = user.pk
+                if user.username in user_ids:
+                    owner_map[file_pk] = user_ids[user.username]
+                else:
+                    # Пароль и права из чужой БД не переносятся: вход - после сброса пароля
+                    user.pk = None
+                    user.is_staff = user.is_superuser = False
+                    user.set_unusable_password()
+                    new_users.append((file_pk, user))
+            if new_users:
+                User.objects.bulk_create([user for _, user in new_users])
+                for file_pk, user in new_users:
+                    owner_map[file_pk] = user_ids[user.username] = user.pk
+                stats['owners_created'] += len(new_users)
+
+        def flush_listings(listings):
+            owned = []
+            for listing in listings:
+                # ID пользователей файла совпадают с ID этой БД только случайно:
+                # доверять можно лишь сопоставлению по записям auth.user
+                if owner_override is not None:
+                    listing.owner_id = owner_override
+                elif listing.owner_id in owner_map:
+                    listing.owner_id = owner_map[listing.owner_id]
+                else:
+                    stats['without_owner'] += 1
+                    continue
+                if listing.photo_main:
+                    stats['photos'] += 1
+                owned.append(listing)
+            listings = owned
+
+            existing = set(
+                Listing.objects.filter(pk__in=[listing.pk for listing in listings]).values_list('pk', flat=True)
+            )
+            if existing and not (skip_existing or update_existing):
+                raise CommandError(
+                    f'Объявления с ID {", ".join(map(str, sorted(existing)[:10]))} уже существуют '
+                    f'(импортировано до них: {stats["created"]}). '
+                    'Используйте --update-existing для обновления или --skip-existing для пропуска'
+                )
+            for listing in listings:
+                if listing.pk not in existing:
+                    for name, value in local_defaults.items():
+                        setattr(listing, name, value)
+            if skip_existing:
+                listings = [listing for listing in listings if listing.pk not in existing]
+                stats['skipped'] += len(existing)
+                Listing.objects.bulk_create(listings)
+            elif update_existing:
+                Listing.objects.bulk_create(
+                    listings, update_conflicts=True, unique_fields=['id'], update_fields=UPDATE_FIELDS,
+                )
+                stats['updated'] += len(existing)
+                listings = [listing for listing in listings if listing.pk not in existing]
+            else:
+                Listing.objects.bulk_create(listings)
+            stats['created'] += len(listings)
+
+        def flush(users, listings):
+            # Владелец в файле идет раньше своих объявлений, поэтому сначала пользователи
+            with transaction.atomic():
+                flush_users([
+                    deserialized.object
+                    for deserialized in serializers.deserialize('python', users, ignorenonexistent=True)
+                ])
+                flush_listings([
+                    deserialized.object
+                    for deserialized in serializers.deserialize('python', listings, ignorenonexistent=True)
+                ])
+            done = stats['created'] + stats['updated'] + stats['skipped']
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'  {done} ({done / elapsed:,.0f} строк/с)')
+
+        users, listings, ignored = [], [], 0
+        for record in records:
+            model = record.get('model')
+            if model == 'auth.user':
+                users.append(record)
+            elif model == 'listings.listing':
+                listings.append(record)
+                if len(listings) >= batch_size:
+                    flush(users, listings)
+                    users, listings = [], []
+            else:
+                ignored += 1
+        if users or listings:
+            flush(users, listings)
+
+        # Как loaddata: объявления записаны с явными ID, счетчик автоинкремента нужно сдвинуть
+        sequence_sql = connection.ops.sequence_reset_sql(no_style(), [Listing])
+        if sequence_sql:
+            with connection.cursor() as cursor:
+                for sql in sequence_sql:
+                    cursor.execute(sql)
+
+        elapsed = time.perf_counter() - started
+        done = stats['created'] + stats['updated'] + stats['skipped']
+        self.stdout.write(self.style.SUCCESS(
+            f'\n[OK] Создано: {stats["created"]}, обновлено: {stats["updated"]}, пропущено: {stats["skipped"]} '
+            f'за {elapsed:.1f} с ({done / elapsed if elapsed else 0:,.0f} строк/с)'
+        ))
+        if stats['owners_created']:
+            self.stdout.write(f'Создано владельцев: {stats["owners_created"]}')
+        if stats['without_owner']:
+            self.stdout.write(self.style.WARNING(
+                f'[WARNING] Владельца {stats["without_owner"]} объявлений нет среди пользователей файла, '
+                'они не импортированы (укажите --owner-username)'
+            ))
+        if stats['photos']:
+            self.stdout.write(self.style.WARNING(
+                f'[WARNING] Фото {stats["photos"]} объявлений нужно загрузить отдельно в media/ на сервере'
+            ))
+        if ignored:
+            self.stdout.write(f'Пропущено записей других моделей: {ignored}')
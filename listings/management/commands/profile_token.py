@@ -0,0 +1,22 @@
+# listings/management/commands/profile_token.py
+"""
+Management команда для выдачи токена профилирования запроса
+
+Использование:
+    curl -H "X-Profile: $(python manage.py profile_token)" https://.../api/listings/search/?q=...
+    curl -H "X-Profile: <токен>" -H "X-Profile-Mode: sampling" ...
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from listings.profiling import make_token
+
+
+class Command(BaseCommand):
+    help = 'Печатает подписанный токен для заголовка X-Profile (ProfilerMiddleware)'
+
+    def handle(self, *args, **options):
+        if not getattr(settings, 'LISTINGS_PROFILE_DIR', None):
+            self.stderr.write(self.style.WARNING('LISTINGS_PROFILE_DIR не задан: профили не будут записываться'))
+        age = getattr(settings, 'LISTINGS_PROFILE_TOKEN_AGE', 3600)
+        self.stderr.write(f'Токен действует {age} с')
+        self.stdout.write(make_token())
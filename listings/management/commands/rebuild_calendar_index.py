@@ -0,0 +1,58 @@
+# listings/management/commands/rebuild_calendar_index.py
+"""
+Management команда для пересборки битовых карт календаря
+
+Использование:
+    python manage.py rebuild_calendar_index
+    python manage.py rebuild_calendar_index --listing-id 1
+    python manage.py rebuild_calendar_index --chunk-size 1000
+
+Запускайте раз в сутки (cron), чтобы горизонт карт сдвигался вместе с текущей датой.
+"""
+import time
+from django.core.management.base import BaseCommand
+from listings.models import Listing
+from listings.services import CalendarIndexService
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает битовые карты закрытых ночей для объектов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--listing-id',
+            type=int,
+            help='ID объекта для пересборки только его карты',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Сколько объектов обрабатывать за раз (по умолчанию: 500)',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        queryset = Listing.objects.order_by('pk')
+        if options['listing_id']:
+            queryset = queryset.filter(pk=options['listing_id'])
+
+        total = queryset.count()
+        self.stdout.write(f'Горизонт: {CalendarIndexService.horizon_days()} дней, объектов: {total}')
+
+        started = time.perf_counter()
+        done = 0
+        chunk = []
+        for listing_id in queryset.values_list('pk', flat=True).iterator(chunk_size=chunk_size):
+            chunk.append(listing_id)
+            if len(chunk) >= chunk_size:
+                CalendarIndexService.refresh(chunk)
+                done += len(chunk)
+                chunk = []
+                self.stdout.write(f'  {done}/{total}')
+        if chunk:
+            CalendarIndexService.refresh(chunk)
+            done += len(chunk)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'\n✓ Пересобрано карт: {done} за {elapsed:.1f} с'))
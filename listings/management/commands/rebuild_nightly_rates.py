@@ -0,0 +1,85 @@
+# listings/management/commands/rebuild_nightly_rates.py
+"""
+Management команда для пересчета цен ночей (ListingNightlyRate)
+
+Использование:
+    python manage.py rebuild_nightly_rates
+    python manage.py rebuild_nightly_rates --listing-id 1
+    python manage.py rebuild_nightly_rates --all --chunk-size 200
+
+Запускайте раз в сутки (cron): прошедшие ночи удаляются, а горизонт каждого объекта
+дописывается от последней посчитанной ночи. Каждая пачка объектов сохраняется в своей
+транзакции, поэтому прерванный запуск можно просто повторить - он продолжит с объектов,
+которые еще не досчитаны.
+
+Изменение цен, броней или календаря сразу пересчитывает ночи не больше чем
+NIGHTLY_RATES_SYNC_LIMIT (20) объектов. Ночи большего набора (например, после
+массового Listing.objects.update(base_price=...) или import_listing --update-existing)
+удаляются с предупреждением в логе listings.services, а новые объекты (bulk_create,
+import_listing) остаются без ночей. До запуска команды их стоимость считается по базовым
+ценам и особым ценам дат. После таких изменений запустите команду, не дожидаясь cron.
+"""
+import time
+from collections import defaultdict
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from listings.models import Listing
+from listings.services import NIGHTLY_RATES_SYNC_LIMIT, NightlyRateService
+
+
+class Command(BaseCommand):
+    help = (
+        'Досчитывает цены и занятость ночей объектов до конца горизонта. Запускайте и после '
+        f'массовых изменений цен или календаря: ночи больше чем {NIGHTLY_RATES_SYNC_LIMIT} объектов '
+        'при этом удаляются, а не пересчитываются'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--listing-id',
+            type=int,
+            help='ID объекта для пересчета только его ночей',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересчитать все ночи заново, а не только недостающие',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Сколько объектов обрабатывать за раз (по умолчанию: 500)',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        queryset = Listing.objects.all()
+        if options['listing_id']:
+            queryset = queryset.filter(pk=options['listing_id'])
+
+        pruned = NightlyRateService.prune()
+        if options['all']:
+            pending = [(pk, None) for pk in queryset.order_by('pk').values_list('pk', flat=True)]
+        else:
+            pending = list(NightlyRateService.pending(queryset))
+        total = len(pending)
+        self.stdout.write(
+            f'Горизонт: {NightlyRateService.horizon_days()} дней, удалено прошедших ночей: {pruned}, '
+            f'объектов к пересчету: {total}'
+        )
+
+        started = time.perf_counter()
+        done = rows = 0
+        for index in range(0, total, chunk_size):
+            # Объекты пачки досчитываются со следующей после последней посчитанной ночи
+            by_start = defaultdict(list)
+            for listing_id, last_rate in pending[index:index + chunk_size]:
+                by_start[last_rate + timedelta(days=1) if last_rate else None].append(listing_id)
+            for start, listing_ids in by_start.items():
+                rows += NightlyRateService.refresh(listing_ids, start=start)
+                done += len(listing_ids)
+            self.stdout.write(f'  {done}/{total} (последний ID: {pending[index:index + chunk_size][-1][0]})')
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'\n✓ Объектов: {done}, записано ночей: {rows} за {elapsed:.1f} с'))
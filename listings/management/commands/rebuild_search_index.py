@@ -0,0 +1,40 @@
+# listings/management/commands/rebuild_search_index.py
+"""
+Management команда для пересборки полнотекстового индекса объектов
+
+Использование:
+    python manage.py rebuild_search_index
+    python manage.py rebuild_search_index --chunk-size 10000
+
+Индекс обновляется автоматически при сохранении объектов; команда нужна после
+изменений в обход ORM (raw SQL, восстановление из дампа).
+"""
+import time
+from django.core.management.base import BaseCommand
+from listings.search import get_backend
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает полнотекстовый индекс объектов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Диапазон id, индексируемый за один запрос (по умолчанию: 5000)',
+        )
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        self.stdout.write(f'Бэкенд: {type(backend).__name__}')
+
+        started = time.perf_counter()
+        done = 0
+        # rebuild() выполняется в одной транзакции: поиск не видит наполовину пустой индекс
+        for rows in backend.rebuild(chunk_size=options['chunk_size']):
+            done += rows
+            self.stdout.write(f'  {done}')
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'\n✓ Проиндексировано объектов: {done} за {elapsed:.1f} с'))
@@ -0,0 +1,57 @@
+# listings/management/commands/recompute_ratings.py
+"""
+Management команда для пересчета агрегатов отзывов на объектах
+
+Использование:
+    python manage.py recompute_ratings
+    python manage.py recompute_ratings --listing-id 1
+    python manage.py recompute_ratings --chunk-size 1000
+
+Агрегаты обновляются при каждом сохранении и удалении отзыва; команда нужна после
+изменений в обход ORM (raw SQL, загрузка дампа) и после первого развертывания.
+"""
+import time
+from django.core.management.base import BaseCommand
+from listings.models import Listing
+from listings.services import RatingService
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает рейтинг, гистограмму и оценки по категориям для объектов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--listing-id',
+            type=int,
+            help='ID объекта для пересчета только его рейтинга',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Сколько объектов обрабатывать за раз (по умолчанию: 500)',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        queryset = Listing.objects.order_by('pk')
+        if options['listing_id']:
+            queryset = queryset.filter(pk=options['listing_id'])
+
+        total = queryset.count()
+        self.stdout.write(f'Объектов: {total}')
+
+        started = time.perf_counter()
+        done = 0
+        chunk = []
+        for listing_id in queryset.values_list('pk', flat=True).iterator(chunk_size=chunk_size):
+            chunk.append(listing_id)
+            if len(chunk) >= chunk_size:
+                done += RatingService.recompute(chunk)
+                chunk = []
+                self.stdout.write(f'  {done}/{total}')
+        if chunk:
+            done += RatingService.recompute(chunk)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'\n✓ Пересчитано объектов: {done} за {elapsed:.1f} с'))
@@ -5,11 +5,17 @@ Management команда для синхронизации всех актив
 Использование:
     python manage.py sync_ical
     python manage.py sync_ical --listing-id 1  # Синхронизировать конкретный объект
+    python manage.py sync_ical --force --workers 16
+
+Без --listing-id/--ical-id синхронизируются календари, у которых прошла sync_frequency
+(команду удобно запускать по расписанию раз в несколько минут). Календари загружаются
+параллельно и разбираются потоком, по мере чтения ответа; неизменившиеся (304 или то же
+содержимое) в БД не пишутся.
 """
+import time
 from django.core.management.base import BaseCommand
-# Временно отключено - модель не определена
-# from listings.models import ICalSync
-# from listings.services import ICalSyncService
+from listings.models import ICalSync
+from listings.services import ICalSyncService
 
 
 class Command(BaseCommand):
@@ -26,58 +32,54 @@ class Command(BaseCommand):
             type=int,
             help='ID конкретной iCal синхронизации',
         )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Загрузить и разобрать календари заново, даже если они не изменились и срок не подошел',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Сколько календарей загружать одновременно (по умолчанию: LISTINGS_ICAL_WORKERS или 8)',
+        )
 
     def handle(self, *args, **options):
-        self.stdout.write(self.style.ERROR('Команда временно отключена - модель ICalSync не определена'))
-        return
-        # Временно отключено
-        # listing_id = options.get('listing_id')
-        # ical_id = options.get('ical_id')
-        # 
-        # if ical_id:
-            # Синхронизируем конкретную iCal синхронизацию
-            try:
-                ical_sync = ICalSync.objects.get(id=ical_id, is_active=True)
-                self.stdout.write(f'Синхронизация iCal {ical_id} для объекта "{ical_sync.listing.title}"...')
-                success, message = ICalSyncService.sync_ical(ical_sync)
-                if success:
-                    self.stdout.write(self.style.SUCCESS(f'✓ {message}'))
-                else:
-                    self.stdout.write(self.style.ERROR(f'✗ {message}'))
-            except ICalSync.DoesNotExist:
+        listing_id = options.get('listing_id')
+        ical_id = options.get('ical_id')
+        force = options['force']
+
+        if ical_id:
+            ical_syncs = ICalSync.objects.filter(id=ical_id, is_active=True)
+            if not ical_syncs.exists():
                 self.stdout.write(self.style.ERROR(f'iCal синхронизация с ID {ical_id} не найдена или неактивна'))
+                return
         elif listing_id:
-            # Синхронизируем все календари для конкретного объекта
             ical_syncs = ICalSync.objects.filter(listing_id=listing_id, is_active=True)
             if not ical_syncs.exists():
                 self.stdout.write(self.style.WARNING(f'Активные iCal синхронизации для объекта {listing_id} не найдены'))
                 return
-            
             self.stdout.write(f'Синхронизация календарей для объекта {listing_id}...')
-            for ical_sync in ical_syncs:
-                self.stdout.write(f'  Синхронизация iCal {ical_sync.id}...')
-                success, message = ICalSyncService.sync_ical(ical_sync)
-                if success:
-                    self.stdout.write(self.style.SUCCESS(f'    ✓ {message}'))
-                else:
-                    self.stdout.write(self.style.ERROR(f'    ✗ {message}'))
-        else:
-            # Синхронизируем все активные календари
+        elif force:
+            ical_syncs = ICalSync.objects.filter(is_active=True)
             self.stdout.write('Синхронизация всех активных iCal календарей...')
-            results = ICalSyncService.sync_all_active()
-            
-            success_count = sum(1 for r in results if r['success'])
-            total_count = len(results)
-            
-            for result in results:
-                status_style = self.style.SUCCESS if result['success'] else self.style.ERROR
-                status_symbol = '✓' if result['success'] else '✗'
-                self.stdout.write(
-                    status_style(f'{status_symbol} {result["listing"]}: {result["message"]}')
-                )
-            
+        else:
+            ical_syncs = ICalSyncService.due()
+            self.stdout.write('Синхронизация iCal календарей, у которых подошел срок...')
+
+        started = time.perf_counter()
+        results = ICalSyncService.sync_all_active(
+            ical_syncs.select_related('listing'), workers=options['workers'], force=force,
+        )
+        elapsed = time.perf_counter() - started
+
+        for result in sorted(results, key=lambda r: r['id']):
+            status_style = self.style.SUCCESS if result['success'] else self.style.ERROR
+            status_symbol = '✓' if result['success'] else '✗'
             self.stdout.write(
-                self.style.SUCCESS(f'\nЗавершено: {success_count}/{total_count} успешно')
+                status_style(f'{status_symbol} [{result["id"]}] {result["listing"]}: {result["message"]}')
             )
 
-
+        success_count = sum(1 for r in results if r['success'])
+        self.stdout.write(
+            self.style.SUCCESS(f'\nЗавершено: {success_count}/{len(results)} успешно за {elapsed:.1f} с')
+        )
@@ -0,0 +1,280 @@
+# listings/metrics.py
+"""
+Метрики приложения в формате Prometheus
+
+Счетчики и гистограммы с фиксированными границами корзин. Значения каждого процесса
+хранятся в mmap: при LISTINGS_METRICS_DIR - в файле metrics_<pid>.db этого каталога
+(общем для всех воркеров gunicorn/uwsgi), иначе в памяти процесса. Процесс пишет
+только в свой файл, поэтому между процессами блокировки не нужны; внутри процесса
+запись защищена threading.Lock. render() складывает значения всех файлов каталога.
+
+Каталог нужно очищать при перезапуске сервера: файлы завершившихся воркеров
+продолжают учитываться (как и в multiprocess-режиме prometheus_client).
+
+Формат записи в файле: 8 байт заголовка (занятый объем, uint32 + выравнивание), затем
+записи [длина ключа: uint32][ключ UTF-8, дополненный до кратного 8][значение: float64].
+Значение записывается до увеличения заголовка, поэтому читатель видит только
+полностью записанные записи.
+"""
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.conf import settings
+
+INITIAL_SIZE = 64 * 1024
+# Границы корзин времени ответа (секунды) и числа SQL запросов на запрос
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def enabled() -> bool:
+    """Собираются ли метрики (LISTINGS_METRICS_ENABLED, по умолчанию выключено)."""
+    return getattr(settings, 'LISTINGS_METRICS_ENABLED', False)
+
+
+def _padded(length: int) -> int:
+    return length + (-length) % 8
+
+
+class ValueStore:
+    """Значения серий одного процесса: ключ -> float64 в mmap"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.positions = {}
+        if path is None:
+            self.file = None
+            self.mm = mmap.mmap(-1, INITIAL_SIZE)
+            self.used = 8
+            struct.pack_into('<I', self.mm, 0, self.used)
+            return
+        self.file = open(path, 'a+b')
+        size = os.fstat(self.file.fileno()).st_size
+        if size < INITIAL_SIZE:
+            self.file.truncate(INITIAL_SIZE)
+            size = INITIAL_SIZE
+        self.mm = mmap.mmap(self.file.fileno(), size)
+        # Файл мог остаться от процесса с тем же pid
+        self.used = struct.unpack_from('<I', self.mm, 0)[0] or 8
+        for key, position, _ in read_entries(self.mm, self.used):
+            self.positions[key] = position
+        struct.pack_into('<I', self.mm, 0, self.used)
+
+    def _grow(self, needed: int):
+        size = len(self.mm)
+        while size < needed:
+            size *= 2
+        if self.file is None:
+            mm = mmap.mmap(-1, size)
+            mm[:self.used] = self.mm[:self.used]
+        else:
+            self.mm.flush()
+            self.file.truncate(size)
+            mm = mmap.mmap(self.file.fileno(), size)
+        self.mm.close()
+        self.mm = mm
+
+    def _position(self, key: str) -> int:
+        position = self.positions.get(key)
+        if position is not None:
+            return position
+        encoded = key.encode()
+        entry = _padded(4 + len(encoded)) + 8
+        if self.used + entry > len(self.mm):
+            self._grow(self.used + entry)
+        struct.pack_into(f'<I{len(encoded)}s', self.mm, self.used, len(encoded), encoded)
+        position = self.used + _padded(4 + len(encoded))
+        struct.pack_into('<d', self.mm, position, 0.0)
+        self.used = position + 8
+        struct.pack_into('<I', self.mm, 0, self.used)
+        self.positions[key] = position
+        return position
+
+    def add(self, key: str, amount: float):
+        with self.lock:
+            position = self._position(key)
+            value = struct.unpack_from('<d', self.mm, position)[0]
+            struct.pack_into('<d', self.mm, position, value + amount)
+
+    def items(self) -> Iterable[Tuple[str, float]]:
+        with self.lock:
+            return [(key, value) for key, _, value in read_entries(self.mm, self.used)]
+
+
+def read_entries(data, used: int):
+    """(ключ, смещение значения, значение) записей буфера до смещения used."""
+    offset = 8
+    while offset < used:
+        length = struct.unpack_from('<I', data, offset)[0]
+        key = bytes(data[offset + 4:offset + 4 + length]).decode()
+        position = offset + _padded(4 + length)
+        yield key, position, struct.unpack_from('<d', data, position)[0]
+        offset = position + 8
+
+
+def read_file(path: str) -> Iterable[Tuple[str, float]]:
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < 8:
+        return []
+    used = min(struct.unpack_from('<I', data, 0)[0], len(data))
+    return [(key, value) for key, _, value in read_entries(data, used)]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self._store = None
+        self._owner = None
+        self._lock = threading.Lock()
+
+    @property
+    def directory(self) -> Optional[str]:
+        return getattr(settings, 'LISTINGS_METRICS_DIR', None)
+
+    def store(self) -> ValueStore:
+        # После fork у воркера свой pid - и свой файл
+        owner = (os.getpid(), self.directory)
+        if self._owner != owner:
+            with self._lock:
+                if self._owner != owner:
+                    pid, directory = owner
+                    path = None
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                        path = os.path.join(directory, f'metrics_{pid}.db')
+                    self._store = ValueStore(path)
+                    self._owner = owner
+        return self._store
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def collect(self) -> Dict[str, float]:
+        """Сумма значений серий по всем процессам."""
+        totals = {}
+        directory = self.directory
+        if directory:
+            self.store()
+            sources = [read_file(path) for path in sorted(glob.glob(os.path.join(directory, 'metrics_*.db')))]
+        else:
+            sources = [self.store().items()]
+        for items in sources:
+            for key, value in items:
+                totals[key] = totals.get(key, 0.0) + value
+        return totals
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus 0.0.4."""
+        series = {}
+        for key, value in self.collect().items():
+            name, labels = json.loads(key)
+            series.setdefault(name, []).append((labels, value))
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.expose(series))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._keys = {}
+        registry.register(self)
+
+    def _key(self, name, values) -> str:
+        # Сериализованный ключ серии запоминается: набор меток ограничен маршрутами и кодами ответа
+        cache_key = (name, *(values[label] for label in self.labels), values.get('le'))
+        key = self._keys.get(cache_key)
+        if key is None:
+            labels = [[label, str(values[label])] for label in self.labels]
+            if 'le' in values:
+                labels.append(['le', values['le']])
+            key = self._keys[cache_key] = json.dumps([name, labels], ensure_ascii=False)
+        return key
+
+    def inc(self, amount: float = 1, **labels):
+        registry.store().add(self._key(self.name, labels), amount)
+
+    def expose(self, series):
+        for labels, value in sorted(series.get(self.name, ())):
+            yield f'{self.name}{_format_labels(labels)} {_format_value(value)}'
+
+
+class Histogram(Counter):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        store = registry.store()
+        # Корзины хранятся без накопления (одна запись на наблюдение), накапливаются при выводе
+        bucket = next((str(bound) for bound in self.buckets if value <= bound), '+Inf')
+        store.add(self._key(f'{self.name}_bucket', {**labels, 'le': bucket}), 1)
+        store.add(self._key(f'{self.name}_sum', labels), value)
+        store.add(self._key(f'{self.name}_count', labels), 1)
+
+    def expose(self, series):
+        buckets = {}
+        for labels, value in series.get(f'{self.name}_bucket', ()):
+            *group, (_, bound) = labels
+            buckets.setdefault(tuple(map(tuple, group)), {})[bound] = value
+        sums = {tuple(map(tuple, labels)): value for labels, value in series.get(f'{self.name}_sum', ())}
+        counts = {tuple(map(tuple, labels)): value for labels, value in series.get(f'{self.name}_count', ())}
+        for group in sorted(counts):
+            cumulative = 0.0
+            for bound in [*map(str, self.buckets), '+Inf']:
+                cumulative += buckets.get(group, {}).get(bound, 0.0)
+                labels = _format_labels([*group, ('le', bound)])
+                yield f'{self.name}_bucket{labels} {_format_value(cumulative)}'
+            yield f'{self.name}_sum{_format_labels(group)} {_format_value(sums.get(group, 0.0))}'
+            yield f'{self.name}_count{_format_labels(group)} {_format_value(counts[group])}'
+
+
+HTTP_REQUESTS = Counter(
+    'listings_http_requests_total', 'HTTP запросы по маршруту, методу и коду ответа', ('route', 'method', 'status'),
+)
+HTTP_LATENCY = Histogram(
+    'listings_http_request_duration_seconds', 'Время обработки запроса', ('route', 'status'),
+)
+HTTP_QUERIES = Histogram(
+    'listings_http_request_queries', 'SQL запросов на HTTP запрос', ('route',), buckets=QUERY_BUCKETS,
+)
+HTTP_SQL_SECONDS = Counter(
+    'listings_http_sql_seconds_total', 'Суммарное время SQL запросов', ('route',),
+)
+CACHE_REQUESTS = Counter(
+    'listings_response_cache_total', 'Обращения к кэшу ответов (result: hit/miss)', ('view', 'result'),
+)
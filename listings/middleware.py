@@ -0,0 +1,124 @@
+# listings/middleware.py
+"""
+Замеры запросов: SQL, работа view, сериализация и рендеринг
+
+ServerTimingMiddleware считает для запроса число SQL запросов и их суммарное время
+(connection.execute_wrapper), самые медленные запросы, время view, сериализации
+(участки listings.timing.timed('serialize') в сериализаторах) и рендеринга шаблона или JSON
+(TemplateResponse и Response DRF рендерятся после view). Результат - заголовок
+Server-Timing (LISTINGS_SERVER_TIMING, по умолчанию при DEBUG), строка JSON в логгере
+listings.timing для доли запросов LISTINGS_TIMING_SAMPLE_RATE и метрики Prometheus
+(listings.metrics, LISTINGS_METRICS_ENABLED). Если все выключено (по умолчанию без DEBUG),
+запрос проходит без замеров.
+"""
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import metrics
+from .profiling import RequestProfiler, requested_mode
+from .timing import RequestTimings, current_timings
+
+logger = logging.getLogger('listings.timing')
+
+
+class ServerTimingMiddleware:
+    """Server-Timing, выборочный лог замеров и метрики запросов (ставится сразу после SecurityMiddleware)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        header = getattr(settings, 'LISTINGS_SERVER_TIMING', settings.DEBUG)
+        sample_rate = getattr(settings, 'LISTINGS_TIMING_SAMPLE_RATE', 0.0)
+        sampled = sample_rate and random.random() < sample_rate
+        collect_metrics = metrics.enabled()
+        if not (header or sampled or collect_metrics):
+            return self.get_response(request)
+
+        timings = request._timings = RequestTimings(getattr(settings, 'LISTINGS_TIMING_SLOWEST', 3))
+        token = current_timings.set(timings)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings.execute_wrapper))
+                response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        now = time.perf_counter()
+        if timings.view_started is not None and 'view' not in timings.spans:
+            # Ответ без отложенного рендеринга (HttpResponse, 304, редирект)
+            timings.add_span('view', now - timings.view_started)
+        total = now - timings.started
+
+        if header:
+            response['Server-Timing'] = timings.server_timing(total)
+        if sampled:
+            logger.info(json.dumps(timings.as_log(request, response, total), ensure_ascii=False))
+        if collect_metrics:
+            self.record_metrics(request, response, timings, total)
+        return response
+
+    @staticmethod
+    def record_metrics(request, response, timings, total):
+        # Имя маршрута, а не путь: число серий не растет с числом объектов
+        match = request.resolver_match
+        route = match.view_name if match is not None else 'unmatched'
+        status = response.status_code
+        metrics.HTTP_REQUESTS.inc(route=route, method=request.method, status=status)
+        metrics.HTTP_LATENCY.observe(total, route=route, status=status)
+        metrics.HTTP_QUERIES.observe(timings.queries, route=route)
+        metrics.HTTP_SQL_SECONDS.inc(timings.sql, route=route)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = getattr(request, '_timings', None)
+        if timings is not None:
+            timings.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # Вызывается после view и до рендеринга TemplateResponse / Response DRF
+        timings = getattr(request, '_timings', None)
+        if timings is not None and timings.view_started is not None:
+            render_started = time.perf_counter()
+            timings.add_span('view', render_started - timings.view_started)
+
+            def rendered(response):
+                timings.add_span('render', time.perf_counter() - render_started)
+            response.add_post_render_callback(rendered)
+        return response
+
+
+class ProfilerMiddleware:
+    """Профиль одного запроса по заголовку X-Profile (подписанный токен) или ?_profile для сотрудников.
+
+    Ставится после AuthenticationMiddleware. Без LISTINGS_PROFILE_DIR ничего не делает.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = requested_mode(request) if getattr(settings, 'LISTINGS_PROFILE_DIR', None) else None
+        if mode is None:
+            return self.get_response(request)
+
+        profiler = RequestProfiler(mode)
+        if not profiler.start():
+            response = self.get_response(request)
+            response['X-Profile'] = 'busy'
+            return response
+        try:
+            response = self.get_response(request)
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+        finally:
+            profiler.stop()
+        match = request.resolver_match
+        label = match.view_name if match is not None else request.path
+        response['X-Profile'] = profiler.save(f'{request.method}-{label}')
+        return response
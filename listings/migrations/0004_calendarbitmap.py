@@ -0,0 +1,27 @@
+# Generated by Django 6.0 on 2026-10-16 09:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0003_alter_listing_list_date_alter_listing_photo_main'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalendarBitmap',
+            fields=[
+                ('listing', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='calendar_bitmap', serialize=False, to='listings.listing')),
+                ('start_date', models.DateField(verbose_name='Начало горизонта')),
+                ('bits', models.BinaryField(verbose_name='Закрытые ночи')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Битовая карта календаря',
+                'verbose_name_plural': 'Битовые карты календаря',
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 6.0 on 2026-10-16 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0004_calendarbitmap'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='idempotency_key',
+            field=models.CharField(blank=True, help_text='Повторный запрос с тем же ключом вернет ту же бронь', max_length=64, null=True, verbose_name='Ключ идемпотентности'),
+        ),
+        migrations.AddConstraint(
+            model_name='booking',
+            constraint=models.UniqueConstraint(fields=('guest', 'idempotency_key'), name='listings_booking_guest_idempotency_uniq'),
+        ),
+    ]
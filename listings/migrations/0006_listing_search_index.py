@@ -0,0 +1,39 @@
+from django.db import migrations
+
+# Полнотекстовый индекс объектов для listings.search.SQLiteFTS5Backend (только SQLite)
+CREATE_SQL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS listings_listing_fts USING fts5(
+    title, description, address, city,
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+)
+"""
+
+FILL_SQL = """
+INSERT INTO listings_listing_fts (rowid, title, description, address, city)
+SELECT id, COALESCE(title, ''), COALESCE(description, ''), COALESCE(address, ''), COALESCE(city, '')
+FROM listings_listing
+"""
+
+
+def create_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE_SQL)
+    schema_editor.execute(FILL_SQL)
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS listings_listing_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0005_booking_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0006_listing_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(
+                condition=models.Q(is_published=True),
+                fields=['is_verified', 'list_date', 'id'],
+                name='listings_li_pub_order_idx',
+            ),
+        ),
+    ]
@@ -0,0 +1,99 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0007_listing_pub_order_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='rating_count',
+            field=models.IntegerField(default=0, verbose_name='Кол-во отзывов'),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='rating_sum',
+            field=models.IntegerField(default=0, verbose_name='Сумма оценок'),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='rating_avg',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=3, null=True, verbose_name='Средняя оценка'),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='rating_1',
+            field=models.IntegerField(default=0, verbose_name='Оценок 1'),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='rating_2',
+            field=models.IntegerField(default=0, verbose_name='Оценок 2'),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='rating_3',
+            field=models.IntegerField(default=0, verbose_name='Оценок 3'),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='rating_4',
+            field=models.IntegerField(default=0, verbose_name='Оценок 4'),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='rating_5',
+            field=models.IntegerField(default=0, verbose_name='Оценок 5'),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='cleanliness_sum',
+            field=models.IntegerField(default=0, verbose_name='Сумма оценок чистоты'),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='cleanliness_count',
+            field=models.IntegerField(default=0, verbose_name='Оценок чистоты'),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='communication_sum',
+            field=models.IntegerField(default=0, verbose_name='Сумма оценок коммуникации'),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='communication_count',
+            field=models.IntegerField(default=0, verbose_name='Оценок коммуникации'),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='location_sum',
+            field=models.IntegerField(default=0, verbose_name='Сумма оценок расположения'),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='location_count',
+            field=models.IntegerField(default=0, verbose_name='Оценок расположения'),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='value_sum',
+            field=models.IntegerField(default=0, verbose_name='Сумма оценок цена/качество'),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='value_count',
+            field=models.IntegerField(default=0, verbose_name='Оценок цена/качество'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(
+                condition=models.Q(is_published=True),
+                fields=['rating_avg', 'rating_count'],
+                name='listings_li_pub_rating_idx',
+            ),
+        ),
+    ]
@@ -0,0 +1,31 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0008_listing_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingPhoto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.ImageField(upload_to='photos/%Y/%m/%d/', verbose_name='Фото')),
+                ('content_hash', models.CharField(db_index=True, max_length=64, verbose_name='SHA-256 содержимого')),
+                ('width', models.PositiveIntegerField(blank=True, null=True, verbose_name='Ширина')),
+                ('height', models.PositiveIntegerField(blank=True, null=True, verbose_name='Высота')),
+                ('position', models.PositiveSmallIntegerField(default=0, verbose_name='Порядок')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Загружено')),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='photos', to='listings.listing', verbose_name='Объект')),
+            ],
+            options={
+                'verbose_name': 'Фото объекта',
+                'verbose_name_plural': 'Фото объектов',
+                'ordering': ['listing', 'position', 'id'],
+                'constraints': [models.UniqueConstraint(fields=('listing', 'content_hash'), name='listings_photo_listing_hash_uniq')],
+            },
+        ),
+    ]
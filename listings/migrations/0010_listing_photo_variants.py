@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0009_listingphoto'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='photo_variants',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Производные главного фото'),
+        ),
+    ]
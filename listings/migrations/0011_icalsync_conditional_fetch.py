@@ -0,0 +1,36 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0010_listing_photo_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='icalsync',
+            name='next_sync',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Следующая синхронизация'),
+        ),
+        migrations.AddField(
+            model_name='icalsync',
+            name='etag',
+            field=models.CharField(blank=True, max_length=255, verbose_name='ETag'),
+        ),
+        migrations.AddField(
+            model_name='icalsync',
+            name='last_modified',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Last-Modified'),
+        ),
+        migrations.AddField(
+            model_name='icalsync',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Хэш содержимого'),
+        ),
+        migrations.AddField(
+            model_name='icalsync',
+            name='last_error',
+            field=models.TextField(blank=True, verbose_name='Последняя ошибка'),
+        ),
+    ]
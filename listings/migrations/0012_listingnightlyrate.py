@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-17 01:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0011_icalsync_conditional_fetch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingNightlyRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Цена ночи')),
+                ('is_blocked', models.BooleanField(default=False, verbose_name='Занята')),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='nightly_rates', to='listings.listing')),
+            ],
+            options={
+                'verbose_name': 'Цена ночи',
+                'verbose_name_plural': 'Цены ночей',
+                'constraints': [models.UniqueConstraint(fields=('listing', 'date'), name='listings_nightly_rate_unique')],
+            },
+        ),
+    ]
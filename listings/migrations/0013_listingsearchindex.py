@@ -0,0 +1,27 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0012_listingnightlyrate'),
+    ]
+
+    operations = [
+        # Таблица уже создана миграцией 0006: модель только описывает ее для ORM
+        migrations.CreateModel(
+            name='ListingSearchIndex',
+            fields=[
+                ('listing', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='listings.listing')),
+                ('title', models.TextField()),
+                ('description', models.TextField()),
+                ('address', models.TextField()),
+                ('city', models.TextField()),
+            ],
+            options={
+                'db_table': 'listings_listing_fts',
+                'managed': False,
+            },
+        ),
+    ]
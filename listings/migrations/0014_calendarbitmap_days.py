@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-17 02:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0013_listingsearchindex'),
+    ]
+
+    operations = [
+        # У существующих карт 0 ночей: они не используются до пересборки (rebuild_calendar_index)
+        migrations.AddField(
+            model_name='calendarbitmap',
+            name='days',
+            field=models.PositiveIntegerField(default=0, verbose_name='Ночей в карте'),
+        ),
+    ]
@@ -1,9 +1,94 @@
 # listings/models.py
-from django.db import models
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import models, transaction
+from django.dispatch import Signal
 from django.utils import timezone
 from django.contrib.auth.models import User
 from decimal import Decimal
-from datetime import timedelta
+
+# Массовые изменения объектов, минующие post_save (аргументы listing_ids, fields и created;
+# fields - изменившиеся поля существующих объектов, None - любые; created - среди объектов
+# есть новые, bulk_create)
+listings_bulk_updated = Signal()
+
+# Брони или календарь объектов изменились (аргумент listing_ids). post_save/post_delete
+# переводятся в него в signals.py; массовые операции отправляют его сами
+calendar_changed = Signal()
+
+
+class ListingQuerySet(models.QuerySet):
+    # Поля, которых нет ни в поисковом индексе, ни в ценах ночей, ни в ответах API (кэш):
+    # update() только их выполняется без выборки id и сигнала
+    silent_fields = frozenset({'moderation_notes', 'verification_date'})
+
+    # bulk_update выполняется через update(), поэтому отдельно не переопределяется
+    def update(self, **kwargs):
+        if not set(kwargs) - self.silent_fields:
+            return super().update(**kwargs)
+        listing_ids = list(self.values_list('pk', flat=True))
+        rows = super().update(**kwargs)
+        if listing_ids:
+            listings_bulk_updated.send(sender=self.model, listing_ids=listing_ids, fields=set(kwargs))
+        return rows
+
+    update.alters_data = True
+
+    def bulk_create(self, objs, batch_size=None, ignore_conflicts=False, update_conflicts=False,
+                    update_fields=None, unique_fields=None):
+        objs = super().bulk_create(
+            objs, batch_size=batch_size, ignore_conflicts=ignore_conflicts, update_conflicts=update_conflicts,
+            update_fields=update_fields, unique_fields=unique_fields,
+        )
+        listing_ids = [obj.pk for obj in objs if obj.pk is not None]
+        if listing_ids:
+            # created: среди объектов есть новые; fields - что изменилось у существующих
+            listings_bulk_updated.send(
+                sender=self.model, listing_ids=listing_ids, created=True,
+                fields=set(update_fields) if update_conflicts else set(),
+            )
+        return objs
+
+    bulk_create.alters_data = True
+
+
+class CalendarQuerySet(models.QuerySet):
+    """update() и bulk_create() броней и календаря отправляют calendar_changed, как ListingQuerySet"""
+    # Поля, от которых зависят занятость и цены ночей; update() остальных полей сигнал не отправляет
+    calendar_fields = frozenset()
+
+    def update(self, **kwargs):
+        if not self.calendar_fields & set(kwargs):
+            return super().update(**kwargs)
+        listing_ids = set(self.values_list('listing_id', flat=True))
+        rows = super().update(**kwargs)
+        # Строки, перенесенные к другому объекту, меняют и его календарь
+        listing = kwargs.get('listing_id', kwargs.get('listing'))
+        listing = getattr(listing, 'pk', listing)
+        if isinstance(listing, int):
+            listing_ids.add(listing)
+        if listing_ids:
+            calendar_changed.send(sender=self.model, listing_ids=sorted(listing_ids))
+        return rows
+
+    update.alters_data = True
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        listing_ids = {obj.listing_id for obj in objs}
+        if listing_ids:
+            calendar_changed.send(sender=self.model, listing_ids=sorted(listing_ids))
+        return objs
+
+    bulk_create.alters_data = True
+
+
+class BookingQuerySet(CalendarQuerySet):
+    calendar_fields = frozenset({'listing', 'listing_id', 'check_in', 'check_out', 'status'})
+
+
+class AvailabilityQuerySet(CalendarQuerySet):
+    calendar_fields = frozenset({'listing', 'listing_id', 'date', 'is_available', 'price_override'})
+
 
 class Listing(models.Model):
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='listings', verbose_name="Владелец", null=True, blank=True)
@@ -31,6 +116,8 @@ class Listing(models.Model):
     monthly_discount = models.IntegerField("Скидка за месяц (%)", default=0, null=True, blank=True)
     
     photo_main = models.ImageField("Главное фото", upload_to='photos/%Y/%m/%d/', blank=True, null=True)
+    # Уменьшенные копии главного фото: {"source": имя фото, "webp": {"320": имя файла, ...}, "jpeg": {...}}
+    photo_variants = models.JSONField("Производные главного фото", default=dict, blank=True)
     
     is_verified = models.BooleanField("Проверено", default=False, null=True, blank=True)
     is_published = models.BooleanField("Опубликовано", default=True)
@@ -54,6 +141,26 @@ class Listing(models.Model):
     list_date = models.DateTimeField("Дата создания", default=timezone.now, blank=True)
     updated_at = models.DateTimeField("Обновлено", auto_now=True, null=True, blank=True)
 
+    # Агрегаты отзывов: обновляются RatingService при сохранении и удалении Review
+    rating_count = models.IntegerField("Кол-во отзывов", default=0)
+    rating_sum = models.IntegerField("Сумма оценок", default=0)
+    rating_avg = models.DecimalField("Средняя оценка", max_digits=3, decimal_places=2, null=True, blank=True)
+    rating_1 = models.IntegerField("Оценок 1", default=0)
+    rating_2 = models.IntegerField("Оценок 2", default=0)
+    rating_3 = models.IntegerField("Оценок 3", default=0)
+    rating_4 = models.IntegerField("Оценок 4", default=0)
+    rating_5 = models.IntegerField("Оценок 5", default=0)
+    cleanliness_sum = models.IntegerField("Сумма оценок чистоты", default=0)
+    cleanliness_count = models.IntegerField("Оценок чистоты", default=0)
+    communication_sum = models.IntegerField("Сумма оценок коммуникации", default=0)
+    communication_count = models.IntegerField("Оценок коммуникации", default=0)
+    location_sum = models.IntegerField("Сумма оценок расположения", default=0)
+    location_count = models.IntegerField("Оценок расположения", default=0)
+    value_sum = models.IntegerField("Сумма оценок цена/качество", default=0)
+    value_count = models.IntegerField("Оценок цена/качество", default=0)
+
+    objects = ListingQuerySet.as_manager()
+
     def __str__(self):
         return self.title
     
@@ -66,25 +173,255 @@ class Listing(models.Model):
     
     def calculate_total_price(self, check_in, check_out):
         """Рассчитывает общую стоимость бронирования"""
-        total = Decimal('0.00')
-        current_date = check_in
-        nights = 0
-        
-        while current_date < check_out:
-            total += self.get_price_for_date(current_date)
-            current_date += timedelta(days=1)
-            nights += 1
-        
-        if nights >= 30 and self.monthly_discount:
-            discount = total * Decimal(str(self.monthly_discount)) / 100
-            total -= discount
-        elif nights >= 7 and self.weekly_discount:
-            discount = total * Decimal(str(self.weekly_discount)) / 100
-            total -= discount
-        
-        return total
+        from .services import PricingService
+        return PricingService.calculate_total_price(self, check_in, check_out)
+
+    @property
+    def photo_srcset(self):
+        """srcset производных главного фото по форматам ({} - производные еще не созданы)"""
+        from .images import srcset
+        return srcset(self.photo_variants, self.photo_main.name, self.photo_main.storage.url)
 
     class Meta:
         verbose_name = "Объявление"
         verbose_name_plural = "Объявления"
-        ordering = ['-is_verified', '-list_date']
\ No newline at end of file
+        indexes = [
+            models.Index(fields=['city', 'is_published', 'is_verified'], name='listings_li_city_d4bef6_idx'),
+            # Используется GeoService.filter_bbox для отсечения по прямоугольнику
+            models.Index(fields=['latitude', 'longitude'], name='listings_li_latitud_6dd1bf_idx'),
+            # Порядок выдачи каталога для KeysetPagination (-is_verified, -list_date, -id).
+            # Частичный индекс: SQLite не применяет составной индекс к условию WHERE "is_published"
+            models.Index(
+                fields=['is_verified', 'list_date', 'id'],
+                condition=models.Q(is_published=True),
+                name='listings_li_pub_order_idx',
+            ),
+            # Сортировка каталога по рейтингу (?ordering=-rating_avg)
+            models.Index(
+                fields=['rating_avg', 'rating_count'],
+                condition=models.Q(is_published=True),
+                name='listings_li_pub_rating_idx',
+            ),
+        ]
+        ordering = ['-is_verified', '-list_date']
+
+
+class ListingPhoto(models.Model):
+    """Фото объекта. Файл хранится под хэшем содержимого: одинаковые фото разных объектов - один файл."""
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='photos', verbose_name="Объект")
+    image = models.ImageField("Фото", upload_to='photos/%Y/%m/%d/')
+    content_hash = models.CharField("SHA-256 содержимого", max_length=64, db_index=True)
+    width = models.PositiveIntegerField("Ширина", null=True, blank=True)
+    height = models.PositiveIntegerField("Высота", null=True, blank=True)
+    position = models.PositiveSmallIntegerField("Порядок", default=0)
+    created_at = models.DateTimeField("Загружено", auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.listing_id}: {self.image.name}'
+
+    def save(self, *args, **kwargs):
+        # Фото, загруженные через админку; create_listings_from_images заполняет поля сам
+        if not self.content_hash and self.image:
+            from .images import file_hash
+            self.content_hash = file_hash(self.image)
+            self.width, self.height = self.image.width, self.image.height
+        super().save(*args, **kwargs)
+
+    class Meta:
+        verbose_name = "Фото объекта"
+        verbose_name_plural = "Фото объектов"
+        ordering = ['listing', 'position', 'id']
+        constraints = [
+            models.UniqueConstraint(fields=['listing', 'content_hash'], name='listings_photo_listing_hash_uniq'),
+        ]
+
+
+class Booking(models.Model):
+    ACTIVE_STATUSES = ('pending', 'confirmed')
+
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='bookings')
+    guest = models.ForeignKey(User, on_delete=models.CASCADE, related_name='bookings_as_guest', verbose_name="Гость")
+    check_in = models.DateField("Заезд")
+    check_out = models.DateField("Выезд")
+    guests_count = models.IntegerField("Кол-во гостей", validators=[MinValueValidator(1)])
+    total_price = models.DecimalField("Общая цена", max_digits=10, decimal_places=2)
+    status = models.CharField("Статус", max_length=20, choices=[
+        ('pending', 'Ожидает подтверждения'), ('confirmed', 'Подтверждено'),
+        ('cancelled', 'Отменено'), ('completed', 'Завершено'),
+    ], default='pending')
+    owner_response = models.BooleanField("Ответ владельца", null=True, blank=True, help_text='True - принято, False - отклонено')
+    owner_response_at = models.DateTimeField("Время ответа", null=True, blank=True)
+    payment_status = models.CharField("Статус оплаты", max_length=20, choices=[
+        ('pending', 'Ожидает оплаты'), ('paid', 'Оплачено'), ('refunded', 'Возвращено'),
+    ], default='pending')
+    payment_date = models.DateTimeField("Дата оплаты", null=True, blank=True)
+    created_at = models.DateTimeField("Создано", auto_now_add=True)
+    updated_at = models.DateTimeField("Обновлено", auto_now=True)
+    cancelled_at = models.DateTimeField("Отменено", null=True, blank=True)
+    cancellation_reason = models.TextField("Причина отмены", blank=True)
+    special_requests = models.TextField("Особые пожелания", blank=True)
+    idempotency_key = models.CharField("Ключ идемпотентности", max_length=64, null=True, blank=True,
+                                       help_text='Повторный запрос с тем же ключом вернет ту же бронь')
+
+    objects = BookingQuerySet.as_manager()
+
+    def __str__(self):
+        return f'{self.listing} ({self.check_in} - {self.check_out})'
+
+    @property
+    def nights(self):
+        return (self.check_out - self.check_in).days
+
+    class Meta:
+        verbose_name = "Бронирование"
+        verbose_name_plural = "Бронирования"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['listing', 'check_in', 'check_out', 'status'], name='listings_bo_listing_e5744d_idx'),
+            models.Index(fields=['guest', 'status'], name='listings_bo_guest_i_ef7653_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['guest', 'idempotency_key'], name='listings_booking_guest_idempotency_uniq'),
+        ]
+
+
+class Review(models.Model):
+    SUBRATINGS = ('cleanliness', 'communication', 'location', 'value')
+
+    booking = models.OneToOneField(Booking, on_delete=models.CASCADE, related_name='review', verbose_name="Бронирование")
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='reviews', verbose_name="Объект")
+    reviewer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reviews_given', verbose_name="Автор отзыва")
+    rating = models.IntegerField("Рейтинг", validators=[MinValueValidator(1), MaxValueValidator(5)])
+    comment = models.TextField("Комментарий", blank=True)
+    cleanliness_rating = models.IntegerField("Чистота", null=True, blank=True,
+                                             validators=[MinValueValidator(1), MaxValueValidator(5)])
+    communication_rating = models.IntegerField("Коммуникация", null=True, blank=True,
+                                               validators=[MinValueValidator(1), MaxValueValidator(5)])
+    location_rating = models.IntegerField("Расположение", null=True, blank=True,
+                                          validators=[MinValueValidator(1), MaxValueValidator(5)])
+    value_rating = models.IntegerField("Соотношение цена/качество", null=True, blank=True,
+                                       validators=[MinValueValidator(1), MaxValueValidator(5)])
+    is_verified = models.BooleanField("Верифицирован", default=True, help_text='Отзыв от реального гостя')
+    created_at = models.DateTimeField("Создано", auto_now_add=True)
+    updated_at = models.DateTimeField("Обновлено", auto_now=True)
+
+    def __str__(self):
+        return f'{self.listing}: {self.rating}'
+
+    def save(self, *args, **kwargs):
+        """Сохраняет отзыв и в той же транзакции обновляет агрегаты объекта."""
+        from .services import RatingService
+        with transaction.atomic():
+            previous = None
+            if self.pk is not None:
+                previous = Review.objects.select_for_update().filter(pk=self.pk).first()
+            super().save(*args, **kwargs)
+            if previous is not None:
+                RatingService.remove(previous)
+            RatingService.add(self)
+
+    class Meta:
+        verbose_name = "Отзыв"
+        verbose_name_plural = "Отзывы"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['listing', 'rating'], name='listings_re_listing_bc67c1_idx'),
+        ]
+
+
+class Availability(models.Model):
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='availabilities')
+    date = models.DateField("Дата")
+    is_available = models.BooleanField("Доступно", default=True)
+    price_override = models.DecimalField("Особая цена", max_digits=10, decimal_places=2, null=True, blank=True,
+                                         help_text='Переопределение цены на эту дату')
+    notes = models.CharField("Заметки", max_length=255, blank=True)
+    source = models.CharField("Источник", max_length=50, choices=[
+        ('manual', 'Ручное управление'), ('ical', 'iCal синхронизация'), ('booking', 'Бронирование'),
+    ], default='manual')
+    external_id = models.CharField("Внешний ID", max_length=100, blank=True, help_text='ID события во внешнем календаре')
+
+    objects = AvailabilityQuerySet.as_manager()
+
+    def __str__(self):
+        return f'{self.listing} {self.date}'
+
+    class Meta:
+        verbose_name = "Доступность"
+        verbose_name_plural = "Доступности"
+        ordering = ['date']
+        unique_together = [('listing', 'date')]
+        indexes = [
+            models.Index(fields=['listing', 'date', 'is_available'], name='listings_av_listing_68e214_idx'),
+        ]
+
+
+class ICalSync(models.Model):
+    """Внешний iCal календарь объекта; занятые в нем ночи переносятся в Availability (source='ical')"""
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='ical_syncs')
+    url = models.URLField("iCal URL", help_text='Ссылка на iCal календарь')
+    is_active = models.BooleanField("Активна", default=True)
+    last_sync = models.DateTimeField("Последняя синхронизация", null=True, blank=True)
+    sync_frequency = models.IntegerField("Частота синхронизации (минуты)", default=60,
+                                         help_text='Как часто обновлять календарь')
+    next_sync = models.DateTimeField("Следующая синхронизация", null=True, blank=True, db_index=True)
+    # Валидаторы условного запроса (If-None-Match / If-Modified-Since) и хэш последнего
+    # загруженного календаря - для серверов, которые их не поддерживают
+    etag = models.CharField("ETag", max_length=255, blank=True)
+    last_modified = models.CharField("Last-Modified", max_length=64, blank=True)
+    content_hash = models.CharField("Хэш содержимого", max_length=64, blank=True)
+    last_error = models.TextField("Последняя ошибка", blank=True)
+
+    def __str__(self):
+        return f'{self.listing} {self.url}'
+
+    class Meta:
+        verbose_name = "Синхронизация iCal"
+        verbose_name_plural = "Синхронизации iCal"
+
+
+class CalendarBitmap(models.Model):
+    """Битовая карта закрытых ночей объекта на скользящий горизонт (бит i - ночь start_date + i)"""
+    listing = models.OneToOneField(Listing, on_delete=models.CASCADE, primary_key=True, related_name='calendar_bitmap')
+    start_date = models.DateField("Начало горизонта")
+    bits = models.BinaryField("Закрытые ночи")
+    # Байты дополнены до целого, поэтому число ночей карты хранится отдельно
+    days = models.PositiveIntegerField("Ночей в карте", default=0)
+    updated_at = models.DateTimeField("Обновлено", auto_now=True)
+
+    class Meta:
+        verbose_name = "Битовая карта календаря"
+        verbose_name_plural = "Битовые карты календаря"
+
+
+class ListingSearchIndex(models.Model):
+    """Строка полнотекстового индекса объекта (FTS5, только SQLite; таблицу создает миграция 0006)
+
+    Нужна, чтобы listings.search присоединял индекс к запросу объектов через ORM.
+    Индекс заполняет бэкенд поиска, а не сохранение модели.
+    """
+    listing = models.OneToOneField(Listing, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid',
+                                   related_name='search_index')
+    title = models.TextField()
+    description = models.TextField()
+    address = models.TextField()
+    city = models.TextField()
+
+    class Meta:
+        managed = False
+        db_table = 'listings_listing_fts'
+
+
+class ListingNightlyRate(models.Model):
+    """Цена и занятость ночи объекта на скользящий горизонт: стоимость периода считается SUM в БД"""
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='nightly_rates')
+    date = models.DateField("Дата")
+    price = models.DecimalField("Цена ночи", max_digits=10, decimal_places=2)
+    is_blocked = models.BooleanField("Занята", default=False)
+
+    class Meta:
+        verbose_name = "Цена ночи"
+        verbose_name_plural = "Цены ночей"
+        constraints = [
+            models.UniqueConstraint(fields=['listing', 'date'], name='listings_nightly_rate_unique'),
+        ]
@@ -0,0 +1,163 @@
+# listings/pagination.py
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import BooleanField, F, Func, Value
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class RowCompare(Func):
+    """Сравнение кортежей (a, b, c) < (x, y, z): индекс используется как один диапазон.
+
+    Развернутое условие a < x OR (a = x AND b < y) OR ... SQLite не может превратить
+    в поиск по индексу и перебирает все строки группы a = x, как при OFFSET.
+    """
+    output_field = BooleanField()
+
+    def __init__(self, fields, operator, values):
+        self.width = len(fields)
+        self.operator = operator
+        super().__init__(*[F(field) for field in fields], *[Value(value) for value in values])
+
+    def as_sql(self, compiler, connection, **extra_context):
+        parts, params = [], []
+        for expression in self.get_source_expressions():
+            sql, expression_params = compiler.compile(expression)
+            parts.append(sql)
+            params.extend(expression_params)
+        lhs = ', '.join(parts[:self.width])
+        rhs = ', '.join(parts[self.width:])
+        return f'({lhs}) {self.operator} ({rhs})', params
+
+
+class KeysetPagination(BasePagination):
+    """Постраничная выдача по ключу (keyset) без COUNT(*) и OFFSET.
+
+    Курсор хранит значения полей ordering последней строки страницы, следующая страница
+    начинается строго после них. Все поля ordering должны сортироваться в одном направлении,
+    последнее поле - уникальное (id). Если queryset упорядочен иначе (явный ?ordering=,
+    релевантность, расстояние), используется обычная нумерация страниц.
+    """
+    ordering = ('-is_verified', '-list_date', '-id')
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор'
+    fallback_class = PageNumberPagination
+    fields = tuple(field.lstrip('-') for field in ordering)
+
+    def __init__(self):
+        self.fallback = None
+        self.descending = self.ordering[0].startswith('-')
+
+    def uses_keyset(self, queryset):
+        order_by = tuple(queryset.query.order_by) or tuple(queryset.model._meta.ordering)
+        return (
+            not queryset.query.extra_order_by
+            and self.ordering[:len(order_by)] == order_by
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.uses_keyset(queryset):
+            self.fallback = self.fallback_class()
+            return self.fallback.paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request)
+
+        # Страница "назад" выбирается в обратном порядке и затем разворачивается
+        forward = self.descending != reverse
+        if position is not None:
+            queryset = queryset.filter(RowCompare(self.fields, '<' if forward else '>', position))
+        queryset = queryset.order_by(*[f'-{field}' if forward else field for field in self.fields])
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.next_position = self.position(rows[-1]) if rows and (has_more or reverse) else None
+        self.previous_position = self.position(rows[0]) if rows and (position is not None and (has_more or not reverse)) else None
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def position(self, row):
+        if isinstance(row, dict):
+            return [row[field] for field in self.fields]
+        return [getattr(row, field) for field in self.fields]
+
+    def encode_cursor(self, position, reverse):
+        values = [value.isoformat() if isinstance(value, datetime) else value for value in position]
+        payload = json.dumps({'p': values, 'r': int(reverse)}, separators=(',', ':'))
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            values = payload['p']
+            if len(values) != len(self.fields):
+                raise ValueError
+            position = [self.parse_value(value) for value in values]
+            return position, bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, AttributeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def parse_value(value):
+        if isinstance(value, str):
+            parsed = parse_datetime(value)
+            if parsed is None:
+                raise ValueError
+            return parsed
+        if isinstance(value, (bool, int)):
+            return value
+        raise ValueError
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position, reverse=False)
+
+    def get_previous_link(self):
+        if self.previous_position is None:
+            return None
+        return self.encode_cursor(self.previous_position, reverse=True)
+
+    def get_paginated_response(self, data):
+        if self.fallback is not None:
+            return self.fallback.get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
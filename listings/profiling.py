@@ -0,0 +1,155 @@
+# listings/profiling.py
+"""
+Профилирование отдельных запросов (ProfilerMiddleware)
+
+Два профилировщика:
+- cprofile - детерминированный cProfile, результат в .prof (pstats; snakeviz, gprof2dot);
+- sampling - снимки стека потока запроса с интервалом LISTINGS_PROFILE_INTERVAL,
+  результат в .collapsed ("кадр;кадр;кадр число" - формат flamegraph.pl и speedscope).
+  Накладные расходы меньше, но короткие запросы дают мало снимков.
+
+Файлы пишутся в LISTINGS_PROFILE_DIR; хранится LISTINGS_PROFILE_KEEP последних.
+"""
+import cProfile
+import glob
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+from django.conf import settings
+from django.core import signing
+
+MODES = ('cprofile', 'sampling')
+TOKEN_SALT = 'listings.profile'
+# cProfile в Python 3.12 один на интерпретатор: одновременно профилируется один запрос
+_profiler_lock = threading.Lock()
+
+
+def make_token() -> str:
+    """Подписанное значение заголовка X-Profile (действует LISTINGS_PROFILE_TOKEN_AGE секунд)."""
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign('profile')
+
+
+def check_token(value: str) -> bool:
+    max_age = getattr(settings, 'LISTINGS_PROFILE_TOKEN_AGE', 3600)
+    try:
+        return signing.TimestampSigner(salt=TOKEN_SALT).unsign(value, max_age=max_age) == 'profile'
+    except signing.BadSignature:
+        return False
+
+
+class SamplingProfiler:
+    """Снимки стека одного потока из фонового потока"""
+
+    def __init__(self, interval: float = 0.001):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._thread_id = None
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def enable(self):
+        self._thread_id = threading.get_ident()
+        self._sampler = threading.Thread(target=self._run, name='listings-profile-sampler', daemon=True)
+        self._sampler.start()
+
+    def disable(self):
+        self._stop.set()
+        self._sampler.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def dump(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+class RequestProfiler:
+    """Профилировщик одного запроса: start(), stop(), save()"""
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        if mode == 'sampling':
+            self.profiler = SamplingProfiler(getattr(settings, 'LISTINGS_PROFILE_INTERVAL', 0.001))
+        else:
+            self.profiler = cProfile.Profile()
+        self.started = None
+        self.elapsed = None
+
+    def start(self) -> bool:
+        """False, если уже профилируется другой запрос."""
+        if not _profiler_lock.acquire(blocking=False):
+            return False
+        self.started = time.perf_counter()
+        self.profiler.enable()
+        return True
+
+    def stop(self):
+        self.profiler.disable()
+        self.elapsed = time.perf_counter() - self.started
+        _profiler_lock.release()
+
+    def save(self, label: str) -> str:
+        """Записывает результат в LISTINGS_PROFILE_DIR и удаляет старые файлы; возвращает имя файла."""
+        directory = settings.LISTINGS_PROFILE_DIR
+        os.makedirs(directory, exist_ok=True)
+        label = re.sub(r'[^\w.-]+', '_', label).strip('_')[:80] or 'request'
+        extension = 'collapsed' if self.mode == 'sampling' else 'prof'
+        now = time.time()
+        stamp = f'{time.strftime("%Y%m%d-%H%M%S", time.localtime(now))}.{int(now * 1000) % 1000:03d}'
+        name = f'{stamp}-{os.getpid()}-{label}-{self.elapsed * 1000:.0f}ms.{extension}'
+        path = os.path.join(directory, name)
+        if self.mode == 'sampling':
+            self.profiler.dump(path)
+        else:
+            self.profiler.dump_stats(path)
+        rotate(directory, getattr(settings, 'LISTINGS_PROFILE_KEEP', 50))
+        return name
+
+
+def rotate(directory: str, keep: int):
+    """Оставляет keep самых новых файлов профилей каталога."""
+    paths = glob.glob(os.path.join(directory, '*.prof')) + glob.glob(os.path.join(directory, '*.collapsed'))
+    if len(paths) <= keep:
+        return
+    paths.sort(key=os.path.getmtime, reverse=True)
+    for path in paths[keep:]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass  # удален параллельным процессом
+
+
+def requested_mode(request) -> Optional[str]:
+    """Режим профилирования, если запрос его просит и имеет на это право, иначе None."""
+    token = request.headers.get('X-Profile')
+    if token is not None:
+        if not check_token(token):
+            return None
+        mode = request.headers.get('X-Profile-Mode', 'cprofile')
+    else:
+        flag = request.GET.get('_profile')
+        if flag is None:
+            return None
+        user = getattr(request, 'user', None)
+        if user is None or not (user.is_active and user.is_staff):
+            return None
+        mode = 'cprofile' if flag in ('', '1') else flag
+    return mode if mode in MODES else None
@@ -0,0 +1,133 @@
+# listings/search.py
+"""
+Полнотекстовый поиск по объектам
+
+Бэкенд выбирается настройкой LISTINGS_SEARCH_BACKEND (путь к классу). По умолчанию
+на SQLite используется FTS5, на остальных БД - icontains по полям объекта.
+"""
+import re
+from functools import lru_cache
+from typing import Iterable, List
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import BooleanField, FloatField, Q, QuerySet
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+# Поля объекта, попадающие в индекс, и их веса при ранжировании
+SEARCH_FIELDS = ('title', 'description', 'address', 'city')
+SEARCH_WEIGHTS = (10.0, 1.0, 3.0, 5.0)
+
+
+def _tokens(query: str) -> List[str]:
+    return [token for token in re.split(r'[\W_]+', query) if token]
+
+
+class IContainsBackend:
+    """Поиск через icontains: без индекса, работает на любой БД."""
+
+    def search(self, queryset: QuerySet, query: str) -> QuerySet:
+        """Объекты, содержащие все слова запроса (в любом из полей)."""
+        for token in _tokens(query):
+            condition = Q()
+            for field in SEARCH_FIELDS:
+                condition |= Q(**{f'{field}__icontains': token})
+            queryset = queryset.filter(condition)
+        return queryset
+
+    def filter_city(self, queryset: QuerySet, city: str) -> QuerySet:
+        return queryset.filter(city__icontains=city)
+
+    def index(self, listing_ids: Iterable[int]):
+        pass
+
+    def rebuild(self, chunk_size: int = 5000):
+        return iter(())
+
+
+class SQLiteFTS5Backend(IContainsBackend):
+    """Индекс FTS5 (виртуальная таблица listings_listing_fts, rowid = id объекта)."""
+
+    table = 'listings_listing_fts'
+
+    @staticmethod
+    def match_expression(query: str, column: str = None) -> str:
+        """Запрос FTS5: все слова обязательны, каждое ищется как префикс."""
+        terms = ' '.join('"{}"*'.format(token.replace('"', '""')) for token in _tokens(query))
+        if column and terms:
+            return f'{column} : ({terms})'
+        return terms
+
+    def search(self, queryset: QuerySet, query: str) -> QuerySet:
+        """Совпадения по индексу с аннотацией search_rank (bm25: чем меньше, тем релевантнее)."""
+        match = self.match_expression(query)
+        if not match:
+            return queryset
+        weights = ', '.join(str(weight) for weight in SEARCH_WEIGHTS)
+        # Индекс присоединяется к запросу (ListingSearchIndex): bm25() доступна только в
+        # запросе, где таблица FTS5 участвует в MATCH, а коррелированный подзапрос
+        # выполнял бы MATCH заново для каждой строки
+        return queryset.filter(
+            RawSQL(f'{self.table} MATCH %s', [match], output_field=BooleanField()),
+            search_index__isnull=False,
+        ).annotate(
+            search_rank=RawSQL(f'bm25({self.table}, {weights})', [], output_field=FloatField()),
+        )
+
+    def index(self, listing_ids: Iterable[int]):
+        """Переиндексирует объекты; удаленные объекты просто пропадают из индекса."""
+        listing_ids = list(listing_ids)
+        if not listing_ids:
+            return
+        columns = ', '.join(SEARCH_FIELDS)
+        coalesced = ', '.join(f"COALESCE({field}, '')" for field in SEARCH_FIELDS)
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Ограничение SQLite на количество параметров в одном запросе
+            for start in range(0, len(listing_ids), 900):
+                chunk = listing_ids[start:start + 900]
+                placeholders = ', '.join(['%s'] * len(chunk))
+                cursor.execute(f'DELETE FROM {self.table} WHERE rowid IN ({placeholders})', chunk)
+                cursor.execute(
+                    f'INSERT INTO {self.table} (rowid, {columns}) '
+                    f'SELECT id, {coalesced} FROM listings_listing WHERE id IN ({placeholders})',
+                    chunk,
+                )
+
+    def rebuild(self, chunk_size: int = 5000):
+        """Пересоздает индекс диапазонами id; после каждого диапазона отдает число проиндексированных строк.
+
+        Все выполняется в одной транзакции: пока индекс пересобирается, поиск видит старый.
+        """
+        columns = ', '.join(SEARCH_FIELDS)
+        coalesced = ', '.join(f"COALESCE({field}, '')" for field in SEARCH_FIELDS)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute('SELECT MIN(id), MAX(id) FROM listings_listing')
+            low, high = cursor.fetchone()
+            if low is None:
+                return
+            for start in range(low, high + 1, chunk_size):
+                cursor.execute(
+                    f'INSERT INTO {self.table} (rowid, {columns}) '
+                    f'SELECT id, {coalesced} FROM listings_listing WHERE id >= %s AND id < %s',
+                    [start, start + chunk_size],
+                )
+                yield cursor.rowcount
+            cursor.execute(f"INSERT INTO {self.table} ({self.table}) VALUES ('optimize')")
+
+
+@lru_cache(maxsize=None)
+def _load_backend(path: str):
+    return import_string(path)()
+
+
+def get_backend():
+    """Текущий бэкенд поиска."""
+    path = getattr(settings, 'LISTINGS_SEARCH_BACKEND', None)
+    if not path:
+        path = (
+            'listings.search.SQLiteFTS5Backend' if connection.vendor == 'sqlite'
+            else 'listings.search.IContainsBackend'
+        )
+    return _load_backend(path)
@@ -2,7 +2,9 @@
 from datetime import date
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Listing
+from .images import srcset
+from .timing import timed
+from .models import Booking, Listing, Review
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -12,10 +14,37 @@ class UserSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
-class ListingSerializer(serializers.ModelSerializer):
+class TimedSerializerMixin:
+    """Время to_representation попадает в участок serialize замеров запроса (Server-Timing)."""
+
+    def to_representation(self, instance):
+        with timed('serialize'):
+            return super().to_representation(instance)
+
+
+class PhotoSrcsetMixin(serializers.Serializer):
+    """photo_srcset: {'webp': 'url 320w, ...', 'jpeg': ...} по производным главного фото; {} - их еще нет."""
+    photo_srcset = serializers.SerializerMethodField()
+
+    def get_photo_srcset(self, obj):
+        photo = obj.photo_main
+        # Экземпляр модели отдает FieldFile, строка .values() - имя файла
+        source = getattr(photo, 'name', photo)
+        if not source or not obj.photo_variants:
+            return {}
+        url = getattr(self, '_srcset_url', None)
+        if url is None:
+            storage = Listing._meta.get_field('photo_main').storage
+            url = self._srcset_url = FastListSerializerMixin._file_converter(storage, self.context.get('request'))
+        return srcset(obj.photo_variants, source, url)
+
+
+class ListingSerializer(TimedSerializerMixin, PhotoSrcsetMixin, serializers.ModelSerializer):
     owner = UserSerializer(read_only=True)
     average_rating = serializers.SerializerMethodField()
     review_count = serializers.SerializerMethodField()
+    rating_histogram = serializers.SerializerMethodField()
+    subratings = serializers.SerializerMethodField()
     
     class Meta:
         model = Listing
@@ -26,31 +55,161 @@ class ListingSerializer(serializers.ModelSerializer):
             'weekly_discount', 'monthly_discount', 'photo_main', 'is_verified',
             'is_published', 'moderation_status', 'booking_type', 'house_rules',
             'check_in_time', 'check_out_time', 'min_nights', 'max_nights',
-            'list_date', 'updated_at', 'average_rating', 'review_count'
+            'list_date', 'updated_at', 'average_rating', 'review_count',
+            'rating_histogram', 'subratings', 'photo_srcset'
         ]
         read_only_fields = ['owner', 'is_verified', 'verification_date', 
                           'moderation_status', 'moderation_notes', 'list_date', 'updated_at']
     
     def get_average_rating(self, obj):
-        return None
+        return float(obj.rating_avg) if obj.rating_avg is not None else None
     
     def get_review_count(self, obj):
-        return 0
+        return obj.rating_count
+
+    def get_rating_histogram(self, obj):
+        return {str(star): getattr(obj, f'rating_{star}') for star in range(1, 6)}
+
+    def get_subratings(self, obj):
+        """Средние оценки по категориям (None, если оценок в категории нет)"""
+        result = {}
+        for name in Review.SUBRATINGS:
+            count = getattr(obj, f'{name}_count')
+            result[name] = round(getattr(obj, f'{name}_sum') / count, 2) if count else None
+        return result
+
+
+class Row(dict):
+    """Строка .values() с доступом к значениям как к атрибутам (для get_* методов сериализатора)"""
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        try:
+            return self['id' if name == 'pk' else name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+
+class FastListSerializerMixin:
+    """Быстрая сериализация строк .values() без экземпляров модели и DRF to_representation.
+
+    Для каждого поля сериализатора один раз подбирается конвертер значения; результат
+    совпадает с обычной сериализацией. fast_method_sources - поля модели, которые читают
+    get_* методы; fast_annotations - аннотации queryset, используемые, если они есть.
+    """
+    fast_method_sources = {}
+    fast_annotations = ()
+    _fast_plan = None
+
+    @classmethod
+    def fast_plan(cls):
+        # Кэш на классе: поля сериализатора не меняются между запросами
+        if cls.__dict__.get('_fast_plan') is None:
+            serializer = cls()
+            plan = []
+            for name, field in serializer.fields.items():
+                if isinstance(field, serializers.SerializerMethodField):
+                    plan.append((name, 'method', field.method_name))
+                elif isinstance(field, serializers.FileField):
+                    plan.append((name, 'file', field.source))
+                elif type(field) in (serializers.CharField, serializers.ChoiceField,
+                                     serializers.IntegerField, serializers.BooleanField):
+                    # to_representation этих полей не меняет значения, уже прочитанные из БД
+                    plan.append((name, 'plain', field.source))
+                else:
+                    plan.append((name, field.to_representation, field.source))
+            cls._fast_plan = plan
+        return cls._fast_plan
+
+    @classmethod
+    def fast_values(cls, queryset, extra=()):
+        """queryset.values() с полями, нужными для fast_serialize (и extra)."""
+        fields = []
+        for name, kind, source in cls.fast_plan():
+            if kind == 'method':
+                fields.extend(cls.fast_method_sources.get(name, ()))
+            else:
+                fields.append(source)
+        fields.extend(name for name in cls.fast_annotations if name in queryset.query.annotations)
+        fields.extend(extra)
+        return queryset.values(*dict.fromkeys(fields))
+
+    @classmethod
+    def fast_serialize(cls, rows, context=None):
+        """Список словарей, совпадающий с cls(instances, many=True).data."""
+        with timed('serialize'):
+            return cls._fast_serialize(rows, context)
+
+    @classmethod
+    def _fast_serialize(cls, rows, context):
+        serializer = cls(context=context or {})
+        request = serializer.context.get('request')
+        opts = cls.Meta.model._meta
+        converters = []
+        for name, kind, source in cls.fast_plan():
+            if kind == 'method':
+                converters.append((name, None, getattr(serializer, source)))
+            elif kind == 'file':
+                converters.append((name, source, cls._file_converter(opts.get_field(source).storage, request)))
+            elif kind == 'plain':
+                converters.append((name, source, None))
+            else:
+                converters.append((name, source, kind))
+
+        data = []
+        for row in rows:
+            if not isinstance(row, Row):
+                row = Row(row)
+            item = {}
+            for name, source, convert in converters:
+                if source is None:
+                    item[name] = convert(row)
+                    continue
+                value = row[source]
+                item[name] = value if value is None or convert is None else convert(value)
+            data.append(item)
+        return data
+
+    @staticmethod
+    def _file_converter(storage, request):
+        if request is None:
+            return lambda name: storage.url(name) if name else None
+        # Абсолютный адрес собирается из готового префикса, а не build_absolute_uri на каждую строку
+        prefix = request.build_absolute_uri('/')[:-1]
 
+        def convert(name):
+            if not name:
+                return None
+            url = storage.url(name)
+            return prefix + url if url.startswith('/') else request.build_absolute_uri(url)
+        return convert
 
-class ListingListSerializer(serializers.ModelSerializer):
+
+class ListingListSerializer(TimedSerializerMixin, FastListSerializerMixin, PhotoSrcsetMixin, serializers.ModelSerializer):
     average_rating = serializers.SerializerMethodField()
+    distance = serializers.SerializerMethodField()
+
+    fast_method_sources = {
+        'average_rating': ('rating_avg',),
+        'photo_srcset': ('photo_main', 'photo_variants'),
+    }
+    fast_annotations = ('distance',)
     
     class Meta:
         model = Listing
         fields = [
-            'id', 'title', 'address', 'city', 'property_type',
+            'id', 'title', 'address', 'city', 'latitude', 'longitude', 'property_type',
             'bedrooms', 'beds', 'bathrooms', 'sqft', 'base_price',
-            'photo_main', 'is_verified', 'average_rating'
+            'photo_main', 'photo_srcset', 'is_verified', 'average_rating', 'distance'
         ]
     
     def get_average_rating(self, obj):
-        return None
+        return float(obj.rating_avg) if obj.rating_avg is not None else None
+
+    def get_distance(self, obj):
+        """Расстояние в км, если в запросе были переданы координаты (lat/lng)"""
+        distance = getattr(obj, 'distance', None)
+        return round(distance, 3) if distance is not None else None
 
 
 class SearchSerializer(serializers.Serializer):
@@ -68,3 +227,39 @@ class SearchSerializer(serializers.Serializer):
         if data['check_in'] < date.today():
             raise serializers.ValidationError("Дата заезда не может быть в прошлом")
         return data
+
+
+class QuoteSerializer(SearchSerializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), required=False, allow_empty=False, max_length=500
+    )
+
+
+class BookingSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    listing = ListingListSerializer(read_only=True)
+    guest = UserSerializer(read_only=True)
+    nights = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Booking
+        fields = [
+            'id', 'listing', 'guest', 'check_in', 'check_out', 'guests_count',
+            'total_price', 'status', 'payment_status', 'special_requests',
+            'created_at', 'nights'
+        ]
+        read_only_fields = fields
+
+
+class BookingCreateSerializer(serializers.Serializer):
+    listing_id = serializers.IntegerField(min_value=1)
+    check_in = serializers.DateField()
+    check_out = serializers.DateField()
+    guests_count = serializers.IntegerField(min_value=1)
+    special_requests = serializers.CharField(required=False, allow_blank=True, default='')
+
+    def validate(self, data):
+        if data['check_in'] >= data['check_out']:
+            raise serializers.ValidationError("Дата выезда должна быть позже даты заезда")
+        if data['check_in'] < date.today():
+            raise serializers.ValidationError("Дата заезда не может быть в прошлом")
+        return data
@@ -1,14 +1,293 @@
 # listings/services.py
-# Упрощенная версия - только основные функции без несуществующих моделей
-from datetime import date, timedelta
-from decimal import Decimal
-from typing import List, Optional
-from .models import Listing
+import hashlib
+import http.client
+import logging
+import math
+import re
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, time, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+from types import SimpleNamespace
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import (
+    BooleanField, Case, Count, DecimalField, Exists, ExpressionWrapper, F, FloatField, IntegerField, OuterRef, Q,
+    QuerySet, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import ASin, Cast, Coalesce, Cos, NullIf, Power, Radians, Round, Sin, Sqrt
+from django.utils import timezone
+from .ical import ICalError, iter_lines, open_feed, parse_events
+from .models import Availability, Booking, CalendarBitmap, ICalSync, Listing, ListingNightlyRate, Review
+from .search import get_backend
+
+# Сколько объектов пересчитывать сразу после изменения; цены большего набора удаляются
+# и восстанавливаются командой rebuild_nightly_rates (до этого стоимость считается в Python).
+# Пересчет - горизонт строк на объект после коммита, поэтому массовые изменения (импорт,
+# update() каталога) его не ждут
+NIGHTLY_RATES_SYNC_LIMIT = 20
+
+logger = logging.getLogger(__name__)
+
+CENT = Decimal('0.01')
+
+
+class PricingService:
+    """Расчет стоимости проживания без перебора ночей
+
+    Ночь стоит base_price, в выходные - weekend_price; особая цена даты
+    (Availability.price_override) заменяет цену своей ночи. Скидка за длительность
+    применяется к сумме, итог округляется до копеек. Так же считают NightlyRateService,
+    annotate_quotes и календарь объекта.
+    """
+
+    @staticmethod
+    def count_nights(check_in: date, check_out: date) -> Tuple[int, int]:
+        """Возвращает количество будних и выходных ночей в [check_in, check_out)."""
+        nights = (check_out - check_in).days
+        if nights <= 0:
+            return 0, 0
+        full_weeks, rest = divmod(nights, 7)
+        start = check_in.weekday()
+        weekend = full_weeks * 2 + sum(1 for i in range(rest) if (start + i) % 7 >= 5)
+        return nights - weekend, weekend
+
+    @staticmethod
+    def get_discount(listing: Listing, nights: int) -> int:
+        """Процент скидки за длительное проживание (месячная важнее недельной)."""
+        if nights >= 30 and listing.monthly_discount:
+            return listing.monthly_discount
+        if nights >= 7 and listing.weekly_discount:
+            return listing.weekly_discount
+        return 0
+
+    @staticmethod
+    def apply_discount(total: Decimal, discount_percent: int) -> Decimal:
+        """Сумма со скидкой, округленная до копеек (половина - вверх, как ROUND в annotate_quotes)."""
+        if discount_percent:
+            total -= total * Decimal(str(discount_percent)) / 100
+        return total.quantize(CENT, ROUND_HALF_UP)
+
+    @staticmethod
+    def price_overrides(listing_ids: Iterable[int], check_in: date, check_out: date) -> Dict[int, Dict[date, Decimal]]:
+        """Особые цены ночей [check_in, check_out) по объектам: {объект: {дата: цена}}."""
+        overrides = defaultdict(dict)
+        rows = Availability.objects.filter(
+            listing_id__in=listing_ids, date__gte=check_in, date__lt=check_out, price_override__isnull=False,
+        ).values_list('listing_id', 'date', 'price_override')
+        for listing_id, day, price in rows:
+            overrides[listing_id][day] = price
+        return overrides
+
+    @classmethod
+    def price_for_nights(cls, listing: Listing, weekday_nights: int, weekend_nights: int,
+                         overrides: Optional[Dict[date, Decimal]] = None) -> Decimal:
+        """Стоимость по заранее посчитанному количеству будних и выходных ночей и особым ценам дат."""
+        weekend_price = listing.weekend_price or listing.base_price
+        total = Decimal('0.00') + listing.base_price * weekday_nights + weekend_price * weekend_nights
+        for day, price in (overrides or {}).items():
+            total += price - (weekend_price if day.weekday() >= 5 else listing.base_price)
+        return cls.apply_discount(total, cls.get_discount(listing, weekday_nights + weekend_nights))
+
+    @classmethod
+    def calculate_total_price(cls, listing: Listing, check_in: date, check_out: date,
+                              overrides: Optional[Dict[date, Decimal]] = None) -> Decimal:
+        """Рассчитывает общую стоимость бронирования без перебора ночей.
+
+        Особые цены дат загружаются одним запросом, если не переданы в overrides.
+        """
+        if overrides is None:
+            overrides = cls.price_overrides([listing.pk], check_in, check_out).get(listing.pk)
+        weekday_nights, weekend_nights = cls.count_nights(check_in, check_out)
+        return cls.price_for_nights(listing, weekday_nights, weekend_nights, overrides)
+
+    @classmethod
+    def quote_many(cls, listings: Iterable[Listing], check_in: date, check_out: date) -> Dict[int, Decimal]:
+        """Считает стоимость одних и тех же дат для набора объектов за один проход (и один запрос особых цен)."""
+        listings = list(listings)
+        weekday_nights, weekend_nights = cls.count_nights(check_in, check_out)
+        overrides = cls.price_overrides([listing.pk for listing in listings], check_in, check_out)
+        return {
+            listing.pk: cls.price_for_nights(listing, weekday_nights, weekend_nights, overrides.get(listing.pk))
+            for listing in listings
+        }
+
+    @classmethod
+    def annotate_quotes(cls, queryset: QuerySet, check_in: date, check_out: date) -> QuerySet:
+        """Добавляет к queryset аннотацию quote_total - стоимость проживания, посчитанную в БД."""
+        weekday_nights, weekend_nights = cls.count_nights(check_in, check_out)
+        nights = weekday_nights + weekend_nights
+
+        weekend_price = Coalesce(NullIf(F('weekend_price'), Value(0)), F('base_price'))
+        # Особые цены дат: разница с обычной ценой ночи, суммированная подзапросом
+        regular_price = Case(
+            When(date__iso_week_day__gte=6, listing__weekend_price__gt=0, then=F('listing__weekend_price')),
+            default=F('listing__base_price'),
+        )
+        overrides = Availability.objects.filter(
+            listing=OuterRef('pk'), date__gte=check_in, date__lt=check_out, price_override__isnull=False,
+        ).values('listing').annotate(delta=Sum(F('price_override') - regular_price)).values('delta')
+        subtotal = (
+            F('base_price') * weekday_nights + weekend_price * weekend_nights
+            + Coalesce(Subquery(overrides, output_field=DecimalField()), Value(Decimal('0')))
+        )
+
+        tiers = []
+        if nights >= 30:
+            tiers.append(When(monthly_discount__gt=0, then=F('monthly_discount')))
+        if nights >= 7:
+            tiers.append(When(weekly_discount__gt=0, then=F('weekly_discount')))
+        discount = Case(*tiers, default=Value(0), output_field=IntegerField()) if tiers else Value(0)
+
+        # Стоимость в копейках с точностью до сотых. На SQLite десятичные выражения считаются
+        # в float, поэтому сумма сначала выравнивается до сотых копейки и только затем
+        # округляется до целых (половина - от нуля, как ROUND_HALF_UP в apply_discount)
+        cents = ExpressionWrapper(
+            subtotal * (Value(100) - discount), output_field=DecimalField(max_digits=16, decimal_places=2),
+        )
+        return queryset.annotate(
+            quote_total=ExpressionWrapper(
+                Round(Round(cents, 2)) / Value(Decimal(100)),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            )
+        )
+
+
+class CalendarIndexService:
+    """Битовые карты закрытых ночей: проверка периода маской вместо запросов к броням и календарю
+
+    Бит i карты - ночь start_date + i, поэтому с течением дней карта остается верной, но
+    покрывает все меньше будущих ночей; периоды за ее концом проверяются по таблицам.
+    Карта объекта пересобирается от сегодняшней даты после каждого коммита, изменившего
+    его брони или календарь (calendar_changed), а карты всех объектов - командой
+    rebuild_calendar_index раз в сутки.
+    """
+
+    @staticmethod
+    def horizon_days() -> int:
+        return getattr(settings, 'LISTINGS_CALENDAR_HORIZON_DAYS', 730)
+
+    @staticmethod
+    def build_bitmaps(listing_ids: Iterable[int], start: date, horizon: int) -> Dict[int, int]:
+        """Собирает битовые карты для набора объектов двумя запросами."""
+        end = start + timedelta(days=horizon)
+        bitmaps = {listing_id: 0 for listing_id in listing_ids}
+
+        bookings = Booking.objects.filter(
+            listing_id__in=bitmaps, status__in=Booking.ACTIVE_STATUSES, check_in__lt=end, check_out__gt=start,
+        ).values_list('listing_id', 'check_in', 'check_out')
+        for listing_id, check_in, check_out in bookings:
+            first = max((check_in - start).days, 0)
+            last = min((check_out - start).days, horizon)
+            bitmaps[listing_id] |= ((1 << (last - first)) - 1) << first
+
+        blocked = Availability.objects.filter(
+            listing_id__in=bitmaps, is_available=False, date__gte=start, date__lt=end,
+        ).values_list('listing_id', 'date')
+        for listing_id, day in blocked:
+            bitmaps[listing_id] |= 1 << (day - start).days
+
+        return bitmaps
+
+    @classmethod
+    def refresh(cls, listing_ids: Iterable[int]) -> None:
+        """Пересчитывает и сохраняет битовые карты объектов (горизонт начинается сегодня)."""
+        listing_ids = list(listing_ids)
+        if not listing_ids:
+            return
+        start = date.today()
+        horizon = cls.horizon_days()
+        size = (horizon + 7) // 8
+        existing = Listing.objects.filter(pk__in=listing_ids).values_list('pk', flat=True)
+        bitmaps = cls.build_bitmaps(existing, start, horizon)
+        CalendarBitmap.objects.bulk_create(
+            [
+                CalendarBitmap(listing_id=listing_id, start_date=start, days=horizon, bits=bits.to_bytes(size, 'little'))
+                for listing_id, bits in bitmaps.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['listing'],
+            update_fields=['start_date', 'days', 'bits', 'updated_at'],
+        )
+
+    @staticmethod
+    def _is_free(start_date: date, days: int, bits: bytes, check_in: date, check_out: date) -> Optional[bool]:
+        """Проверяет период по битовой карте; None - период выходит за горизонт карты."""
+        first = (check_in - start_date).days
+        last = (check_out - start_date).days
+        if first < 0 or last > days:
+            return None
+        mask = ((1 << (last - first)) - 1) << first
+        return not int.from_bytes(bits, 'little') & mask
+
+    @classmethod
+    def is_free(cls, listing_id: int, check_in: date, check_out: date) -> Optional[bool]:
+        """Свободны ли все ночи [check_in, check_out); None - карта отсутствует или не покрывает период."""
+        row = CalendarBitmap.objects.filter(listing_id=listing_id).values_list('start_date', 'days', 'bits').first()
+        if row is None:
+            return None
+        return cls._is_free(row[0], row[1], bytes(row[2]), check_in, check_out)
+
+    @classmethod
+    def split_free(cls, listing_ids: Iterable[int], check_in: date, check_out: date) -> Tuple[Set[int], Set[int]]:
+        """Проверяет пачку объектов одним запросом: (свободные, без ответа по карте)."""
+        unknown = set(listing_ids)
+        free = set()
+        rows = CalendarBitmap.objects.filter(listing_id__in=unknown).values_list(
+            'listing_id', 'start_date', 'days', 'bits',
+        )
+        for listing_id, start_date, days, bits in rows:
+            result = cls._is_free(start_date, days, bytes(bits), check_in, check_out)
+            if result is None:
+                continue
+            unknown.discard(listing_id)
+            if result:
+                free.add(listing_id)
+        return free, unknown
+
+    @classmethod
+    def ical_feed(cls, listing: Listing, uid_domain: str) -> bytes:
+        """iCal выгрузка закрытых ночей объекта (брони и закрытые даты) для менеджеров каналов."""
+        from .ical import render_calendar
+        today = date.today()
+        stamp = timezone.make_aware(datetime.combine(today, time()), timezone.get_default_timezone())
+        return render_calendar(listing.title, f'listing-{listing.pk}', cls.closed_ranges(listing.pk), stamp,
+                               uid_domain=uid_domain)
+
+    @classmethod
+    def closed_ranges(cls, listing_id: int) -> List[Tuple[date, date]]:
+        """Закрытые ночи объекта от сегодня, слитые в периоды [начало, конец)."""
+        today = date.today()
+        row = CalendarBitmap.objects.filter(listing_id=listing_id).values_list('start_date', 'bits').first()
+        if row is None:
+            start, bits = today, cls.build_bitmaps([listing_id], today, cls.horizon_days())[listing_id]
+        else:
+            start, bits = row[0], int.from_bytes(bytes(row[1]), 'little')
+        ranges = []
+        # Бит i - ночь start + i: в развернутой двоичной записи серии единиц - закрытые периоды
+        for run in re.finditer('1+', format(bits, 'b')[::-1]):
+            first, last = start + timedelta(days=run.start()), start + timedelta(days=run.end())
+            if last > today:
+                ranges.append((max(first, today), last))
+        return ranges
 
 
 class AvailabilityService:
-    """Сервис для проверки доступности объектов (упрощенная версия)"""
+    """Сервис для проверки доступности объектов"""
     
+    @staticmethod
+    def overlapping_bookings(check_in: date, check_out: date) -> QuerySet:
+        """Активные бронирования, пересекающиеся с периодом [check_in, check_out)."""
+        return Booking.objects.filter(
+            status__in=Booking.ACTIVE_STATUSES, check_in__lt=check_out, check_out__gt=check_in,
+        )
+
+    @staticmethod
+    def blocked_dates(check_in: date, check_out: date) -> QuerySet:
+        """Закрытые в календаре даты периода [check_in, check_out)."""
+        return Availability.objects.filter(date__gte=check_in, date__lt=check_out, is_available=False)
+
     @staticmethod
     def is_available(listing: Listing, check_in: date, check_out: date) -> bool:
         """Проверяет, доступен ли объект на указанный период."""
@@ -17,27 +296,33 @@ class AvailabilityService:
             return False
         if listing.max_nights and nights > listing.max_nights:
             return False
-        return True
-    
+        free = CalendarIndexService.is_free(listing.pk, check_in, check_out)
+        if free is not None:
+            return free
+        if AvailabilityService.overlapping_bookings(check_in, check_out).filter(listing=listing).exists():
+            return False
+        return not AvailabilityService.blocked_dates(check_in, check_out).filter(listing=listing).exists()
+
     @staticmethod
-    def get_available_listings(check_in: date, check_out: date, city: Optional[str] = None, 
-                               max_price: Optional[Decimal] = None, 
-                               property_type: Optional[str] = None,
-                               min_bedrooms: Optional[int] = None,
-                               min_guests: Optional[int] = None) -> List[Listing]:
-        """Получает список доступных объектов с фильтрами."""
-        nights = (check_out - check_in).days
-        
-        queryset = Listing.objects.filter(is_published=True)
-        
-        if nights > 0:
-            if hasattr(Listing, 'min_nights'):
-                queryset = queryset.filter(min_nights__lte=nights)
-            if hasattr(Listing, 'max_nights'):
-                queryset = queryset.filter(max_nights__gte=nights)
-        
+    def annotate_availability(queryset: QuerySet, check_in: date, check_out: date) -> QuerySet:
+        """Добавляет к queryset аннотацию quote_available с теми же правилами, что is_available."""
+        return queryset.annotate(
+            quote_available=Case(
+                When(AvailabilityService._unavailable(check_in, check_out), then=Value(False)),
+                default=Value(True),
+                output_field=BooleanField(),
+            )
+        )
+
+    @staticmethod
+    def apply_filters(queryset: QuerySet, city: Optional[str] = None,
+                      max_price: Optional[Decimal] = None,
+                      property_type: Optional[str] = None,
+                      min_bedrooms: Optional[int] = None,
+                      min_guests: Optional[int] = None) -> QuerySet:
+        """Применяет фильтры поиска (город, цена, тип, спальни, гости)."""
         if city:
-            queryset = queryset.filter(city__icontains=city)
+            queryset = get_backend().filter_city(queryset, city)
         
         if max_price:
             queryset = queryset.filter(base_price__lte=max_price)
@@ -51,7 +336,726 @@ class AvailabilityService:
         if min_guests:
             queryset = queryset.filter(max_guests__gte=min_guests)
         
-        queryset = queryset.order_by('-is_verified', '-list_date')
+        return queryset
+
+    @staticmethod
+    def filter_available(queryset: QuerySet, check_in: date, check_out: date) -> QuerySet:
+        """Оставляет в queryset объекты, доступные на период (лениво, без выполнения запроса)."""
+        return queryset.exclude(AvailabilityService._unavailable(check_in, check_out))
+
+    @staticmethod
+    def _unavailable(check_in: date, check_out: date) -> Q:
+        """Условие недоступности: ограничения по ночам, пересекающаяся бронь или закрытая дата.
+
+        Брони и календарь проверяются через NOT EXISTS по составным индексам
+        (listing, check_in, check_out, status) и (listing, date, is_available).
+        """
+        nights = (check_out - check_in).days
+        bookings = AvailabilityService.overlapping_bookings(check_in, check_out).filter(listing=OuterRef('pk'))
+        blocked = AvailabilityService.blocked_dates(check_in, check_out).filter(listing=OuterRef('pk'))
+        return (
+            Q(min_nights__gt=nights)
+            | Q(max_nights__gt=0, max_nights__lt=nights)
+            | Exists(bookings)
+            | Exists(blocked)
+        )
+
+    @staticmethod
+    def get_available_listings(check_in: date, check_out: date, city: Optional[str] = None, 
+                               max_price: Optional[Decimal] = None, 
+                               property_type: Optional[str] = None,
+                               min_bedrooms: Optional[int] = None,
+                               min_guests: Optional[int] = None,
+                               queryset: Optional[QuerySet] = None) -> QuerySet:
+        """Возвращает ленивый queryset доступных объектов с фильтрами."""
+        if queryset is None:
+            queryset = Listing.objects.filter(is_published=True)
+        
+        queryset = AvailabilityService.apply_filters(
+            queryset, city=city, max_price=max_price, property_type=property_type,
+            min_bedrooms=min_bedrooms, min_guests=min_guests,
+        )
+        queryset = AvailabilityService.filter_available(queryset, check_in, check_out)
         
-        return list(queryset)
+        return queryset.order_by('-is_verified', '-list_date')
+
+    @staticmethod
+    def month_starts(start: date, end: date) -> List[date]:
+        """Первые числа месяцев, которые задевает период [start, end]."""
+        months = []
+        month = start.replace(day=1)
+        while month <= end:
+            months.append(month)
+            month = (month + timedelta(days=32)).replace(day=1)
+        return months
+
+    @staticmethod
+    def month_calendar(listing: Listing, months: Iterable[date]) -> Dict[date, List[dict]]:
+        """Дни месяцев объекта: цена ночи, свободна ли ночь, можно ли заехать (с учетом min_nights).
+
+        Считается одним запросом броней и одним запросом календаря на все месяцы сразу;
+        окно продлевается на min_nights дней, чтобы проверить заезды в конце последнего месяца.
+        """
+        months = sorted(months)
+        if not months:
+            return {}
+        min_nights = max(listing.min_nights or 1, 1)
+        start = months[0]
+        end = (months[-1] + timedelta(days=32)).replace(day=1)
+        window_end = end + timedelta(days=min_nights)
+        today = date.today()
+
+        closed = set()
+        bookings = Booking.objects.filter(
+            listing=listing, status__in=Booking.ACTIVE_STATUSES, check_in__lt=window_end, check_out__gt=start,
+        ).values_list('check_in', 'check_out')
+        for check_in, check_out in bookings:
+            closed.update(range((check_in - start).days, (check_out - start).days))
+        overrides = {}
+        days = Availability.objects.filter(
+            listing=listing, date__gte=start, date__lt=window_end,
+        ).values_list('date', 'is_available', 'price_override')
+        for day, is_available, price_override in days:
+            if not is_available:
+                closed.add((day - start).days)
+            if price_override is not None:
+                overrides[day] = price_override
+
+        total = (window_end - start).days
+        free = [offset not in closed and start + timedelta(days=offset) >= today for offset in range(total)]
+        # free_run[i] - сколько ночей подряд свободно начиная с i (до конца окна)
+        free_run = [0] * (total + 1)
+        for offset in range(total - 1, -1, -1):
+            free_run[offset] = free_run[offset + 1] + 1 if free[offset] else 0
+
+        calendar = {month: [] for month in months}
+        for offset in range((end - start).days):
+            day = start + timedelta(days=offset)
+            month = day.replace(day=1)
+            if month not in calendar:
+                continue
+            price = overrides.get(day)
+            if price is None:
+                price = listing.get_price_for_date(day)
+            calendar[month].append({
+                'date': day.isoformat(),
+                'price': float(price),
+                'available': free[offset],
+                'check_in': free_run[offset] >= min_nights,
+            })
+        return calendar
+
+
+class NightlyRateService:
+    """Цены и занятость ночей на скользящий горизонт (ListingNightlyRate): стоимость периода - SUM в БД
+
+    Строки объекта непрерывны: от сегодня (прошедшие удаляет prune) до последней посчитанной
+    ночи. Изменение цен, броней или календаря пересчитывает строки объекта целиком.
+    """
+    PRICE_FIELDS = frozenset({'base_price', 'weekend_price'})
+
+    @staticmethod
+    def horizon_days() -> int:
+        return getattr(settings, 'LISTINGS_NIGHTLY_RATES_HORIZON_DAYS', 365)
+
+    @classmethod
+    def horizon_end(cls) -> date:
+        """Первая ночь за горизонтом."""
+        return date.today() + timedelta(days=cls.horizon_days())
+
+    @staticmethod
+    def build_rows(listing_ids: Iterable[int], start: date, end: date) -> List[Tuple[int, date, Decimal, bool]]:
+        """(объект, ночь, цена, занята) ночей [start, end): запрос объектов, броней, закрытых дат и особых цен."""
+        listings = list(Listing.objects.filter(pk__in=listing_ids).values_list('pk', 'base_price', 'weekend_price'))
+        days = (end - start).days
+        if not listings or days <= 0:
+            return []
+        ids = [row[0] for row in listings]
+        closed = CalendarIndexService.build_bitmaps(ids, start, days)
+        overrides = {
+            (listing_id, day): price
+            for listing_id, day, price in Availability.objects.filter(
+                listing_id__in=ids, date__gte=start, date__lt=end, price_override__isnull=False,
+            ).values_list('listing_id', 'date', 'price_override')
+        }
+        dates = [start + timedelta(days=offset) for offset in range(days)]
+        weekend = [day.weekday() >= 5 for day in dates]
+        rows = []
+        for listing_id, base_price, weekend_price in listings:
+            bits = closed[listing_id]
+            weekend_price = weekend_price or base_price
+            for offset, day in enumerate(dates):
+                price = overrides.get((listing_id, day))
+                if price is None:
+                    price = weekend_price if weekend[offset] else base_price
+                rows.append((listing_id, day, price, bool(bits >> offset & 1)))
+        return rows
+
+    @staticmethod
+    def _insert(rows: List[Tuple[int, date, Decimal, bool]]) -> None:
+        ListingNightlyRate.objects.bulk_create([
+            ListingNightlyRate(listing_id=listing_id, date=day, price=price, is_blocked=is_blocked)
+            for listing_id, day, price, is_blocked in rows
+        ])
+
+    @classmethod
+    def refresh(cls, listing_ids: Iterable[int], start: Optional[date] = None) -> int:
+        """Пересчитывает ночи объектов от start (по умолчанию сегодня) до конца горизонта."""
+        listing_ids = list(listing_ids)
+        start = max(start or date.today(), date.today())
+        rows = cls.build_rows(listing_ids, start, cls.horizon_end())
+        with transaction.atomic():
+            ListingNightlyRate.objects.filter(listing_id__in=listing_ids, date__gte=start).delete()
+            cls._insert(rows)
+        return len(rows)
+
+    @classmethod
+    def changed(cls, listing_ids: Iterable[int]) -> None:
+        """Цены, брони или календарь объектов изменились.
+
+        Больше NIGHTLY_RATES_SYNC_LIMIT объектов не пересчитываются сразу: их ночи удаляются
+        (стоимость считается в Python) до следующего запуска rebuild_nightly_rates.
+        """
+        listing_ids = list(listing_ids)
+        if len(listing_ids) <= NIGHTLY_RATES_SYNC_LIMIT:
+            cls.refresh(listing_ids)
+        else:
+            ListingNightlyRate.objects.filter(listing_id__in=listing_ids).delete()
+            logger.warning(
+                'Цены ночей %s объектов удалены без пересчета (больше %s); запустите rebuild_nightly_rates',
+                len(listing_ids), NIGHTLY_RATES_SYNC_LIMIT,
+            )
+
+    @staticmethod
+    def prune(before: Optional[date] = None) -> int:
+        """Удаляет прошедшие ночи."""
+        deleted, _ = ListingNightlyRate.objects.filter(date__lt=before or date.today()).delete()
+        return deleted
+
+    @classmethod
+    def pending(cls, queryset: Optional[QuerySet] = None) -> QuerySet:
+        """Объекты, чьи ночи не доходят до конца горизонта: (pk, последняя посчитанная ночь или None)."""
+        if queryset is None:
+            queryset = Listing.objects.all()
+        last = ListingNightlyRate.objects.filter(listing=OuterRef('pk')).order_by('-date').values('date')[:1]
+        return queryset.annotate(last_rate=Subquery(last)).filter(
+            Q(last_rate__isnull=True) | Q(last_rate__lt=cls.horizon_end() - timedelta(days=1)),
+        ).order_by('pk').values_list('pk', 'last_rate')
+
+    @staticmethod
+    def quote_totals(listing_ids: Iterable[int], check_in: date, check_out: date) -> Dict[int, Decimal]:
+        """Стоимость периода для объектов, у которых все ночи посчитаны и свободны (один GROUP BY).
+
+        Учитывает цены выходных, особые цены дат и скидки за длительность. Объекты с
+        занятой или не посчитанной ночью в результат не попадают.
+        """
+        nights = (check_out - check_in).days
+        if nights <= 0:
+            return {}
+        rows = ListingNightlyRate.objects.filter(
+            listing_id__in=listing_ids, date__gte=check_in, date__lt=check_out,
+        ).values('listing_id').annotate(
+            subtotal=Sum('price'),
+            nights=Count('pk'),
+            blocked=Count('pk', filter=Q(is_blocked=True)),
+            weekly_discount=F('listing__weekly_discount'),
+            monthly_discount=F('listing__monthly_discount'),
+        ).filter(nights=nights, blocked=0)
+        totals = {}
+        for row in rows:
+            discount_percent = PricingService.get_discount(SimpleNamespace(**row), nights)
+            totals[row['listing_id']] = PricingService.apply_discount(Decimal('0.00') + row['subtotal'], discount_percent)
+        return totals
+
+
+class GeoService:
+    """Поиск объектов по координатам: радиус, прямоугольник карты, расстояние"""
+
+    EARTH_RADIUS_KM = 6371.0
+    KM_PER_DEGREE = 111.32
+
+    @staticmethod
+    def parse_point(lat, lng) -> Tuple[float, float]:
+        """Разбирает и проверяет координаты точки; ValueError при ошибке."""
+        lat, lng = float(lat), float(lng)
+        if not (math.isfinite(lat) and math.isfinite(lng)):
+            raise ValueError('Координаты должны быть конечными числами')
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            raise ValueError('Координаты вне допустимого диапазона')
+        return lat, lng
+
+    @staticmethod
+    def parse_radius(value) -> float:
+        """Разбирает радиус поиска в километрах; ValueError при ошибке."""
+        radius_km = float(value)
+        if not math.isfinite(radius_km) or radius_km <= 0:
+            raise ValueError('radius_km должен быть конечным числом больше нуля')
+        return radius_km
+
+    @staticmethod
+    def parse_bbox(value: str) -> Tuple[float, float, float, float]:
+        """Разбирает bbox в формате min_lng,min_lat,max_lng,max_lat (как в GeoJSON)."""
+        parts = [float(part) for part in value.split(',')]
+        if len(parts) != 4:
+            raise ValueError('bbox должен содержать 4 числа: min_lng,min_lat,max_lng,max_lat')
+        min_lng, min_lat, max_lng, max_lat = parts
+        # parse_point отклоняет и nan/inf
+        GeoService.parse_point(min_lat, min_lng)
+        GeoService.parse_point(max_lat, max_lng)
+        if min_lat > max_lat:
+            raise ValueError('min_lat больше max_lat')
+        return min_lng, min_lat, max_lng, max_lat
+
+    @classmethod
+    def bbox_around(cls, lat: float, lng: float, radius_km: float) -> Tuple[float, float, float, float]:
+        """Прямоугольник, гарантированно содержащий круг радиуса radius_km."""
+        dlat = radius_km / cls.KM_PER_DEGREE
+        min_lat, max_lat = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+        # У полюса круг накрывает все долготы
+        cos_lat = min(math.cos(math.radians(min_lat)), math.cos(math.radians(max_lat)))
+        if cos_lat <= 0 or radius_km / (cls.KM_PER_DEGREE * cos_lat) >= 180:
+            return -180.0, min_lat, 180.0, max_lat
+        dlng = radius_km / (cls.KM_PER_DEGREE * cos_lat)
+        min_lng, max_lng = lng - dlng, lng + dlng
+        # Переход через 180-й меридиан: min_lng > max_lng, см. filter_bbox
+        if min_lng < -180:
+            min_lng += 360
+        if max_lng > 180:
+            max_lng -= 360
+        return min_lng, min_lat, max_lng, max_lat
+
+    @staticmethod
+    def filter_bbox(queryset: QuerySet, min_lng: float, min_lat: float, max_lng: float, max_lat: float) -> QuerySet:
+        """Диапазонный фильтр по индексу (latitude, longitude)."""
+        queryset = queryset.filter(latitude__gte=min_lat, latitude__lte=max_lat)
+        if min_lng <= max_lng:
+            return queryset.filter(longitude__gte=min_lng, longitude__lte=max_lng)
+        return queryset.filter(Q(longitude__gte=min_lng) | Q(longitude__lte=max_lng))
+
+    @classmethod
+    def distance_expression(cls, lat: float, lng: float):
+        """Расстояние до точки в км по формуле гаверсинуса, вычисляемое в БД."""
+        lat1, lng1 = math.radians(lat), math.radians(lng)
+        lat2 = Radians(Cast('latitude', FloatField()))
+        lng2 = Radians(Cast('longitude', FloatField()))
+        a = (
+            Power(Sin((lat2 - Value(lat1)) / 2), 2)
+            + Value(math.cos(lat1)) * Cos(lat2) * Power(Sin((lng2 - Value(lng1)) / 2), 2)
+        )
+        return ExpressionWrapper(2 * cls.EARTH_RADIUS_KM * ASin(Sqrt(a)), output_field=FloatField())
+
+    @classmethod
+    def annotate_distance(cls, queryset: QuerySet, lat: float, lng: float) -> QuerySet:
+        return queryset.annotate(distance=cls.distance_expression(lat, lng))
+
+    @classmethod
+    def filter_radius(cls, queryset: QuerySet, lat: float, lng: float, radius_km: float) -> QuerySet:
+        """Объекты в радиусе radius_km: сначала bbox по индексу, затем точное расстояние.
+
+        Добавляет аннотацию distance (км), по которой можно сортировать.
+        """
+        queryset = cls.filter_bbox(queryset, *cls.bbox_around(lat, lng, radius_km))
+        return cls.annotate_distance(queryset, lat, lng).filter(distance__lte=radius_km)
+
+
+class RatingService:
+    """Агрегаты отзывов на объекте: поддерживаются приращениями, пересчитываются командой recompute_ratings"""
+
+    AGGREGATE_FIELDS = (
+        'rating_count', 'rating_sum', 'rating_avg',
+        'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5',
+        *[f'{name}_{suffix}' for name in Review.SUBRATINGS for suffix in ('sum', 'count')],
+    )
+
+    @staticmethod
+    def _apply(review: Review, sign: int) -> None:
+        """Добавляет (sign=1) или вычитает (sign=-1) оценки отзыва одним UPDATE."""
+        updates = {
+            'rating_count': F('rating_count') + sign,
+            'rating_sum': F('rating_sum') + sign * review.rating,
+            # В UPDATE правая часть видит старые значения, поэтому среднее считается от них
+            'rating_avg': Round(
+                Cast(F('rating_sum') + sign * review.rating, FloatField()) / NullIf(F('rating_count') + sign, 0), 2,
+            ),
+            f'rating_{review.rating}': F(f'rating_{review.rating}') + sign,
+        }
+        for name in Review.SUBRATINGS:
+            value = getattr(review, f'{name}_rating')
+            if value is not None:
+                updates[f'{name}_sum'] = F(f'{name}_sum') + sign * value
+                updates[f'{name}_count'] = F(f'{name}_count') + sign
+        Listing.objects.filter(pk=review.listing_id).update(**updates)
+
+    @classmethod
+    def add(cls, review: Review) -> None:
+        cls._apply(review, 1)
+
+    @classmethod
+    def remove(cls, review: Review) -> None:
+        cls._apply(review, -1)
+
+    @classmethod
+    def aggregate(cls, listing_ids: Iterable[int]) -> Dict[int, Dict[str, object]]:
+        """Агрегаты, посчитанные по таблице отзывов одним запросом (для пересчета и проверки)."""
+        listing_ids = list(listing_ids)
+        empty = {field: 0 for field in cls.AGGREGATE_FIELDS}
+        empty['rating_avg'] = None
+        result = {listing_id: dict(empty) for listing_id in listing_ids}
+
+        annotations = {
+            'rating_count': Count('id'),
+            'rating_sum': Sum('rating'),
+            **{f'rating_{star}': Count('id', filter=Q(rating=star)) for star in range(1, 6)},
+        }
+        for name in Review.SUBRATINGS:
+            annotations[f'{name}_sum'] = Coalesce(Sum(f'{name}_rating'), 0)
+            annotations[f'{name}_count'] = Count(f'{name}_rating')
+        rows = Review.objects.filter(listing_id__in=listing_ids).order_by().values('listing_id').annotate(**annotations)
+        for row in rows:
+            values = result[row.pop('listing_id')]
+            values.update(row)
+            values['rating_avg'] = (Decimal(row['rating_sum']) / row['rating_count']).quantize(Decimal('0.01'), ROUND_HALF_UP)
+        return result
+
+    @staticmethod
+    def _review_total(aggregate) -> Coalesce:
+        """Коррелированный подзапрос: aggregate по отзывам текущего объекта (0, если отзывов нет)."""
+        reviews = Review.objects.filter(listing=OuterRef('pk')).order_by().values('listing')
+        return Coalesce(Subquery(reviews.annotate(total=aggregate).values('total')), 0)
+
+    @classmethod
+    def recompute(cls, listing_ids: Iterable[int]) -> int:
+        """Пересчитывает агрегаты объектов с нуля одним UPDATE; возвращает количество объектов."""
+        total = cls._review_total
+        updates = {
+            'rating_count': total(Count('id')),
+            'rating_sum': total(Sum('rating')),
+            'rating_avg': Round(
+                Cast(total(Sum('rating')), FloatField()) / NullIf(total(Count('id')), 0), 2,
+            ),
+            **{f'rating_{star}': total(Count('id', filter=Q(rating=star))) for star in range(1, 6)},
+        }
+        for name in Review.SUBRATINGS:
+            updates[f'{name}_sum'] = total(Sum(f'{name}_rating'))
+            updates[f'{name}_count'] = total(Count(f'{name}_rating'))
+        # Подсчет и запись в одной инструкции: между ними нет окна для параллельного отзыва
+        return Listing.objects.filter(pk__in=list(listing_ids)).update(**updates)
+
+
+class BookingConflict(Exception):
+    """Даты уже заняты другой бронью или закрыты в календаре"""
+
+
+class IdempotencyKeyReused(Exception):
+    """Ключ идемпотентности уже использован гостем для брони с другими параметрами"""
+
+
+class BookingService:
+    """Создание бронирований с защитой от овербукинга"""
+
+    @staticmethod
+    def _lock_listing(listing_id: int) -> None:
+        """Блокирует объект до конца транзакции, чтобы его брони создавались по очереди.
+
+        На серверных БД это делает SELECT ... FOR UPDATE. SQLite его не поддерживает и
+        блокирует базу целиком: пустой UPDATE первым запросом транзакции сразу берет
+        блокировку на запись (как BEGIN IMMEDIATE), и параллельная бронь ждет ее в пределах
+        timeout, а не падает с "database is locked" при попытке записи после чтения.
+        """
+        if connection.vendor != 'sqlite':
+            return
+        table = connection.ops.quote_name(Listing._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(f'UPDATE {table} SET id = id WHERE id = %s', [listing_id])
+
+    @staticmethod
+    def _replay(booking: Booking, listing_id: int, check_in: date, check_out: date,
+                guests_count: int) -> Tuple[Booking, bool]:
+        """Повтор запроса с тем же ключом: та же бронь, если параметры совпадают."""
+        if (booking.listing_id, booking.check_in, booking.check_out, booking.guests_count) != (
+                listing_id, check_in, check_out, guests_count):
+            raise IdempotencyKeyReused('Idempotency-Key уже использован для брони с другими параметрами')
+        return booking, False
+
+    @staticmethod
+    def create_booking(listing_id: int, guest, check_in: date, check_out: date, guests_count: int,
+                       special_requests: str = '', idempotency_key: Optional[str] = None) -> Tuple[Booking, bool]:
+        """Создает бронь; возвращает (бронь, создана ли она этим вызовом).
+
+        Проверка пересечений и вставка выполняются в одной транзакции под блокировкой
+        объекта (_lock_listing). Повтор запроса с тем же idempotency_key возвращает уже
+        созданную бронь; тот же ключ с другими объектом, датами или числом гостей -
+        IdempotencyKeyReused, ключ брони, удаленной во время запроса, - BookingConflict.
+        """
+        try:
+            with transaction.atomic():
+                BookingService._lock_listing(listing_id)
+                listing = Listing.objects.select_for_update().get(pk=listing_id, is_published=True)
+
+                if idempotency_key:
+                    existing = Booking.objects.filter(guest=guest, idempotency_key=idempotency_key).first()
+                    if existing:
+                        return BookingService._replay(existing, listing_id, check_in, check_out, guests_count)
+
+                nights = (check_out - check_in).days
+                if listing.min_nights and nights < listing.min_nights:
+                    raise ValueError(f'Минимальный срок проживания: {listing.min_nights} ноч.')
+                if listing.max_nights and nights > listing.max_nights:
+                    raise ValueError(f'Максимальный срок проживания: {listing.max_nights} ноч.')
+                if listing.max_guests and guests_count > listing.max_guests:
+                    raise ValueError(f'Максимальное количество гостей: {listing.max_guests}')
+
+                if AvailabilityService.overlapping_bookings(check_in, check_out).filter(listing=listing).exists():
+                    raise BookingConflict('Объект уже забронирован на выбранные даты')
+                if AvailabilityService.blocked_dates(check_in, check_out).filter(listing=listing).exists():
+                    raise BookingConflict('Объект недоступен на выбранные даты')
+
+                booking = Booking.objects.create(
+                    listing=listing,
+                    guest=guest,
+                    check_in=check_in,
+                    check_out=check_out,
+                    guests_count=guests_count,
+                    total_price=PricingService.calculate_total_price(listing, check_in, check_out),
+                    status='confirmed' if listing.booking_type == 'instant' else 'pending',
+                    special_requests=special_requests,
+                    idempotency_key=idempotency_key or None,
+                )
+        except IntegrityError:
+            if not idempotency_key:
+                raise
+            # Параллельный запрос с тем же ключом успел создать бронь первым
+            existing = Booking.objects.filter(guest=guest, idempotency_key=idempotency_key).first()
+            if existing is None:
+                # ...и ее уже удалили (вместе с объектом или гостем): повторять нечего
+                raise BookingConflict('Бронь с этим Idempotency-Key удалена, повторите запрос с новым ключом')
+            return BookingService._replay(existing, listing_id, check_in, check_out, guests_count)
+
+        return booking, True
+
+
+class PhotoVariantService:
+    """Производные главного фото объекта (listings.images) и поле Listing.photo_variants"""
+
+    @staticmethod
+    def storage():
+        return Listing._meta.get_field('photo_main').storage
+
+    @staticmethod
+    def pending(queryset: Optional[QuerySet] = None, force: bool = False):
+        """(id, photo_main) объектов, у которых производных нет или они построены для другого фото."""
+        queryset = (queryset if queryset is not None else Listing.objects.all()).exclude(
+            Q(photo_main='') | Q(photo_main__isnull=True)
+        )
+        rows = queryset.order_by('pk').values_list('pk', 'photo_main', 'photo_variants').iterator(chunk_size=2000)
+        for listing_id, photo, variants in rows:
+            if force or (variants or {}).get('source') != photo:
+                yield listing_id, photo
+
+    @classmethod
+    def read(cls, photo: str) -> bytes:
+        with cls.storage().open(photo, 'rb') as f:
+            return f.read()
+
+    @classmethod
+    def save(cls, listing_id: int, photo: str, rendered) -> bool:
+        """Сохраняет производные; объект обновляется, только если главное фото не сменилось."""
+        from .images import save_variants
+        variants = save_variants(photo, rendered, cls.storage())
+        return bool(Listing.objects.filter(pk=listing_id, photo_main=photo).update(photo_variants=variants))
+
+    @classmethod
+    def refresh(cls, listing_ids: Iterable[int]) -> int:
+        """Строит недостающие производные в текущем процессе; возвращает число обновленных объектов."""
+        from .images import render_variants
+        updated = 0
+        for listing_id, photo in cls.pending(Listing.objects.filter(pk__in=list(listing_ids))):
+            updated += cls.save(listing_id, photo, render_variants(cls.read(photo)))
+        return updated
+
+
+class ICalSyncService:
+    """Синхронизация внешних iCal календарей с Availability (source='ical')
+
+    Календари загружаются параллельно в пуле потоков условным GET (ETag / Last-Modified);
+    запись в БД - в основном потоке, по мере готовности календарей. Строки календаря
+    помечаются external_id '<id синхронизации>:<UID события>', поэтому у каждой
+    синхронизации свои строки, а ручные строки и брони не затрагиваются.
+    """
+
+    @staticmethod
+    def workers() -> int:
+        return getattr(settings, 'LISTINGS_ICAL_WORKERS', 8)
+
+    @staticmethod
+    def timeout() -> float:
+        return getattr(settings, 'LISTINGS_ICAL_TIMEOUT', 15)
+
+    @staticmethod
+    def due(now=None) -> QuerySet:
+        """Активные синхронизации, у которых прошла sync_frequency с прошлой загрузки."""
+        now = now or timezone.now()
+        return ICalSync.objects.filter(is_active=True).filter(Q(next_sync__isnull=True) | Q(next_sync__lte=now))
+
+    @staticmethod
+    def external_id(ical_sync_id: int, uid: str) -> str:
+        external_id = f'{ical_sync_id}:{uid}'
+        if len(external_id) > 100:
+            external_id = f'{ical_sync_id}:{hashlib.sha1(uid.encode()).hexdigest()}'
+        return external_id
+
+    @staticmethod
+    def window() -> Tuple[date, date]:
+        """Окно синхронизации: горизонт битовых карт календаря."""
+        start = date.today()
+        return start, start + timedelta(days=CalendarIndexService.horizon_days())
+
+    @classmethod
+    def blocked_days(cls, ical_sync_id: int, events: Iterable) -> Tuple[Dict[date, str], int]:
+        """{дата: external_id} занятых ночей и число периодов; события читаются по одному."""
+        days = {}
+        periods = 0
+        for event in events:
+            periods += 1
+            external_id = cls.external_id(ical_sync_id, event.uid)
+            day = event.start
+            while day < event.end:
+                days.setdefault(day, external_id)
+                day += timedelta(days=1)
+        return days, periods
+
+    @classmethod
+    def fetch(cls, ical_sync: ICalSync, force: bool = False):
+        """Загрузка и разбор календаря (выполняется в потоке пула, без запросов к БД).
+
+        Календарь разбирается по мере чтения ответа, в памяти остаются только занятые
+        даты окна. Возвращает (ответ, хэш содержимого, занятые даты); занятые даты -
+        (начало окна, конец окна, {дата: external_id}, число периодов) или None, если
+        календарь не изменился.
+        """
+        etag, last_modified = ('', '') if force else (ical_sync.etag, ical_sync.last_modified)
+        start, end = cls.window()
+        with open_feed(ical_sync.url, etag, last_modified, timeout=cls.timeout()) as response:
+            if response.status == 304:
+                return response, ical_sync.content_hash, None
+            digest = hashlib.sha256()
+
+            def hashed(chunks):
+                for chunk in chunks:
+                    digest.update(chunk)
+                    yield chunk
+
+            events = parse_events(iter_lines(hashed(response.chunks)), start, end, timezone.get_default_timezone())
+            days, periods = cls.blocked_days(ical_sync.pk, events)
+        content_hash = digest.hexdigest()
+        if not force and content_hash == ical_sync.content_hash:
+            return response, content_hash, None
+        return response, content_hash, (start, end, days, periods)
+
+    @classmethod
+    def apply(cls, ical_sync: ICalSync, start: date, end: date, desired: Dict[date, str]) -> Dict[str, int]:
+        """Приводит строки синхронизации в окне [start, end) к занятым датам; пишутся только отличия.
+
+        Открытую ручную строку даты (например, с особой ценой) синхронизация не заменяет, а
+        закрывает, записав в нее свой external_id; когда дата освобождается, строка снова
+        открывается, а особая цена и источник остаются прежними.
+        """
+        prefix = f'{ical_sync.pk}:'
+        own, open_rows, foreign = {}, {}, set()
+        rows = Availability.objects.filter(
+            listing_id=ical_sync.listing_id, date__gte=start, date__lt=end,
+        ).values_list('pk', 'date', 'source', 'external_id', 'is_available')
+        for pk, day, source, external_id, is_available in rows:
+            if external_id.startswith(prefix):
+                own[day] = (pk, source, external_id, is_available)
+            elif is_available and not external_id:
+                open_rows[day] = pk
+            else:
+                # Дата уже занята ручной строкой, бронью или другим календарем
+                foreign.add(day)
+
+        deleted, reopened, updated = [], [], []
+        for day, (pk, source, external_id, is_available) in own.items():
+            if day not in desired:
+                if source == 'ical':
+                    deleted.append(pk)
+                else:
+                    reopened.append(Availability(pk=pk, external_id='', is_available=True))
+            elif external_id != desired[day] or is_available:
+                updated.append(Availability(pk=pk, external_id=desired[day], is_available=False))
+        updated += [
+            Availability(pk=pk, external_id=desired[day], is_available=False)
+            for day, pk in open_rows.items() if day in desired
+        ]
+        created = [
+            Availability(listing_id=ical_sync.listing_id, date=day, is_available=False,
+                         source='ical', external_id=external_id)
+            for day, external_id in desired.items()
+            if day not in own and day not in open_rows and day not in foreign
+        ]
+        # delete(), bulk_update() и bulk_create() сами сообщают calendar_changed;
+        # пересчеты после коммита объединяются в один на объект
+        if deleted:
+            Availability.objects.filter(pk__in=deleted).delete()
+        if updated or reopened:
+            Availability.objects.bulk_update(updated + reopened, ['external_id', 'is_available'])
+        if created:
+            Availability.objects.bulk_create(created)
+        return {'created': len(created), 'updated': len(updated) + len(reopened), 'deleted': len(deleted)}
+
+    @classmethod
+    def store(cls, ical_sync: ICalSync, result=None, error: Optional[Exception] = None) -> Tuple[bool, str]:
+        """Записывает результат загрузки: изменения календаря и состояние синхронизации."""
+        now = timezone.now()
+        ical_sync.next_sync = now + timedelta(minutes=max(ical_sync.sync_frequency, 1))
+        fields = ['next_sync', 'last_error']
+        if error is not None:
+            ical_sync.last_error = str(error) or error.__class__.__name__
+            ical_sync.save(update_fields=fields)
+            return False, f'Ошибка загрузки: {ical_sync.last_error}'
+
+        response, content_hash, blocked = result
+        ical_sync.last_sync = now
+        ical_sync.etag, ical_sync.last_modified = response.etag, response.last_modified
+        ical_sync.content_hash = content_hash
+        ical_sync.last_error = ''
+        fields += ['last_sync', 'etag', 'last_modified', 'content_hash']
+        if blocked is None:
+            # Календарь не изменился: один UPDATE состояния, без транзакции
+            ical_sync.save(update_fields=fields)
+            return True, 'Не изменился (304)' if response.status == 304 else 'Без изменений'
+
+        start, end, days, periods = blocked
+        with transaction.atomic():
+            stats = cls.apply(ical_sync, start, end, days)
+            ical_sync.save(update_fields=fields)
+        return True, (f'Занятых периодов: {periods}, добавлено: {stats["created"]}, '
+                      f'изменено: {stats["updated"]}, удалено: {stats["deleted"]}')
+
+    @classmethod
+    def sync_all_active(cls, ical_syncs: Optional[Iterable[ICalSync]] = None, workers: Optional[int] = None,
+                        force: bool = False) -> List[dict]:
+        """Синхронизирует календари (по умолчанию - due()); результат по каждому календарю."""
+        ical_syncs = list(cls.due().select_related('listing') if ical_syncs is None else ical_syncs)
+        results = []
+        if not ical_syncs:
+            return results
+        workers = max(1, min(workers or cls.workers(), len(ical_syncs)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ical') as pool:
+            futures = {pool.submit(cls.fetch, ical_sync, force): ical_sync for ical_sync in ical_syncs}
+            for future in as_completed(futures):
+                ical_sync = futures[future]
+                try:
+                    result, error = future.result(), None
+                except (OSError, ValueError, ICalError, http.client.HTTPException) as e:
+                    result, error = None, e
+                success, message = cls.store(ical_sync, result, error)
+                results.append({
+                    'id': ical_sync.pk, 'listing': str(ical_sync.listing), 'success': success, 'message': message,
+                })
+        return results
 
+    @classmethod
+    def sync_ical(cls, ical_sync: ICalSync, force: bool = False) -> Tuple[bool, str]:
+        result = cls.sync_all_active([ical_sync], workers=1, force=force)[0]
+        return result['success'], result['message']
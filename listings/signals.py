@@ -0,0 +1,142 @@
+# listings/signals.py
+import logging
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from PIL import Image
+
+from .cache import response_cache
+from .models import Availability, Booking, ICalSync, Listing, Review, calendar_changed, listings_bulk_updated
+from .search import SEARCH_FIELDS, get_backend
+from .services import CalendarIndexService, NightlyRateService, PhotoVariantService, RatingService
+
+logger = logging.getLogger(__name__)
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+@receiver(post_save, sender=Availability)
+@receiver(post_delete, sender=Availability)
+def calendar_row_changed(sender, instance, **kwargs):
+    calendar_changed.send(sender=sender, listing_ids=[instance.listing_id])
+
+
+def on_commit_batched(func, listing_ids):
+    """Вызывает func(listing_ids) после коммита; объекты одного коммита объединяются в один вызов.
+
+    Каскадное удаление объекта с тысячами броней пересчитывает его календарь один раз,
+    а не на каждую бронь: первый сработавший обработчик забирает все накопленные объекты,
+    остальные ничего не делают. Объекты из откатившейся транзакции обрабатываются со
+    следующим коммитом - лишний пересчет безвреден.
+    """
+    connection = transaction.get_connection()
+    pending = connection.__dict__.setdefault('listings_pending', {}).setdefault(func, set())
+    pending.update(listing_ids)
+
+    def run():
+        if pending:
+            listing_ids = sorted(pending)
+            pending.clear()
+            func(listing_ids)
+    transaction.on_commit(run)
+
+
+@receiver(calendar_changed)
+def refresh_calendar_bitmaps(sender, listing_ids, **kwargs):
+    """Пересчитывает битовые карты после коммита, когда изменения видны всем."""
+    on_commit_batched(CalendarIndexService.refresh, listing_ids)
+
+
+@receiver(calendar_changed)
+def refresh_nightly_rates(sender, listing_ids, **kwargs):
+    on_commit_batched(NightlyRateService.changed, listing_ids)
+
+
+@receiver(post_save, sender=Listing)
+def listing_prices_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or set(update_fields) & NightlyRateService.PRICE_FIELDS:
+        on_commit_batched(NightlyRateService.changed, [instance.pk])
+
+
+@receiver(listings_bulk_updated)
+def listings_bulk_prices_changed(sender, listing_ids, fields, **kwargs):
+    # У новых объектов цен ночей еще нет: их посчитает rebuild_nightly_rates
+    if fields is None or fields & NightlyRateService.PRICE_FIELDS:
+        on_commit_batched(NightlyRateService.changed, listing_ids)
+
+
+@receiver(post_delete, sender=ICalSync)
+def ical_sync_deleted(sender, instance, **kwargs):
+    """Даты, закрытые удаленным календарем, снова свободны."""
+    # post_delete строк и update() сообщают calendar_changed
+    rows = Availability.objects.filter(listing_id=instance.listing_id, external_id__startswith=f'{instance.pk}:')
+    rows.filter(source='ical').delete()
+    # Ручные строки, закрытые календарем, открываются с прежней особой ценой
+    rows.update(is_available=True, external_id='')
+
+
+@receiver(post_save, sender=Listing)
+def listing_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or set(update_fields) & set(SEARCH_FIELDS):
+        get_backend().index([instance.pk])
+
+
+@receiver(post_delete, sender=Listing)
+def listing_deleted(sender, instance, **kwargs):
+    get_backend().index([instance.pk])
+
+
+@receiver(post_save, sender=Listing)
+def listing_photo_changed(sender, instance, **kwargs):
+    """Строит производные нового главного фото после коммита (массовые загрузки - build_photo_variants)."""
+    photo = instance.photo_main.name if instance.photo_main else None
+    if (instance.photo_variants or {}).get('source') == photo:
+        return
+    if not photo:
+        Listing.objects.filter(pk=instance.pk).update(photo_variants={})
+        return
+
+    listing_id = instance.pk
+
+    def build():
+        try:
+            PhotoVariantService.refresh([listing_id])
+        except (OSError, ValueError, Image.DecompressionBombError):
+            # Объект уже сохранен; без производных выдача просто отдает оригинал
+            logger.warning('Не удалось построить производные фото объекта %s', listing_id, exc_info=True)
+
+    transaction.on_commit(build)
+
+
+@receiver(listings_bulk_updated)
+def listings_bulk_changed(sender, listing_ids, fields, created=False, **kwargs):
+    if created or fields is None or fields & set(SEARCH_FIELDS):
+        get_backend().index(listing_ids)
+
+
+# Версии кэша ответов увеличиваются после коммита: иначе параллельный запрос мог бы
+# сохранить под новой версией данные, прочитанные до коммита
+@receiver(post_save, sender=Listing)
+@receiver(post_delete, sender=Listing)
+def invalidate_listing_responses(sender, instance, **kwargs):
+    listing_ids = [instance.pk]
+    transaction.on_commit(lambda: response_cache.listings_changed(listing_ids))
+
+
+@receiver(listings_bulk_updated)
+def invalidate_bulk_responses(sender, listing_ids, **kwargs):
+    listing_ids = list(listing_ids)
+    transaction.on_commit(lambda: response_cache.listings_changed(listing_ids))
+
+
+@receiver(calendar_changed)
+def invalidate_calendar_responses(sender, listing_ids, **kwargs):
+    listing_ids = list(listing_ids)
+    transaction.on_commit(lambda: response_cache.calendar_changed(listing_ids))
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    # Сохранение обрабатывает Review.save(); удаление (в том числе каскадное) идет через Collector
+    # в его транзакции
+    RatingService.remove(instance)
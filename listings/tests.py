@@ -1,3 +1,1454 @@
-from django.test import TestCase
+import io
+import json
+import os
+import zlib
+import pstats
+import tempfile
+from pathlib import Path
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
+from zoneinfo import ZoneInfo
 
-# Create your tests here.
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from .cache import response_cache
+from .ical import ICalError, iter_lines, parse_events
+from .management.commands.export_listing import Command as ExportCommand
+from .models import (
+    Availability, Booking, CalendarBitmap, ICalSync, Listing, ListingNightlyRate, ListingPhoto, Review,
+    listings_bulk_updated,
+)
+from .profiling import check_token, make_token, requested_mode
+from .search import get_backend
+from .serializers import ListingListSerializer
+from .services import (
+    AvailabilityService, BookingConflict, BookingService, CalendarIndexService, GeoService, ICalSyncService,
+    IdempotencyKeyReused, NightlyRateService, PhotoVariantService, PricingService,
+)
+
+
+def make_listing(owner, **fields):
+    """Объект с заполненными обязательными полями (beds, bathrooms и moderation_notes в БД NOT NULL)"""
+    values = {
+        'title': 'Квартира у парка', 'address': 'ул. Абая, 1', 'city': 'Алматы', 'sqft': 50,
+        'beds': 1, 'bathrooms': Decimal('1.0'), 'base_price': Decimal('100.00'),
+        'moderation_notes': '', 'house_rules': '',
+    }
+    values.update(fields)
+    return Listing.objects.create(owner=owner, **values)
+
+
+class CalendarIndexTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner')
+        self.guest = User.objects.create_user('guest')
+        self.listing = make_listing(self.owner)
+        self.check_in = date.today() + timedelta(days=10)
+        self.check_out = self.check_in + timedelta(days=3)
+        CalendarIndexService.refresh([self.listing.pk])
+
+    def book(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Booking.objects.create(
+                listing=self.listing, guest=self.guest, check_in=self.check_in, check_out=self.check_out,
+                guests_count=1, total_price=Decimal('300.00'), status='confirmed',
+            )
+
+    def test_saved_booking_closes_nights(self):
+        booking = self.book()
+        self.assertIs(CalendarIndexService.is_free(self.listing.pk, self.check_in, self.check_out), False)
+        self.assertFalse(AvailabilityService.is_available(self.listing, booking.check_in, booking.check_out))
+
+    def test_queryset_update_reopens_nights(self):
+        booking = self.book()
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.filter(pk=booking.pk).update(status='cancelled')
+        self.assertIs(CalendarIndexService.is_free(self.listing.pk, self.check_in, self.check_out), True)
+        self.assertTrue(AvailabilityService.is_available(self.listing, self.check_in, self.check_out))
+
+    def test_bulk_create_closes_nights(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Availability.objects.bulk_create([
+                Availability(listing=self.listing, date=self.check_in + timedelta(days=1), is_available=False),
+            ])
+        self.assertIs(CalendarIndexService.is_free(self.listing.pk, self.check_in, self.check_out), False)
+
+    def test_update_of_other_fields_sends_nothing(self):
+        booking = self.book()
+        with self.captureOnCommitCallbacks() as callbacks, self.assertNumQueries(1):
+            Booking.objects.filter(pk=booking.pk).update(special_requests='Поздний заезд')
+        self.assertEqual(callbacks, [])
+
+    def test_nights_past_horizon_checked_in_tables(self):
+        """Байты карты дополнены до целого: ночи за горизонтом не считаются свободными."""
+        horizon = CalendarIndexService.horizon_days()
+        self.check_in = date.today() + timedelta(days=horizon - 1)
+        self.check_out = date.today() + timedelta(days=horizon + 6)
+        self.book()
+        check_in, check_out = date.today() + timedelta(days=horizon), date.today() + timedelta(days=horizon + 4)
+        self.assertIsNone(CalendarIndexService.is_free(self.listing.pk, check_in, check_out))
+        self.assertFalse(AvailabilityService.is_available(self.listing, check_in, check_out))
+        self.assertFalse(
+            AvailabilityService.filter_available(Listing.objects.filter(pk=self.listing.pk), check_in, check_out).exists()
+        )
+
+    def ical_sync(self):
+        """Синхронизация, занявшая ночи check_in..check_out"""
+        ical_sync = ICalSync.objects.create(listing=self.listing, url='https://example.com/calendar.ics')
+        desired = {self.check_in + timedelta(days=i): f'{ical_sync.pk}:uid-1' for i in range(3)}
+        with self.captureOnCommitCallbacks(execute=True):
+            ICalSyncService.apply(ical_sync, self.check_in, self.check_out + timedelta(days=30), desired)
+        self.assertIs(CalendarIndexService.is_free(self.listing.pk, self.check_in, self.check_out), False)
+        return ical_sync
+
+    def test_ical_removed_dates_reopen_nights(self):
+        ical_sync = self.ical_sync()
+        with self.captureOnCommitCallbacks(execute=True):
+            ICalSyncService.apply(ical_sync, self.check_in, self.check_out + timedelta(days=30), {})
+        self.assertIs(CalendarIndexService.is_free(self.listing.pk, self.check_in, self.check_out), True)
+
+    def test_deleted_ical_sync_reopens_nights(self):
+        ical_sync = self.ical_sync()
+        with self.captureOnCommitCallbacks(execute=True):
+            ical_sync.delete()
+        self.assertFalse(Availability.objects.filter(listing=self.listing).exists())
+        self.assertIs(CalendarIndexService.is_free(self.listing.pk, self.check_in, self.check_out), True)
+        self.assertTrue(AvailabilityService.is_available(self.listing, self.check_in, self.check_out))
+
+    def test_bitmap_built_on_earlier_day(self):
+        """Карта, собранная несколько дней назад, по-прежнему отвечает по своей start_date."""
+        self.book()
+        start = date.today() - timedelta(days=5)
+        bits = CalendarIndexService.build_bitmaps([self.listing.pk], start, 30)[self.listing.pk]
+        CalendarBitmap.objects.filter(listing=self.listing).update(
+            start_date=start, days=30, bits=bits.to_bytes(4, 'little'),
+        )
+        self.assertIs(CalendarIndexService.is_free(self.listing.pk, self.check_in, self.check_out), False)
+        self.assertIs(CalendarIndexService.is_free(self.listing.pk, self.check_out, self.check_out + timedelta(days=2)), True)
+        # За концом карты ответа нет, проверяются таблицы
+        self.assertIsNone(CalendarIndexService.is_free(self.listing.pk, self.check_in, start + timedelta(days=40)))
+
+
+class ICalParserTests(SimpleTestCase):
+    fixtures_dir = Path(__file__).resolve().parent / 'fixtures' / 'ical'
+    window = (date(2025, 1, 1), date(2026, 1, 1))
+    tz = ZoneInfo('Asia/Almaty')
+
+    def parse(self, content, chunk_size=None, tz=tz):
+        chunk_size = chunk_size or len(content) or 1
+        chunks = (content[i:i + chunk_size] for i in range(0, len(content), chunk_size))
+        return [tuple(event) for event in parse_events(iter_lines(chunks), *self.window, tz)]
+
+    def calendar(self, *lines):
+        return '\r\n'.join(('BEGIN:VCALENDAR', 'VERSION:2.0') + lines + ('END:VCALENDAR',)).encode()
+
+    def test_fixtures(self):
+        expected = json.loads((self.fixtures_dir / 'expected.json').read_text())
+        self.assertEqual(
+            (expected['window'], expected['tz']), ([day.isoformat() for day in self.window], 'Asia/Almaty'),
+        )
+        for name, events in expected['feeds'].items():
+            content = (self.fixtures_dir / name).read_bytes()
+            # Порции по 1 байту режут строки, переносы и многобайтные символы UTF-8
+            for chunk_size in (1, 2, 7, 64, None):
+                with self.subTest(feed=name, chunk_size=chunk_size):
+                    if events is None:
+                        with self.assertRaises(ICalError):
+                            self.parse(content, chunk_size)
+                        continue
+                    # Порядок не важен: перенесенные вхождения отдаются раньше своих правил
+                    self.assertCountEqual(
+                        self.parse(content, chunk_size),
+                        [(uid, date.fromisoformat(start), date.fromisoformat(end)) for uid, start, end in events],
+                    )
+
+    def test_rrule_exdate(self):
+        content = self.calendar(
+            'BEGIN:VEVENT', 'UID:mondays', 'DTSTART;VALUE=DATE:20250106', 'DTEND;VALUE=DATE:20250107',
+            'RRULE:FREQ=WEEKLY;COUNT=4', 'EXDATE;VALUE=DATE:20250113', 'END:VEVENT',
+        )
+        # Исключенное вхождение тоже учитывается в COUNT
+        self.assertEqual(self.parse(content, 1), [
+            ('mondays', date(2025, 1, 6), date(2025, 1, 7)),
+            ('mondays', date(2025, 1, 20), date(2025, 1, 21)),
+            ('mondays', date(2025, 1, 27), date(2025, 1, 28)),
+        ])
+
+    def test_recurrence_id_override(self):
+        content = self.calendar(
+            'BEGIN:VEVENT', 'UID:daily', 'DTSTART;VALUE=DATE:20250201', 'RRULE:FREQ=DAILY;COUNT=3', 'END:VEVENT',
+            'BEGIN:VEVENT', 'UID:daily', 'RECURRENCE-ID;VALUE=DATE:20250202',
+            'DTSTART;VALUE=DATE:20250210', 'DTEND;VALUE=DATE:20250212', 'END:VEVENT',
+        )
+        # Перенесенное вхождение отдается сразу, правило разворачивается в конце без 2 февраля
+        self.assertEqual(self.parse(content, 1), [
+            ('daily', date(2025, 2, 10), date(2025, 2, 12)),
+            ('daily', date(2025, 2, 1), date(2025, 2, 2)),
+            ('daily', date(2025, 2, 3), date(2025, 2, 4)),
+        ])
+
+    def test_all_day_and_timed_start(self):
+        content = self.calendar(
+            'BEGIN:VEVENT', 'UID:all-day', 'DTSTART;VALUE=DATE:20250301', 'DTEND;VALUE=DATE:20250303', 'END:VEVENT',
+            'BEGIN:VEVENT', 'UID:tzid', 'DTSTART;TZID=Asia/Almaty:20250301T150000',
+            'DTEND;TZID=Asia/Almaty:20250303T110000', 'END:VEVENT',
+            'BEGIN:VEVENT', 'UID:utc', 'DTSTART:20250301T200000Z', 'DTEND:20250303T060000Z', 'END:VEVENT',
+        )
+        self.assertEqual(self.parse(content, 1), [
+            ('all-day', date(2025, 3, 1), date(2025, 3, 3)),
+            ('tzid', date(2025, 3, 1), date(2025, 3, 3)),
+            # 20:00 UTC - уже 1:00 следующего дня в Алматы
+            ('utc', date(2025, 3, 2), date(2025, 3, 3)),
+        ])
+        self.assertEqual(self.parse(content, tz=None)[2], ('utc', date(2025, 3, 1), date(2025, 3, 3)))
+
+
+class FakeFeedResponse:
+    """Ответ http.client для подмены listings.ical._request"""
+
+    def __init__(self, status, body=b'', headers=None):
+        self.status = status
+        self.reason = {200: 'OK', 304: 'Not Modified', 500: 'Internal Server Error'}.get(status, '')
+        self.headers = headers or {}
+        self.body = io.BytesIO(body)
+        self.will_close = False
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name, default)
+
+    def read(self, size=-1):
+        return self.body.read(size)
+
+    def isclosed(self):
+        return True
+
+
+class ICalSyncTests(TestCase):
+    def setUp(self):
+        self.listing = make_listing(User.objects.create_user('owner'))
+        self.ical_sync = ICalSync.objects.create(listing=self.listing, url='https://example.com/calendar.ics')
+        self.check_in = date.today() + timedelta(days=10)
+        self.check_out = self.check_in + timedelta(days=3)
+        self.requests = []
+
+    def calendar(self, *periods):
+        lines = ['BEGIN:VCALENDAR', 'VERSION:2.0']
+        for index, (start, end) in enumerate(periods):
+            lines += ['BEGIN:VEVENT', f'UID:event-{index}', f'DTSTART;VALUE=DATE:{start:%Y%m%d}',
+                      f'DTEND;VALUE=DATE:{end:%Y%m%d}', 'END:VEVENT']
+        lines.append('END:VCALENDAR')
+        return '\r\n'.join(lines).encode()
+
+    def sync(self, *responses):
+        def request(url, headers, timeout):
+            self.requests.append(headers)
+            response = next(replies)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        replies = iter(responses)
+        with mock.patch('listings.ical._request', request), self.captureOnCommitCallbacks(execute=True):
+            success, message = ICalSyncService.sync_ical(self.ical_sync)
+        self.ical_sync.refresh_from_db()
+        return success, message
+
+    def blocked(self):
+        return sorted(Availability.objects.filter(listing=self.listing, is_available=False).values_list('date', flat=True))
+
+    def nights(self):
+        return [self.check_in + timedelta(days=offset) for offset in range(3)]
+
+    def test_new_calendar_blocks_nights(self):
+        body = self.calendar((self.check_in, self.check_out))
+        success, _ = self.sync(FakeFeedResponse(200, body, {'ETag': '"v1"', 'Last-Modified': 'Mon, 02 Nov 2026 10:00:00 GMT'}))
+        self.assertTrue(success)
+        self.assertEqual(self.blocked(), self.nights())
+        self.assertEqual((self.ical_sync.etag, self.ical_sync.last_error), ('"v1"', ''))
+        self.assertEqual(len(self.ical_sync.content_hash), 64)
+        self.assertIsNotNone(self.ical_sync.next_sync)
+        self.assertIs(CalendarIndexService.is_free(self.listing.pk, self.check_in, self.check_out), False)
+
+    def test_not_modified(self):
+        headers = {'ETag': '"v1"', 'Last-Modified': 'Mon, 02 Nov 2026 10:00:00 GMT'}
+        self.sync(FakeFeedResponse(200, self.calendar((self.check_in, self.check_out)), headers))
+        success, message = self.sync(FakeFeedResponse(304))
+        self.assertEqual((success, message), (True, 'Не изменился (304)'))
+        self.assertEqual(self.requests[1]['If-None-Match'], '"v1"')
+        self.assertEqual(self.requests[1]['If-Modified-Since'], headers['Last-Modified'])
+        self.assertEqual(self.ical_sync.etag, '"v1"')
+        self.assertEqual(self.blocked(), self.nights())
+
+    def test_unchanged_content_skips_apply(self):
+        body = self.calendar((self.check_in, self.check_out))
+        self.sync(FakeFeedResponse(200, body, {'ETag': '"v1"'}))
+        content_hash = self.ical_sync.content_hash
+        with mock.patch.object(ICalSyncService, 'apply') as apply:
+            success, message = self.sync(FakeFeedResponse(200, body, {'ETag': '"v2"'}))
+        apply.assert_not_called()
+        self.assertEqual((success, message), (True, 'Без изменений'))
+        self.assertEqual((self.ical_sync.etag, self.ical_sync.content_hash), ('"v2"', content_hash))
+
+    def test_errors_recorded(self):
+        self.sync(FakeFeedResponse(200, self.calendar((self.check_in, self.check_out)), {'ETag': '"v1"'}))
+        success, _ = self.sync(ConnectionRefusedError('Connection refused'))
+        self.assertFalse(success)
+        self.assertEqual(self.ical_sync.last_error, 'Connection refused')
+        success, _ = self.sync(FakeFeedResponse(500))
+        self.assertFalse(success)
+        self.assertEqual(self.ical_sync.last_error, 'HTTP 500 Internal Server Error')
+        # Ошибка не трогает занятые даты и валидаторы прошлой загрузки
+        self.assertEqual(self.blocked(), self.nights())
+        self.assertEqual(self.ical_sync.etag, '"v1"')
+        self.sync(FakeFeedResponse(304))
+        self.assertEqual(self.ical_sync.last_error, '')
+
+    def test_price_override_night_blocked_and_reopened(self):
+        night = self.check_in + timedelta(days=1)
+        Availability.objects.create(listing=self.listing, date=night, price_override=Decimal('250.00'))
+        self.sync(FakeFeedResponse(200, self.calendar((self.check_in, self.check_out))))
+        self.assertEqual(self.blocked(), self.nights())
+        row = Availability.objects.get(listing=self.listing, date=night)
+        self.assertEqual((row.source, row.price_override), ('manual', Decimal('250.00')))
+        self.assertFalse(AvailabilityService.is_available(self.listing, night, night + timedelta(days=1)))
+
+        self.sync(FakeFeedResponse(200, self.calendar()))
+        self.assertEqual(self.blocked(), [])
+        row.refresh_from_db()
+        self.assertEqual((row.is_available, row.external_id, row.price_override), (True, '', Decimal('250.00')))
+        self.assertIs(CalendarIndexService.is_free(self.listing.pk, self.check_in, self.check_out), True)
+
+    def test_deleted_sync_reopens_manual_rows(self):
+        night = self.check_in + timedelta(days=1)
+        Availability.objects.create(listing=self.listing, date=night, price_override=Decimal('250.00'))
+        self.sync(FakeFeedResponse(200, self.calendar((self.check_in, self.check_out))))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ical_sync.delete()
+        row = Availability.objects.get(listing=self.listing)
+        self.assertEqual((row.date, row.is_available, row.price_override), (night, True, Decimal('250.00')))
+
+    def test_closed_manual_row_kept(self):
+        night = self.check_in + timedelta(days=1)
+        Availability.objects.create(listing=self.listing, date=night, is_available=False, notes='Ремонт')
+        self.sync(FakeFeedResponse(200, self.calendar((self.check_in, self.check_out))))
+        self.sync(FakeFeedResponse(200, self.calendar()))
+        row = Availability.objects.get(listing=self.listing)
+        self.assertEqual((row.date, row.is_available, row.notes, row.external_id), (night, False, 'Ремонт', ''))
+
+
+class BookingIdempotencyTests(TestCase):
+    def setUp(self):
+        self.guest = User.objects.create_user('guest')
+        self.listing = make_listing(User.objects.create_user('owner'), booking_type='instant')
+        self.check_in = date.today() + timedelta(days=30)
+        self.check_out = self.check_in + timedelta(days=2)
+
+    def create(self, check_out=None, guests_count=1):
+        return BookingService.create_booking(
+            self.listing.pk, self.guest, self.check_in, check_out or self.check_out, guests_count,
+            idempotency_key='booking-1',
+        )
+
+    def test_retry_returns_same_booking(self):
+        booking, created = self.create()
+        replayed, replay_created = self.create()
+        self.assertTrue(created)
+        self.assertFalse(replay_created)
+        self.assertEqual(replayed.pk, booking.pk)
+
+    def test_key_reused_with_other_parameters(self):
+        self.create()
+        with self.assertRaises(IdempotencyKeyReused):
+            self.create(check_out=self.check_out + timedelta(days=1))
+        with self.assertRaises(IdempotencyKeyReused):
+            self.create(guests_count=2)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_api_rejects_reused_key(self):
+        client = APIClient(HTTP_HOST='localhost')
+        client.force_authenticate(self.guest)
+        data = {'listing_id': self.listing.pk, 'check_in': self.check_in, 'check_out': self.check_out,
+                'guests_count': 1}
+        self.assertEqual(client.post('/api/bookings/', data, HTTP_IDEMPOTENCY_KEY='k').status_code, 201)
+        self.assertEqual(client.post('/api/bookings/', data, HTTP_IDEMPOTENCY_KEY='k').status_code, 200)
+        data['guests_count'] = 2
+        self.assertEqual(client.post('/api/bookings/', data, HTTP_IDEMPOTENCY_KEY='k').status_code, 422)
+
+    def test_key_conflict_with_deleted_booking(self):
+        client = APIClient(HTTP_HOST='localhost')
+        client.force_authenticate(self.guest)
+        data = {'listing_id': self.listing.pk, 'check_in': self.check_in, 'check_out': self.check_out,
+                'guests_count': 1}
+        # Бронь с этим ключом вызвала IntegrityError, но до повторного чтения ее удалили
+        with mock.patch.object(Booking.objects, 'create', side_effect=IntegrityError):
+            with self.assertRaises(BookingConflict):
+                self.create()
+            response = client.post('/api/bookings/', data, HTTP_IDEMPOTENCY_KEY='k')
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('Idempotency-Key', response.json()['error'])
+
+
+class BookingConcurrencyTests(TransactionTestCase):
+    """Параллельные брони в отдельных соединениях (TestCase держит все в одной транзакции)"""
+
+    def setUp(self):
+        self.guest = User.objects.create_user('guest')
+        self.listing = make_listing(User.objects.create_user('owner'), booking_type='instant')
+        self.check_in = date.today() + timedelta(days=30)
+
+    def attempt(self, key):
+        try:
+            _, created = BookingService.create_booking(
+                self.listing.pk, self.guest, self.check_in, self.check_in + timedelta(days=3), 1,
+                idempotency_key=key,
+            )
+            return 'created' if created else 'replayed'
+        except BookingConflict:
+            return 'conflict'
+        finally:
+            connection.close()
+
+    def run_parallel(self, keys):
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            return Counter(pool.map(self.attempt, keys))
+
+    def test_one_booking_for_same_dates(self):
+        results = self.run_parallel([f'race-{i}' for i in range(16)])
+        self.assertEqual(results, {'created': 1, 'conflict': 15})
+        self.assertEqual(Booking.objects.filter(listing=self.listing).count(), 1)
+
+    def test_retries_with_one_key_replay(self):
+        results = self.run_parallel(['retry'] * 16)
+        self.assertEqual(results, {'created': 1, 'replayed': 15})
+
+
+class GeoParamsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient(HTTP_HOST='localhost')
+        self.listing = make_listing(User.objects.create_user('owner'), latitude=Decimal('43.238949'),
+                                    longitude=Decimal('76.889709'))
+
+    def test_non_finite_values_rejected(self):
+        for params in (
+            {'lat': 'nan', 'lng': '76.9'},
+            {'lat': '43.2', 'lng': 'inf'},
+            {'lat': '43.2', 'lng': '76.9', 'radius_km': 'inf'},
+            {'lat': '43.2', 'lng': '76.9', 'radius_km': 'nan'},
+            {'bbox': '76.8,nan,77.0,43.3'},
+            {'bbox': '-inf,43.1,77.0,43.3'},
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get('/api/listings/', params).status_code, 400)
+        with self.assertRaises(ValueError):
+            GeoService.parse_radius('-1')
+
+    def test_radius_search(self):
+        response = self.client.get('/api/listings/', {'lat': '43.24', 'lng': '76.89', 'radius_km': '5'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.json()['results']], [self.listing.pk])
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient(HTTP_HOST='localhost')
+        owner = User.objects.create_user('owner')
+        self.in_title = make_listing(owner, title='Дом с бассейном', city='Алматы')
+        self.in_description = make_listing(owner, title='Квартира', description='Рядом бассейн', city='Астана')
+
+    def ids(self, params):
+        response = self.client.get('/api/listings/', params)
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.json()['results']]
+
+    def test_city_matches_substring(self):
+        self.assertEqual(self.ids({'city': 'ты'}), [self.in_title.pk])
+        self.assertEqual(self.ids({'city': 'Аст'}), [self.in_description.pk])
+
+    def test_search_ranks_title_matches_first(self):
+        self.assertEqual(self.ids({'search': 'бассейн'}), [self.in_title.pk, self.in_description.pk])
+
+    def test_rebuild(self):
+        backend = get_backend()
+        self.assertEqual(sum(backend.rebuild(chunk_size=1)), 2)
+        self.assertEqual(self.ids({'search': 'квартира'}), [self.in_description.pk])
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient(HTTP_HOST='localhost')
+        owner = User.objects.create_user('owner')
+        for index in range(7):
+            make_listing(owner, base_price=Decimal(100 + index), is_verified=index % 3 == 0)
+        self.expected = list(Listing.objects.order_by('-is_verified', '-list_date', '-id').values_list('pk', flat=True))
+
+    def get(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_forward_and_back(self):
+        page = self.get('/api/listings/', {'page_size': 3})
+        self.assertIsNone(page['previous'])
+        first = [row['id'] for row in page['results']]
+        seen = list(first)
+        while page['next']:
+            page = self.get(page['next'])
+            seen.extend(row['id'] for row in page['results'])
+        self.assertEqual(seen, self.expected)
+
+        second = self.get(self.get('/api/listings/', {'page_size': 3})['next'])
+        back = self.get(second['previous'])
+        self.assertEqual([row['id'] for row in back['results']], first)
+
+    def test_explicit_ordering_falls_back_to_page_numbers(self):
+        page = self.get('/api/listings/', {'ordering': '-base_price'})
+        self.assertEqual(page['count'], 7)
+        self.assertEqual(page['results'][0]['base_price'], '106.00')
+
+
+class ListingDateFilterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient(HTTP_HOST='localhost')
+        self.owner = User.objects.create_user('owner')
+        self.guest = User.objects.create_user('guest')
+        self.check_in = date.today() + timedelta(days=20)
+        self.check_out = self.check_in + timedelta(days=3)
+
+    def ids(self, params, status_code=200):
+        response = self.client.get('/api/listings/', params)
+        self.assertEqual(response.status_code, status_code)
+        return response.json() if status_code != 200 else [row['id'] for row in response.json()['results']]
+
+    def test_invalid_dates_rejected(self):
+        make_listing(self.owner)
+        for check_in, check_out in (('2026-13-01', '2026-12-05'), ('завтра', '2026-12-05'),
+                                    (self.check_out, self.check_in), (self.check_in, self.check_in)):
+            with self.subTest(check_in=check_in, check_out=check_out):
+                error = self.ids({'check_in': check_in, 'check_out': check_out}, status_code=400)
+                self.assertIn('error', error)
+        # Одна дата без пары - не период, фильтр не применяется
+        self.assertEqual(len(self.ids({'check_in': self.check_in})), 1)
+
+    def test_filter_by_bookings_and_calendar(self):
+        def listing(title, **fields):
+            return make_listing(self.owner, title=title, **fields).pk
+
+        def book(listing_id, check_in, check_out, status='confirmed'):
+            Booking.objects.create(listing_id=listing_id, guest=self.guest, check_in=check_in, check_out=check_out,
+                                   guests_count=1, total_price=Decimal('100.00'), status=status)
+
+        free = listing('Свободен')
+        booked = listing('Пересекается с бронью')
+        book(booked, self.check_in + timedelta(days=2), self.check_out + timedelta(days=2), status='pending')
+        cancelled = listing('Бронь отменена')
+        book(cancelled, self.check_in, self.check_out, status='cancelled')
+        adjacent = listing('Брони вплотную')
+        book(adjacent, self.check_in - timedelta(days=3), self.check_in)
+        book(adjacent, self.check_out, self.check_out + timedelta(days=2))
+        closed = listing('Закрытая дата')
+        Availability.objects.create(listing_id=closed, date=self.check_in + timedelta(days=1), is_available=False)
+        override = listing('Особая цена')
+        Availability.objects.create(listing_id=override, date=self.check_in, price_override=Decimal('500.00'))
+        closed_after = listing('Закрыта ночь выезда')
+        Availability.objects.create(listing_id=closed_after, date=self.check_out, is_available=False)
+        listing('Минимум 5 ночей', min_nights=5)
+        listing('Максимум 2 ночи', max_nights=2)
+
+        found = set(self.ids({'check_in': self.check_in, 'check_out': self.check_out}))
+        self.assertEqual(found, {free, cancelled, adjacent, override, closed_after})
+        self.assertEqual(len(self.ids({})), 9)
+
+    def test_keyset_pages_stable_with_ties(self):
+        listings = [make_listing(self.owner, title=f'Объект {index}') for index in range(9)]
+        # Одинаковые is_verified и list_date: порядок решает id
+        Listing.objects.update(list_date=timezone.now(), is_verified=False)
+        Booking.objects.create(listing=listings[4], guest=self.guest, check_in=self.check_in,
+                               check_out=self.check_out, guests_count=1, total_price=Decimal('300.00'),
+                               status='confirmed')
+        params = {'check_in': self.check_in, 'check_out': self.check_out, 'page_size': 2}
+        expected = [listing.pk for listing in reversed(listings) if listing != listings[4]]
+
+        page = self.client.get('/api/listings/', params).json()
+        pages = [[row['id'] for row in page['results']]]
+        while page['next']:
+            page = self.client.get(page['next']).json()
+            pages.append([row['id'] for row in page['results']])
+        self.assertEqual([pk for rows in pages for pk in rows], expected)
+        self.assertEqual([len(rows) for rows in pages], [2, 2, 2, 2])
+
+        # Назад от последней страницы - те же страницы в том же порядке
+        back = [pages[-1]]
+        while page['previous']:
+            page = self.client.get(page['previous']).json()
+            back.insert(0, [row['id'] for row in page['results']])
+        self.assertEqual(back, pages)
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient(HTTP_HOST='localhost')
+        owner = User.objects.create_user('owner')
+        self.listing = make_listing(owner)
+        self.other = make_listing(owner, title='Другой объект')
+
+    def get(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_hit_after_miss(self):
+        self.assertEqual(self.get('/api/listings/')['X-Cache'], 'MISS')
+        self.assertEqual(self.get('/api/listings/')['X-Cache'], 'HIT')
+
+    def test_save_invalidates_only_its_listing(self):
+        url, other_url = f'/api/listings/{self.listing.pk}/', f'/api/listings/{self.other.pk}/'
+        for warm_up in (url, other_url, '/api/listings/'):
+            self.get(warm_up)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.listing.title = 'Новый заголовок'
+            self.listing.save()
+        response = self.get(url)
+        self.assertEqual((response['X-Cache'], response.json()['title']), ('MISS', 'Новый заголовок'))
+        self.assertEqual(self.get(other_url)['X-Cache'], 'HIT')
+        self.assertEqual(self.get('/api/listings/')['X-Cache'], 'MISS')
+
+    def test_queryset_update_invalidates_lists(self):
+        self.get('/api/listings/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Listing.objects.filter(pk=self.listing.pk).update(base_price=Decimal('250.00'))
+        response = self.get('/api/listings/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        prices = {row['id']: row['base_price'] for row in response.json()['results']}
+        self.assertEqual(prices[self.listing.pk], '250.00')
+
+    def test_booking_invalidates_availability(self):
+        check_in = date.today() + timedelta(days=20)
+        url = f'/api/listings/{self.listing.pk}/availability/'
+        params = {'check_in': check_in, 'check_out': check_in + timedelta(days=2)}
+        self.get(url, params)
+        self.assertEqual(self.get(url, params)['X-Cache'], 'HIT')
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.create(
+                listing=self.listing, guest=User.objects.create_user('guest'), check_in=check_in,
+                check_out=check_in + timedelta(days=2), guests_count=1, total_price=Decimal('200.00'),
+                status='confirmed',
+            )
+        response = self.get(url, params)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertFalse(response.json()['available'])
+
+    def test_stats_only_when_enabled(self):
+        self.get('/api/listings/')
+        self.get('/api/listings/')
+        self.assertEqual(response_cache.stats()['hit'], 0)
+        with override_settings(LISTINGS_CACHE_STATS=True):
+            self.get('/api/listings/')
+            self.assertEqual(response_cache.stats(), {'hit': 1, 'miss': 0, 'hit_ratio': 1.0})
+
+
+class ICalFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient(HTTP_HOST='localhost')
+        self.listing = make_listing(User.objects.create_user('owner'))
+        self.guest = User.objects.create_user('guest')
+        self.url = f'/api/listings/{self.listing.pk}/calendar.ics'
+
+    def ranges(self, response):
+        start = date.today()
+        lines = iter_lines([response.content])
+        end = start + timedelta(days=CalendarIndexService.horizon_days())
+        return [(event.start, event.end) for event in parse_events(lines, start, end)]
+
+    def book(self, check_in, nights):
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.create(
+                listing=self.listing, guest=self.guest, check_in=check_in,
+                check_out=check_in + timedelta(days=nights), guests_count=1,
+                total_price=Decimal('100.00') * nights, status='confirmed',
+            )
+
+    def test_not_modified_with_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual((response.status_code, response['X-Cache']), (200, 'MISS'))
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        with self.assertNumQueries(0):
+            repeated = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual((repeated.status_code, repeated.content), (304, b''))
+        since = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(since.status_code, 304)
+
+    def test_booking_changes_feed(self):
+        response = self.client.get(self.url)
+        self.assertEqual(self.ranges(response), [])
+        check_in = date.today() + timedelta(days=7)
+        self.book(check_in, 3)
+        changed = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual((changed.status_code, changed['X-Cache']), (200, 'MISS'))
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+        self.assertEqual(self.ranges(changed), [(check_in, check_in + timedelta(days=3))])
+
+
+class MonthCalendarTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient(HTTP_HOST='localhost')
+        self.listing = make_listing(
+            User.objects.create_user('owner'), weekend_price=Decimal('150.00'), min_nights=2,
+        )
+        self.url = f'/api/listings/{self.listing.pk}/calendar/'
+        # Понедельник через две недели: ночи недели начинаются с предсказуемого дня
+        self.monday = date.today() + timedelta(days=14 - date.today().weekday())
+
+    def days(self, params=None):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return {day['date']: day for day in response.json()['days']}, response
+
+    def test_default_period(self):
+        days, response = self.days()
+        self.assertEqual(len(days), 90)
+        self.assertEqual(response.json()['from'], date.today().isoformat())
+        self.assertEqual(response.json()['min_nights'], 2)
+
+    def test_period_limits(self):
+        start = date.today()
+        self.days({'from': start, 'to': start + timedelta(days=185)})
+        for params in (
+            {'from': start, 'to': start + timedelta(days=186)},
+            {'from': start, 'to': start - timedelta(days=1)},
+            {'from': 'завтра'},
+        ):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+    def test_prices_and_availability(self):
+        Availability.objects.create(listing=self.listing, date=self.monday, price_override=Decimal('777.00'))
+        Booking.objects.create(
+            listing=self.listing, guest=User.objects.create_user('guest'), check_in=self.monday + timedelta(days=2),
+            check_out=self.monday + timedelta(days=4), guests_count=1, total_price=Decimal('200.00'),
+            status='confirmed',
+        )
+        days, _ = self.days({'from': self.monday, 'to': self.monday + timedelta(days=6)})
+        week = [days[(self.monday + timedelta(days=offset)).isoformat()] for offset in range(7)]
+        self.assertEqual([day['price'] for day in week], [777.0, 100.0, 100.0, 100.0, 100.0, 150.0, 150.0])
+        self.assertEqual([day['available'] for day in week], [True, True, False, False, True, True, True])
+        # min_nights=2: во вторник заехать нельзя, следующая ночь занята
+        self.assertEqual([day['check_in'] for day in week], [True, False, False, False, True, True, True])
+
+    def test_booking_invalidates_months(self):
+        params = {'from': self.monday, 'to': self.monday + timedelta(days=6)}
+        self.days(params)
+        days, response = self.days(params)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        with self.captureOnCommitCallbacks(execute=True):
+            Availability.objects.create(listing=self.listing, date=self.monday, is_available=False)
+        days, response = self.days(params)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertFalse(days[self.monday.isoformat()]['available'])
+
+
+class QuoteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient(HTTP_HOST='localhost')
+        self.owner = User.objects.create_user('owner')
+        monday = date.today() + timedelta(days=14 - date.today().weekday())
+        self.check_in = monday
+
+    def test_quote_in_database(self):
+        listing = make_listing(self.owner, weekend_price=Decimal('150.00'), weekly_discount=10)
+        plain = make_listing(self.owner, title='Без особых цен', base_price=Decimal('80.00'))
+        check_out = self.check_in + timedelta(days=8)
+        Availability.objects.create(listing=listing, date=self.check_in + timedelta(days=1),
+                                    price_override=Decimal('300.00'))
+        response = self.client.post('/api/listings/quote/', {
+            'check_in': self.check_in, 'check_out': check_out, 'ids': [listing.pk, plain.pk],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        totals = {row['id']: row['total_price'] for row in response.json()['results']}
+        # 8 ночей: 5 будних по 100, вторник - 300, 2 выходных по 150, скидка 10%
+        self.assertEqual(totals, {listing.pk: 990.0, plain.pk: 640.0})
+
+    def test_database_and_python_totals_match(self):
+        # Цены, у которых скидка дает ровно полкопейки: float-деление округляло их вниз
+        listings = [
+            make_listing(self.owner, base_price=Decimal(price), weekend_price=weekend, weekly_discount=weekly,
+                         monthly_discount=monthly)
+            for price in ('100.15', '99.99', '123.45', '0.05', '8765.43')
+            for weekend, weekly, monthly in ((None, 10, 0), (Decimal('150.05'), 15, 0), (None, 5, 25))
+        ]
+        Availability.objects.create(listing=listings[0], date=self.check_in + timedelta(days=2),
+                                    price_override=Decimal('77.77'))
+        ids = [listing.pk for listing in listings]
+        for nights in (7, 9, 30, 33):
+            check_out = self.check_in + timedelta(days=nights)
+            with self.subTest(nights=nights):
+                annotated = dict(PricingService.annotate_quotes(
+                    Listing.objects.filter(pk__in=ids), self.check_in, check_out,
+                ).values_list('pk', 'quote_total'))
+                batch = PricingService.quote_many(listings, self.check_in, check_out)
+                for listing in listings:
+                    total = PricingService.calculate_total_price(listing, self.check_in, check_out)
+                    self.assertEqual(total, total.quantize(Decimal('0.01')))
+                    self.assertEqual((annotated[listing.pk], batch[listing.pk]), (total, total), listing.base_price)
+        # 7 ночей по 100.15 со скидкой 10%: 630.945 -> 630.95
+        self.assertEqual(PricingService.calculate_total_price(
+            listings[0], self.check_in + timedelta(days=7), self.check_in + timedelta(days=14)), Decimal('630.95'))
+
+
+class PricingConsistencyTests(TestCase):
+    """Поиск, quote и бронирование считают одну и ту же стоимость"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient(HTTP_HOST='localhost')
+        owner = User.objects.create_user('owner')
+        self.listing = make_listing(owner, weekend_price=Decimal('150.00'), weekly_discount=10)
+        self.plain = make_listing(owner, title='Без особых цен', base_price=Decimal('80.00'))
+        monday = date.today() + timedelta(days=14 - date.today().weekday())
+        self.check_in, self.check_out = monday, monday + timedelta(days=8)
+        with self.captureOnCommitCallbacks(execute=True):
+            Availability.objects.create(listing=self.listing, date=monday + timedelta(days=1),
+                                        price_override=Decimal('300.00'))
+            Availability.objects.create(listing=self.listing, date=monday + timedelta(days=5),
+                                        price_override=Decimal('90.00'))
+
+    def expected(self, listing):
+        return float(PricingService.calculate_total_price(listing, self.check_in, self.check_out).quantize(Decimal('0.01')))
+
+    def search(self):
+        response = self.client.post(
+            '/api/listings/search/', {'check_in': self.check_in, 'check_out': self.check_out}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        return {row['id']: row['total_price'] for row in response.json()}
+
+    def test_booking_price_uses_overrides(self):
+        # 8 ночей: 6 будних по 100 и 2 выходных по 150, вторник - 300, суббота - 90, скидка 10%
+        total = PricingService.calculate_total_price(self.listing, self.check_in, self.check_out)
+        self.assertEqual(total, Decimal('936.00'))
+        booking, _ = BookingService.create_booking(
+            self.listing.pk, User.objects.create_user('guest'), self.check_in, self.check_out, 1,
+        )
+        self.assertEqual(booking.total_price, total)
+
+    def test_search_with_nightly_rates(self):
+        self.assertTrue(ListingNightlyRate.objects.filter(listing=self.listing).exists())
+        totals = self.search()
+        self.assertEqual(totals[self.listing.pk], self.expected(self.listing))
+        self.assertEqual(totals[self.plain.pk], self.expected(self.plain))
+
+    def test_search_fallback_without_nightly_rates(self):
+        ListingNightlyRate.objects.all().delete()
+        totals = self.search()
+        self.assertEqual(totals[self.listing.pk], self.expected(self.listing))
+        self.assertEqual(totals[self.plain.pk], self.expected(self.plain))
+
+    def test_large_change_drops_rates_with_warning(self):
+        with mock.patch('listings.services.NIGHTLY_RATES_SYNC_LIMIT', 1), \
+                self.assertLogs('listings.services', 'WARNING') as logs:
+            NightlyRateService.changed([self.listing.pk, self.plain.pk])
+        self.assertIn('rebuild_nightly_rates', logs.output[0])
+        self.assertFalse(ListingNightlyRate.objects.exists())
+        self.assertEqual(self.search()[self.listing.pk], self.expected(self.listing))
+
+
+class ListingBulkUpdateTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner')
+        self.listing = make_listing(self.owner)
+
+    def test_silent_fields_skip_select_and_signal(self):
+        with self.captureOnCommitCallbacks() as callbacks, self.assertNumQueries(1):
+            Listing.objects.filter(pk=self.listing.pk).update(moderation_notes='Проверить фото')
+        self.assertEqual(callbacks, [])
+
+    def test_observed_fields_send_signal(self):
+        received = []
+
+        def receiver(sender, listing_ids, fields, **kwargs):
+            received.append((listing_ids, fields))
+
+        listings_bulk_updated.connect(receiver)
+        self.addCleanup(listings_bulk_updated.disconnect, receiver)
+        Listing.objects.filter(pk=self.listing.pk).update(base_price=Decimal('120.00'), moderation_notes='')
+        self.assertEqual(received, [([self.listing.pk], {'base_price', 'moderation_notes'})])
+
+    def new_listing(self, pk, **fields):
+        values = {
+            'title': f'Импорт {pk}', 'address': 'ул. Абая, 2', 'city': 'Алматы', 'sqft': 40, 'beds': 1,
+            'bathrooms': Decimal('1.0'), 'base_price': Decimal('90.00'), 'moderation_notes': '', 'house_rules': '',
+        }
+        values.update(fields)
+        return Listing(pk=pk, owner=self.owner, **values)
+
+    def test_bulk_create_leaves_nightly_rates_to_command(self):
+        pks = [self.listing.pk + 1, self.listing.pk + 2]
+        with self.captureOnCommitCallbacks(execute=True), mock.patch.object(NightlyRateService, 'changed') as changed:
+            Listing.objects.bulk_create([self.new_listing(pk) for pk in pks])
+        changed.assert_not_called()
+        self.assertFalse(ListingNightlyRate.objects.filter(listing_id__in=pks).exists())
+        # Новые объекты при этом попадают в поисковый индекс
+        self.assertEqual(Listing.objects.filter(pk__in=pks, search_index__isnull=False).count(), 2)
+
+    def test_upsert_without_price_fields_keeps_rates(self):
+        NightlyRateService.refresh([self.listing.pk])
+        rates = ListingNightlyRate.objects.filter(listing=self.listing).count()
+        update = self.new_listing(self.listing.pk, title='Новое название', base_price=Decimal('500.00'))
+        with self.captureOnCommitCallbacks(execute=True), mock.patch.object(NightlyRateService, 'changed') as changed:
+            Listing.objects.bulk_create([update], update_conflicts=True, unique_fields=['id'], update_fields=['title'])
+        changed.assert_not_called()
+        self.assertEqual(ListingNightlyRate.objects.filter(listing=self.listing).count(), rates)
+
+    def test_large_price_update_drops_rates(self):
+        other = make_listing(self.owner, title='Второй')
+        NightlyRateService.refresh([self.listing.pk, other.pk])
+        with mock.patch('listings.services.NIGHTLY_RATES_SYNC_LIMIT', 1), \
+                self.assertLogs('listings.services', 'WARNING'), self.captureOnCommitCallbacks(execute=True):
+            Listing.objects.filter(pk__in=[self.listing.pk, other.pk]).update(base_price=Decimal('110.00'))
+        self.assertFalse(ListingNightlyRate.objects.exists())
+        self.assertEqual(set(NightlyRateService.pending().values_list('pk', flat=True)), {self.listing.pk, other.pk})
+
+    def test_rating_aggregates_follow_reviews(self):
+        guest = User.objects.create_user('guest')
+        reviews = []
+        for rating, nights_ago in ((5, 20), (2, 10)):
+            check_in = date.today() - timedelta(days=nights_ago)
+            booking = Booking.objects.create(
+                listing=self.listing, guest=guest, check_in=check_in, check_out=check_in + timedelta(days=2),
+                guests_count=1, total_price=Decimal('200.00'), status='completed',
+            )
+            reviews.append(Review.objects.create(booking=booking, listing=self.listing, reviewer=guest, rating=rating,
+                                                 cleanliness_rating=rating))
+        self.listing.refresh_from_db()
+        self.assertEqual((self.listing.rating_count, self.listing.rating_avg), (2, Decimal('3.50')))
+        self.assertEqual((self.listing.rating_5, self.listing.rating_2, self.listing.cleanliness_sum), (1, 1, 7))
+
+        reviews[0].delete()
+        self.listing.refresh_from_db()
+        self.assertEqual((self.listing.rating_count, self.listing.rating_avg, self.listing.rating_5), (1, Decimal('2.00'), 0))
+
+
+class FastSerializeTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user('owner')
+        photo = 'photos/2024/05/01/фото 1.jpg'
+        make_listing(owner, photo_main=photo, rating_avg=Decimal('4.35'), latitude=Decimal('43.238949'),
+                     longitude=Decimal('76.889709'), bathrooms=Decimal('1.5'), photo_variants={
+                         'source': photo,
+                         'webp': {'320': 'variants/1-320.webp', '640': 'variants/1-640.webp'},
+                         'jpeg': {'320': 'variants/1-320.jpg'},
+                     })
+        make_listing(owner, title='Без фото и отзывов', rating_avg=None, latitude=None, longitude=None)
+        self.context = {'request': Request(APIRequestFactory(HTTP_HOST='localhost').get('/api/listings/'))}
+
+    def assertSameJSON(self, queryset):
+        standard = ListingListSerializer(list(queryset), many=True, context=self.context).data
+        fast = ListingListSerializer.fast_serialize(ListingListSerializer.fast_values(queryset), context=self.context)
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(fast), renderer.render(standard))
+        return fast
+
+    def test_matches_model_serializer(self):
+        rows = self.assertSameJSON(Listing.objects.order_by('pk'))
+        self.assertTrue(rows[0]['photo_srcset']['webp'].startswith('http://localhost/media/variants/1-320.webp 320w'))
+        self.assertEqual((rows[0]['average_rating'], rows[1]['average_rating']), (4.35, None))
+        self.assertEqual(rows[1]['photo_srcset'], {})
+
+    def test_matches_with_distance(self):
+        queryset = GeoService.annotate_distance(Listing.objects.order_by('pk'), 43.24, 76.89)
+        rows = self.assertSameJSON(queryset)
+        self.assertIsNotNone(rows[0]['distance'])
+        self.assertIsNone(rows[1]['distance'])
+
+
+@override_settings(LISTINGS_CACHE_ENABLED=False, LISTINGS_METRICS_ENABLED=False)
+class ServerTimingTests(TestCase):
+    def setUp(self):
+        self.client = APIClient(HTTP_HOST='localhost')
+        make_listing(User.objects.create_user('owner'))
+
+    def spans(self, response):
+        return {part.split(';')[0]: part for part in response['Server-Timing'].split(', ')}
+
+    @override_settings(LISTINGS_SERVER_TIMING=True)
+    def test_header_lists_sql_and_spans(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/listings/')
+        spans = self.spans(response)
+        self.assertEqual(list(spans), ['sql', 'view', 'serialize', 'render', 'total'])
+        self.assertIn(f'desc="SQL: {len(queries)}"', spans['sql'])
+
+    @override_settings(LISTINGS_SERVER_TIMING=False)
+    def test_disabled(self):
+        self.assertNotIn('Server-Timing', self.client.get('/api/listings/'))
+
+    @override_settings(LISTINGS_SERVER_TIMING=False, LISTINGS_TIMING_SAMPLE_RATE=1.0)
+    def test_sampled_request_logged(self):
+        with self.assertLogs('listings.timing', 'INFO') as logs:
+            self.client.get('/api/listings/')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record['path'], record['status']), ('/api/listings/', 200))
+        self.assertGreater(record['queries'], 0)
+        self.assertIn('serialize_ms', record)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # Свой каталог - свои значения, независимо от других тестов
+        settings = override_settings(LISTINGS_METRICS_DIR=directory.name, LISTINGS_METRICS_TOKEN='scrape-token')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client = APIClient(HTTP_HOST='localhost')
+        self.staff = User.objects.create_user('staff', is_staff=True)
+        make_listing(User.objects.create_user('owner'))
+
+    def scrape(self):
+        response = self.client.get('/admin/metrics/', HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        return response.content.decode()
+
+    def test_access(self):
+        self.assertEqual(self.client.get('/admin/metrics/').status_code, 302)
+        denied = self.client.get('/admin/metrics/', HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(denied.status_code, 403)
+        with override_settings(LISTINGS_METRICS_TOKEN=None):
+            denied = self.client.get('/admin/metrics/', HTTP_AUTHORIZATION='Bearer scrape-token')
+            self.assertEqual(denied.status_code, 403)
+        self.client.force_login(User.objects.create_user('guest'))
+        self.assertEqual(self.client.get('/admin/metrics/').status_code, 302)
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get('/admin/metrics/').status_code, 200)
+
+    @override_settings(LISTINGS_METRICS_ENABLED=True)
+    def test_requests_recorded_when_enabled(self):
+        self.client.get('/api/listings/')
+        self.client.get('/api/listings/')
+        text = self.scrape()
+        self.assertIn('listings_http_requests_total{route="listing-list",method="GET",status="200"} 2', text)
+        self.assertIn('listings_http_request_duration_seconds_count{route="listing-list",status="200"} 2', text)
+        self.assertIn('listings_response_cache_total{view="listing-list",result="hit"} 1', text)
+
+    def test_disabled_by_default(self):
+        self.client.get('/api/listings/')
+        text = self.scrape()
+        self.assertIn('# TYPE listings_http_requests_total counter', text)
+        self.assertNotIn('listings_http_requests_total{', text)
+        self.assertNotIn('listings_response_cache_total{', text)
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.client = APIClient(HTTP_HOST='localhost')
+        self.factory = APIRequestFactory(HTTP_HOST='localhost')
+        self.staff = User.objects.create_user('staff', is_staff=True)
+        make_listing(User.objects.create_user('owner'))
+
+    def request(self, user=None, **extra):
+        request = self.factory.get('/api/listings/', extra.pop('data', None), **extra)
+        request.user = user or AnonymousUser()
+        return request
+
+    def test_token(self):
+        token = make_token()
+        self.assertTrue(check_token(token))
+        self.assertFalse(check_token(token + 'x'))
+        self.assertFalse(check_token('profile'))
+        with override_settings(LISTINGS_PROFILE_TOKEN_AGE=-1):
+            self.assertFalse(check_token(token))
+
+    def test_requested_mode(self):
+        token = make_token()
+        self.assertEqual(requested_mode(self.request(HTTP_X_PROFILE=token)), 'cprofile')
+        self.assertEqual(requested_mode(self.request(HTTP_X_PROFILE=token, HTTP_X_PROFILE_MODE='sampling')), 'sampling')
+        self.assertIsNone(requested_mode(self.request(HTTP_X_PROFILE=token, HTTP_X_PROFILE_MODE='tracemalloc')))
+        self.assertIsNone(requested_mode(self.request(HTTP_X_PROFILE='bad')))
+        self.assertIsNone(requested_mode(self.request()))
+        self.assertIsNone(requested_mode(self.request(data={'_profile': '1'})))
+        guest = User.objects.create_user('guest')
+        self.assertIsNone(requested_mode(self.request(guest, data={'_profile': '1'})))
+        self.assertEqual(requested_mode(self.request(self.staff, data={'_profile': '1'})), 'cprofile')
+        self.assertEqual(requested_mode(self.request(self.staff, data={'_profile': 'sampling'})), 'sampling')
+
+    def test_middleware_writes_profile(self):
+        with override_settings(LISTINGS_PROFILE_DIR=self.directory):
+            response = self.client.get('/api/listings/', HTTP_X_PROFILE=make_token())
+        self.assertEqual(response.status_code, 200)
+        name = response['X-Profile']
+        self.assertTrue(name.endswith('.prof'))
+        self.assertIn('GET-listing-list', name)
+        self.assertGreater(pstats.Stats(os.path.join(self.directory, name)).total_calls, 0)
+
+    def test_middleware_off_without_directory(self):
+        response = self.client.get('/api/listings/', HTTP_X_PROFILE=make_token())
+        self.assertNotIn('X-Profile', response)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_rotation(self):
+        with override_settings(LISTINGS_PROFILE_DIR=self.directory, LISTINGS_PROFILE_KEEP=2):
+            self.client.force_login(self.staff)
+            for _ in range(4):
+                self.assertIn('X-Profile', self.client.get('/api/listings/', {'_profile': '1'}))
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+
+
+class ImportListingTests(TestCase):
+    def listing_record(self, pk, owner, **fields):
+        values = {
+            'owner': owner, 'title': f'Объект {pk}', 'address': 'ул. Абая, 1', 'city': 'Алматы', 'sqft': 40,
+            'base_price': '150.00', 'moderation_notes': '', 'house_rules': '',
+            'rating_count': 12, 'rating_sum': 60, 'rating_avg': '5.00', 'rating_5': 12,
+            'photo_variants': {'source': 'photos/1.jpg', 'webp': {'320': 'variants/1-320.webp'}},
+        }
+        values.update(fields)
+        return {'model': 'listings.listing', 'pk': pk, 'fields': values}
+
+    def run_import(self, records, **options):
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', encoding='utf-8', delete=False) as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.addCleanup(os.remove, f.name)
+        output = io.StringIO()
+        call_command('import_listing', f.name, stdout=output, **options)
+        return output.getvalue()
+
+    def test_new_owner_gets_no_credentials(self):
+        user = {'model': 'auth.user', 'pk': 500, 'fields': {
+            'username': 'remote_admin', 'password': 'pbkdf2_sha256$1000000$salt$hash',
+            'is_staff': True, 'is_superuser': True, 'is_active': True,
+        }}
+        self.run_import([user, self.listing_record(9001, 500)])
+        owner = User.objects.get(username='remote_admin')
+        self.assertFalse(owner.is_staff or owner.is_superuser)
+        self.assertFalse(owner.has_usable_password())
+        self.assertEqual(Listing.objects.get(pk=9001).owner, owner)
+
+    def test_unmapped_owner_is_skipped(self):
+        # Пользователь с тем же ID в этой БД - другой человек
+        local = User.objects.create_user('local_user')
+        output = self.run_import([self.listing_record(9002, local.pk)])
+        self.assertFalse(Listing.objects.filter(pk=9002).exists())
+        self.assertIn('--owner-username', output)
+
+        self.run_import([self.listing_record(9002, local.pk)], owner_username='local_user')
+        self.assertEqual(Listing.objects.get(pk=9002).owner, local)
+
+    def test_local_fields_not_taken_from_file(self):
+        owner = User.objects.create_user('owner')
+        self.run_import([self.listing_record(9003, owner.pk)], owner_username='owner')
+        listing = Listing.objects.get(pk=9003)
+        self.assertEqual((listing.rating_count, listing.rating_avg, listing.photo_variants), (0, None, {}))
+
+        Listing.objects.filter(pk=9003).update(rating_count=3, rating_sum=12, photo_variants={'source': 'local.jpg'})
+        self.run_import([self.listing_record(9003, owner.pk, title='Новое название')], owner_username='owner',
+                        update_existing=True)
+        listing.refresh_from_db()
+        self.assertEqual(listing.title, 'Новое название')
+        self.assertEqual((listing.rating_count, listing.photo_variants), (3, {'source': 'local.jpg'}))
+
+
+class ExportListingTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        owners = [User.objects.create_user(f'owner{index}', password='secret') for index in range(2)]
+        for index in range(5):
+            make_listing(owners[index % 2], title=f'Объект {index}', city='Алматы' if index < 4 else 'Астана')
+
+    def export(self, name, **options):
+        path = os.path.join(self.directory, name)
+        call_command('export_listing', all=True, include_owner=True, output=path, chunk_size=2,
+                     stdout=io.StringIO(), **options)
+        return path
+
+    def members(self, path):
+        """Члены gzip-архива по отдельности: каждая порция должна читаться сама по себе"""
+        with open(path, 'rb') as f:
+            data = f.read()
+        members = []
+        while data:
+            decompressor = zlib.decompressobj(wbits=31)
+            members.append(decompressor.decompress(data).decode())
+            self.assertTrue(decompressor.eof)
+            data = decompressor.unused_data
+        return members
+
+    def records(self, path):
+        return [json.loads(line) for member in self.members(path) for line in member.splitlines()]
+
+    def test_round_trip(self):
+        path = self.export('listings.ndjson.gz')
+        self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+        # Порция - владельцы и до двух объявлений
+        self.assertEqual(len(self.members(path)), 3)
+        records = self.records(path)
+        self.assertEqual(Counter(record['model'] for record in records), {'listings.listing': 5, 'auth.user': 2})
+        for record in records:
+            if record['model'] == 'auth.user':
+                self.assertNotIn('password', record['fields'])
+                self.assertNotIn('is_superuser', record['fields'])
+
+        fields = ['pk', 'title', 'city', 'base_price', 'owner__username']
+        expected = list(Listing.objects.order_by('pk').values_list(*fields))
+        Listing.objects.all().delete()
+        User.objects.all().delete()
+        call_command('import_listing', path, stdout=io.StringIO())
+        self.assertEqual(list(Listing.objects.order_by('pk').values_list(*fields)), expected)
+        self.assertFalse(any(owner.has_usable_password() for owner in User.objects.all()))
+
+    def test_resume_after_interruption(self):
+        expected = self.records(self.export('full.ndjson.gz'))
+        path = os.path.join(self.directory, 'listings.ndjson.gz')
+        save_checkpoint = ExportCommand.save_checkpoint
+        calls = []
+
+        def interrupt(checkpoint_file, data):
+            calls.append(data)
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+            save_checkpoint(checkpoint_file, data)
+
+        # Вторая порция записана, но контрольная точка после нее не сохранена
+        with mock.patch.object(ExportCommand, 'save_checkpoint', staticmethod(interrupt)):
+            with self.assertRaises(KeyboardInterrupt):
+                self.export('listings.ndjson.gz')
+        with open(path, 'ab') as f:
+            f.write(b'\x1f\x8b\x08 oborvano')
+        with open(f'{path}.checkpoint', encoding='utf-8') as f:
+            self.assertEqual(json.load(f)['exported'], 2)
+
+        with self.assertRaises(CommandError):
+            self.export('listings.ndjson.gz', resume=True, city='Алматы')
+        self.export('listings.ndjson.gz', resume=True)
+        self.assertEqual(self.records(path), expected)
+        self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+
+
+class CreateListingsFromImagesTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.images = os.path.join(directory.name, 'img')
+        media = os.path.join(directory.name, 'media')
+        settings = override_settings(MEDIA_ROOT=media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.image('1 house/a.jpg', 'red', (64, 48))
+        # Копия того же файла в этой и другой папке
+        os.makedirs(os.path.join(self.images, '7 house'))
+        for copy in ('1 house/b.jpg', '7 house/x.jpg'):
+            with open(os.path.join(self.images, '1 house/a.jpg'), 'rb') as src, \
+                    open(os.path.join(self.images, copy), 'wb') as dst:
+                dst.write(src.read())
+        self.image('1 house/c.png', 'blue', (32, 32))
+        with open(os.path.join(self.images, '1 house/d.jpg'), 'wb') as f:
+            f.write(b'not an image')
+
+    def image(self, name, color, size):
+        path = os.path.join(self.images, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        Image.new('RGB', size, color).save(path)
+
+    def run_command(self):
+        output = io.StringIO()
+        call_command('create_listings_from_images', path=self.images, workers=1, stdout=output)
+        return output.getvalue()
+
+    def stored_files(self):
+        return sorted(
+            os.path.relpath(os.path.join(root, name), default_storage.location)
+            for root, _, names in os.walk(default_storage.location) for name in names
+        )
+
+    def test_photos_deduplicated_by_hash(self):
+        output = self.run_command()
+        self.assertIn('d.jpg', output)
+        first, second = Listing.objects.order_by('title')
+        photos = list(first.photos.all())
+        self.assertEqual([(photo.position, photo.width, photo.height) for photo in photos], [(0, 64, 48), (1, 32, 32)])
+        for photo in photos:
+            self.assertEqual(photo.image.name, f'photos/{photo.content_hash[:2]}/{photo.content_hash}'
+                                               f'{os.path.splitext(photo.image.name)[1]}')
+        self.assertEqual(first.photo_main.name, photos[0].image.name)
+        self.assertEqual(second.photo_main.name, photos[0].image.name)
+        self.assertEqual(list(second.photos.values_list('image', flat=True)), [photos[0].image.name])
+        # Три копии первого фото - один файл
+        self.assertEqual(self.stored_files(), sorted(photo.image.name for photo in photos))
+
+        self.run_command()
+        self.assertEqual(Listing.objects.count(), 2)
+        self.assertEqual(ListingPhoto.objects.count(), 3)
+
+    def test_name_returned_by_storage(self):
+        def available_name(name, max_length=None):
+            stem, extension = os.path.splitext(name)
+            return f'{stem}_renamed{extension}'
+
+        with mock.patch.object(FileSystemStorage, 'get_available_name', side_effect=available_name):
+            self.run_command()
+        names = set(ListingPhoto.objects.values_list('image', flat=True))
+        self.assertEqual(len(names), 2)
+        self.assertTrue(all(os.path.splitext(name)[0].endswith('_renamed') for name in names))
+        self.assertEqual(sorted(names), self.stored_files())
+        self.assertLessEqual(set(Listing.objects.values_list('photo_main', flat=True)), names)
+
+
+class PhotoVariantTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(MEDIA_ROOT=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        owner = User.objects.create_user('owner')
+        self.large = make_listing(owner, photo_main=self.photo('photos/large.jpg', (1600, 1200), 'JPEG'))
+        self.small = make_listing(owner, photo_main=self.photo('photos/small.png', (500, 300), 'PNG'))
+
+    def photo(self, name, size, pil_format):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, 'green').save(buffer, pil_format)
+        return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+    def build(self, **options):
+        output = io.StringIO()
+        call_command('build_photo_variants', workers=1, stdout=output, **options)
+        return output.getvalue()
+
+    def test_variants_per_width_and_format(self):
+        output = self.build()
+        self.assertIn('Обновлено объектов: 2', output)
+        for listing, widths in ((self.large, [320, 640, 1280]), (self.small, [320, 500])):
+            listing.refresh_from_db()
+            self.assertEqual(listing.photo_variants['source'], listing.photo_main.name)
+            for fmt, pil_format in (('webp', 'WEBP'), ('jpeg', 'JPEG')):
+                names = listing.photo_variants[fmt]
+                self.assertEqual(sorted(map(int, names)), widths)
+                for width, name in names.items():
+                    with default_storage.open(name) as f, Image.open(f) as image:
+                        self.assertEqual((image.format, image.width), (pil_format, int(width)))
+        srcset = self.large.photo_srcset
+        self.assertEqual(set(srcset), {'webp', 'jpeg'})
+        self.assertEqual(srcset['webp'], ', '.join(
+            f'/media/variants/photos/large_{width}.webp {width}w' for width in (320, 640, 1280)
+        ))
+
+    def test_up_to_date_skipped_unless_forced(self):
+        self.build()
+        self.assertEqual(list(PhotoVariantService.pending()), [])
+        self.assertIn('Обновлено объектов: 0', self.build())
+        self.assertEqual(len(list(PhotoVariantService.pending(force=True))), 2)
+        self.assertIn('Обновлено объектов: 2', self.build(force=True))
+        self.assertIn('Обновлено объектов: 1', self.build(force=True, listing_ids=[self.small.pk]))
+
+    def test_photo_replaced_during_processing(self):
+        replacement = self.photo('photos/replacement.jpg', (400, 300), 'JPEG')
+        read = PhotoVariantService.read
+
+        def read_and_replace(photo):
+            data = read(photo)
+            if photo == self.large.photo_main.name:
+                Listing.objects.filter(pk=self.large.pk).update(photo_main=replacement)
+            return data
+
+        with mock.patch.object(PhotoVariantService, 'read', side_effect=read_and_replace):
+            output = self.build()
+        self.assertIn('Обновлено объектов: 1', output)
+        self.assertIn('Фото сменилось во время обработки: 1', output)
+        self.large.refresh_from_db()
+        self.assertEqual(self.large.photo_variants, {})
+        self.assertEqual(self.large.photo_srcset, {})
+        self.assertEqual(list(PhotoVariantService.pending()), [(self.large.pk, replacement)])
+
+    def test_new_photo_built_after_commit(self):
+        self.build()
+        self.large.photo_main = self.photo('photos/new.jpg', (800, 600), 'JPEG')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.large.save()
+        self.large.refresh_from_db()
+        self.assertEqual(self.large.photo_variants['source'], 'photos/new.jpg')
+        self.assertEqual(sorted(map(int, self.large.photo_variants['webp'])), [320, 640, 800])
+
+
+class ScaleTestDataTests(TestCase):
+    options = {'listings': 30, 'bookings': 90, 'reviews': 20, 'batch_size': 12}
+
+    def generate(self, seed):
+        # Цены ночей такой пачки оставлены rebuild_nightly_rates
+        with self.assertLogs('listings.services', 'WARNING'), self.captureOnCommitCallbacks(execute=True):
+            call_command('create_test_data', seed=seed, stdout=io.StringIO(), **self.options)
+
+    def snapshot(self):
+        """Данные без id: при повторной генерации id новые, содержимое - то же"""
+        listings = list(Listing.objects.order_by('pk').values_list(
+            'owner__username', 'title', 'city', 'latitude', 'longitude', 'base_price', 'weekend_price',
+            'is_published', 'rating_count',
+        ))
+        bookings = list(Booking.objects.order_by('pk').values_list(
+            'listing__title', 'guest__username', 'check_in', 'check_out', 'total_price', 'status',
+        ))
+        closed = list(Availability.objects.order_by('pk').values_list('listing__title', 'date'))
+        reviews = list(Review.objects.order_by('pk').values_list('booking__check_in', 'reviewer__username', 'rating'))
+        return listings, bookings, closed, reviews
+
+    def test_seed_is_deterministic(self):
+        self.generate(seed=7)
+        first = self.snapshot()
+        Listing.objects.all().delete()
+        self.generate(seed=7)
+        self.assertEqual(self.snapshot(), first)
+        Listing.objects.all().delete()
+        self.generate(seed=8)
+        self.assertNotEqual(self.snapshot()[0], first[0])
+
+    def test_bookings_and_availability_consistent(self):
+        self.generate(seed=7)
+        today = date.today()
+        self.assertEqual((Listing.objects.count(), Booking.objects.count(), Review.objects.count()), (30, 90, 20))
+        self.assertEqual(CalendarBitmap.objects.count(), 30)
+        for listing in Listing.objects.all():
+            stays = list(listing.bookings.order_by('check_in'))
+            for previous, stay in zip(stays, stays[1:]):
+                self.assertLessEqual(previous.check_out, stay.check_in)
+            for stay in stays:
+                self.assertEqual(stay.total_price, PricingService.calculate_total_price(
+                    listing, stay.check_in, stay.check_out,
+                ).quantize(Decimal('0.01')))
+                self.assertLessEqual(stay.guests_count, listing.max_guests)
+                if stay.status in Booking.ACTIVE_STATUSES and stay.check_out > today:
+                    check_in = max(stay.check_in, today)
+                    self.assertIs(CalendarIndexService.is_free(listing.pk, check_in, stay.check_out), False)
+            for day in listing.availabilities.filter(is_available=False).values_list('date', flat=True):
+                self.assertIs(CalendarIndexService.is_free(listing.pk, day, day + timedelta(days=1)), False)
+            self.assertEqual(listing.rating_count, listing.reviews.count())
+        for review in Review.objects.select_related('booking'):
+            self.assertEqual(review.booking.status, 'completed')
+            self.assertEqual((review.listing_id, review.reviewer_id), (review.booking.listing_id, review.booking.guest_id))
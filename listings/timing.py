@@ -0,0 +1,93 @@
+# listings/timing.py
+"""
+Замеры одного запроса: число и время SQL запросов и именованные участки (view, serialize, render)
+
+RequestTimings заполняет ServerTimingMiddleware (listings.middleware); код, который
+выполняется внутри запроса, отмечает свои участки через timed(), не завися от middleware.
+"""
+import heapq
+import time
+from contextvars import ContextVar
+
+# Замеры текущего запроса; None - запрос не замеряется
+current_timings = ContextVar('listings_request_timings', default=None)
+SPAN_ORDER = {'view': 0, 'serialize': 1, 'render': 2}
+
+
+class RequestTimings:
+    def __init__(self, slowest=3):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql = 0.0
+        self.slowest = []  # куча (секунды, sql) длиной не больше slowest_limit
+        self.slowest_limit = slowest
+        self.spans = {}
+        self.open_spans = set()
+        self.view_started = None
+
+    def add_span(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.sql += elapsed
+            if self.slowest_limit:
+                item = (elapsed, sql)
+                if len(self.slowest) < self.slowest_limit:
+                    heapq.heappush(self.slowest, item)
+                elif elapsed > self.slowest[0][0]:
+                    heapq.heapreplace(self.slowest, item)
+
+    def server_timing(self, total):
+        parts = [f'sql;dur={self.sql * 1000:.1f};desc="SQL: {self.queries}"']
+        # view включает serialize; render идет после view
+        names = sorted(self.spans, key=lambda name: SPAN_ORDER.get(name, len(SPAN_ORDER)))
+        parts += [f'{name};dur={self.spans[name] * 1000:.1f}' for name in names]
+        parts.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(parts)
+
+    def as_log(self, request, response, total):
+        return {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 2),
+            **{f'{name}_ms': round(seconds * 1000, 2) for name, seconds in self.spans.items()},
+            'sql_ms': round(self.sql * 1000, 2),
+            'queries': self.queries,
+            'slowest': [
+                {'ms': round(seconds * 1000, 2), 'sql': sql[:500]}
+                for seconds, sql in sorted(self.slowest, reverse=True)
+            ],
+        }
+
+
+class timed:
+    """Участок запроса (например, timed('serialize')): время суммируется в Server-Timing.
+
+    Вложенные участки с тем же именем не считаются дважды; вне замеряемого запроса
+    стоимость - одно чтение ContextVar.
+    """
+    __slots__ = ('name', 'timings', 'started')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        timings = current_timings.get()
+        if timings is None or self.name in timings.open_spans:
+            self.timings = None
+            return
+        timings.open_spans.add(self.name)
+        self.timings = timings
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc):
+        if self.timings is not None:
+            self.timings.add_span(self.name, time.perf_counter() - self.started)
+            self.timings.open_spans.discard(self.name)
@@ -1,5 +1,13 @@
 # listings/views.py
-from django.shortcuts import render, get_object_or_404
+import hmac
+
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.http import HttpResponse, HttpResponseForbidden
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.template.response import TemplateResponse
+from .metrics import registry
 from .models import Listing
 
 def index(request):
@@ -9,7 +17,7 @@ def index(request):
     context = {
         'listings': listings
     }
-    return render(request, 'listings/listings.html', context)
+    return TemplateResponse(request, 'listings/listings.html', context)
 
 def listing(request, listing_id):
     # Получаем конкретное объявление или ошибку 404
@@ -18,4 +26,17 @@ def listing(request, listing_id):
     context = {
         'listing': listing
     }
-    return render(request, 'listings/listing.html', context)
\ No newline at end of file
+    return TemplateResponse(request, 'listings/listing.html', context)
+
+def metrics(request):
+    # Метрики Prometheus: сотрудникам (сессия админки) или сборщику с LISTINGS_METRICS_TOKEN
+    token = getattr(settings, 'LISTINGS_METRICS_TOKEN', None)
+    authorization = request.headers.get('Authorization', '')
+    if authorization.startswith('Bearer '):
+        if not token or not hmac.compare_digest(authorization[len('Bearer '):], token):
+            return HttpResponseForbidden()
+    elif not (request.user.is_active and request.user.is_staff):
+        return redirect_to_login(request.get_full_path(), reverse('admin:login'))
+    response = HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+    response['Cache-Control'] = 'no-store'
+    return response